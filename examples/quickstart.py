@@ -31,7 +31,7 @@ class Emulator(mpcpy.Emulator):
     """
     def simulate(self, starttime, stoptime, input):
         dt = 1
-        time = np.arange(starttime, stoptime+dt, dt, dtype=np.float)
+        time = np.arange(starttime, stoptime+dt, dt, dtype=float)
 
         # initialize
         x = np.ones_like(time)*self.res['x'][-1]
@@ -48,7 +48,7 @@ class Emulator(mpcpy.Emulator):
     """
     def simulate(self, starttime, stoptime, input):
         dt = 60
-        time = np.arange(starttime, stoptime+dt, dt, dtype=np.float)
+        time = np.arange(starttime, stoptime+dt, dt, dtype=float)
 
         # initialize
         T_em = np.ones_like(time)*self.res['T_em'][-1]
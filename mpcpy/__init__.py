@@ -1,10 +1,72 @@
 from .__version__ import version as __version__
 
-__all__ = ['disturbances.py', 'control', 'emulator', 'mpc', 'prediction', 'stateestimation']
-
-from .disturbances import Disturbances
-from .control import *
-from .emulator import *
-from .mpc import MPC
-from .prediction import Prediction
-from .stateestimation import Stateestimation
+# submodules are only imported when one of their objects is first accessed (PEP 562)
+_objects = {
+    'Disturbances': 'disturbances',
+    'Control': 'control',
+    'ParallelControl': 'control',
+    'SamplingControl': 'control',
+    'cplex_infeasibilityanalysis': 'control',
+    'save_formulations': 'control',
+    'load_formulations': 'control',
+    'clear_formulations': 'control',
+    'Emulator': 'emulator',
+    'OdeEmulator': 'emulator',
+    'DympyEmulator': 'emulator',
+    'SimulationCache': 'emulator',
+    'interp_averaged': 'emulator',
+    'MPC': 'mpc',
+    'Prediction': 'prediction',
+    'OnlinePrediction': 'prediction',
+    'RLSPrediction': 'prediction',
+    'ExponentialSmoothingPrediction': 'prediction',
+    'SeasonalNaivePrediction': 'prediction',
+    'Stateestimation': 'stateestimation',
+    'LazyResults': 'results',
+    'ResultSink': 'results',
+    'NpzSink': 'results',
+    'HDF5Sink': 'results',
+    'MultiResolutionSink': 'results',
+    'Performance': 'performance',
+    'SharedDisturbances': 'parallel',
+    'MonteCarlo': 'parallel',
+    'EmulatorPool': 'parallel',
+    'PoolEmulator': 'parallel',
+    'RealtimeMPC': 'realtime',
+    'Measurements': 'realtime',
+    'MonotonicClock': 'realtime',
+    'SimulatedClock': 'realtime',
+    'Sensitivity': 'sensitivity',
+    'Identification': 'identification',
+    'read_csv': 'loaders',
+    'read_epw': 'loaders',
+    'MemoryProfiler': 'profiling',
+    'ScenarioTree': 'scenariotree',
+    'DirectoryQueue': 'distributed',
+    'QueueServer': 'distributed',
+    'QueueClient': 'distributed',
+    'Worker': 'distributed',
+}
+
+_submodules = ['disturbances', 'control', 'emulator', 'mpc', 'prediction', 'stateestimation', 'results',
+               'performance', 'parallel', 'realtime',
+               'sensitivity', 'identification', 'loaders',
+               'profiling', 'scenariotree', 'distributed']
+
+__all__ = list(_objects.keys())
+
+
+def __getattr__(name):
+    import importlib
+
+    if name in _objects:
+        value = getattr(importlib.import_module('.' + _objects[name], __name__), name)
+        globals()[name] = value
+        return value
+    elif name in _submodules:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__ + _submodules)
@@ -17,9 +17,18 @@
 #    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
 
-import sys
+import copy
+import pickle
+import contextlib
+import time as _time
 import numpy as np
 
+from .disturbances import interp_zoh
+
+
+# attributes set by formulation methods, shared between control objects with the same formulation key
+_formulations = {}
+
 class Control(object):
     """
     Base class for defining the control for an mpc simulation
@@ -28,9 +37,16 @@ class Control(object):
     child class to generate control signals over the control horizon
     
     """
+
+    # an mpcpy.MemoryProfiler, set by the MPC object
+    profiler = None
+
+    # names of formulation attributes which are shared by reference instead of copied, see formulationkey
+    sharedattributes = ()
     
     def __init__(self, stateestimation, prediction,
-                 parameters=None, horizon=None, timestep=None, receding=None, savesolutions=0):
+                 parameters=None, horizon=None, timestep=None, receding=None, savesolutions=0,
+                 fallback=False, solvetimelimit=None, timegrid=None, blocking=None):
         """
         Initializes the control object
         
@@ -48,10 +64,13 @@ class Control(object):
             Dictionary specifying control parameters.
             
         horizon : number
-            The length of the control horizon.
+            The length of the control horizon. Can be omitted when a
+            :code:`timegrid` or :code:`blocking` is supplied.
             
         timestep : number
-            The length of the control timestep.
+            The length of the control timestep. Can be omitted when a
+            :code:`timegrid` or :code:`blocking` is supplied, it then defaults
+            to the first timestep.
             
         receding : number
             The receding time, i.e. the time between subsequent calls to
@@ -60,12 +79,53 @@ class Control(object):
         savesolutions : int
             Number of control solutions to be saved in the control object. Set 
             to -1 to save all solutions.
+
+        fallback : boolean, optional
+            When True, errors raised by the :code:`solution` method are caught
+            and the last solution, shifted to the new starttime, is returned
+            instead. The first solution is never replaced.
+
+        solvetimelimit : number, optional
+            Wall-clock time in seconds after which the shifted last solution is
+            returned when the :code:`solution` method has not finished. The
+            solution method is then run in a separate thread and no new
+            solution is started until the running one has finished.
+
+        timegrid : np.array, optional
+            Time vector of the control horizon relative to the starttime,
+            starting at 0. Allows non-uniform timesteps.
+
+        blocking : list of tuples, optional
+            List of (duration, timestep) tuples defining a non-uniform time
+            grid, e.g. :code:`[(6*3600., 900.), (18*3600., 3600.)]` for 15
+            minute steps during the first 6 hours and hourly steps afterwards.
+
+        Examples
+        --------
+        >>> control = Control(stateestimation, prediction, blocking=[(6*3600., 900.), (18*3600., 3600.)])
+        >>> control.time(0.)
             
         """
         
         self.stateestimation = stateestimation
         self.prediction = prediction
         
+        if blocking is not None:
+            timegrid = [0.]
+            for duration, step in blocking:
+                n = int(np.floor(duration/step + 0.01))
+                timegrid = np.concatenate((timegrid, timegrid[-1] + step*np.arange(1, n+1)))
+
+        self._timegrid = None
+        if timegrid is not None:
+            self._timegrid = np.array(timegrid, dtype=float)
+            if self._timegrid[0] != 0 or np.any(np.diff(self._timegrid) <= 0):
+                raise Exception('timegrid must start at 0 and be strictly increasing')
+            if horizon is None:
+                horizon = self._timegrid[-1]
+            if timestep is None:
+                timestep = self._timegrid[1]-self._timegrid[0]
+
         if horizon is None:
             raise Exception('horizon parameter must be supplied')
         else:    
@@ -75,6 +135,7 @@ class Control(object):
             raise Exception('timestep parameter must be supplied')
         else:    
             self.timestep = timestep        
+        self._timegridkey = (self.horizon, self.timestep)
         
         self.receding = receding
         if self.receding is None:
@@ -86,12 +147,26 @@ class Control(object):
         
         self.savesolutions = savesolutions
         self.solutions = []
+
+        self.fallback = fallback
+        self.solvetimelimit = solvetimelimit
+        self.statistics = {'solutions': 0, 'fallbacks': 0, 'failures': 0, 'timeouts': 0, 'solvetime': 0.}
         
         self._formulated = False
+        self._lastsolution = None
+        self._executor = None
+        self._pending = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_executor'] = None
+        state['_pending'] = None
+        return state
 
     def time(self,starttime):
         """
         Returns a time vector over the control horizon with the defined timestep
+        or time grid
         
         Parameters
         ----------
@@ -99,7 +174,14 @@ class Control(object):
             Time at the beginning of the control horizon.
             
         """
-        return np.arange(starttime, starttime+self.horizon+0.01*self.timestep, self.timestep, dtype=np.float)
+
+        # the relative time grid is computed once and rebuilt when the horizon or timestep are changed
+        if self._timegrid is None or self._timegridkey != (self.horizon, self.timestep):
+            n = int(np.floor(self.horizon/self.timestep + 0.01))
+            self._timegrid = self.timestep*np.arange(n+1, dtype=float)
+            self._timegridkey = (self.horizon, self.timestep)
+
+        return starttime + self._timegrid
 
     def formulation(self):
         """
@@ -114,7 +196,79 @@ class Control(object):
         
         """
         pass
-        
+
+    def formulationkey(self):
+        """
+        Returns a hashable key identifying the structure of the formulation.
+
+        Can be redefined in a child class to share the attributes set by the
+        :code:`formulation` method between control objects of the same class
+        with the same key, e.g. the structural parameters of the model. The
+        formulation is then only run for the first of these objects, the
+        others receive a deep copy of its attributes, except for the
+        attributes named in :code:`sharedattributes`, which are shared by
+        reference and must not be modified. The :code:`parameters`,
+        :code:`stateestimation` and :code:`prediction` attributes are never
+        shared. Returns None by default, which disables sharing.
+
+        The key must include all parameters of which the values are stored in
+        the formulation, unless they are set by :code:`updateformulation`.
+
+        Examples
+        --------
+        >>> class MyControl(Control):
+        ...     sharedattributes = ('matrices',)
+        ...     def formulationkey(self):
+        ...         return (self.parameters['zones'], self.horizon, self.timestep)
+        ...     def updateformulation(self, parameters):
+        ...         self.ocp.UA.value = parameters['UA']
+
+        """
+        return None
+
+    def updateformulation(self, parameters):
+        """
+        Can be redefined in a child class to set the parameter values in the
+        formulation, e.g. mutable pyomo parameters. Called after the
+        :code:`formulation` method or after the shared formulation is copied.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters of this control object.
+
+        """
+        pass
+
+    def _formulate(self):
+        key = self.formulationkey()
+        if key is not None:
+            key = (type(self).__module__, type(self).__name__, key)
+            if key in _formulations:
+                attributes = _formulations[key]
+                # the memo makes the deep copy share the read only attributes
+                memo = {id(attributes[name]): attributes[name] for name in self.sharedattributes if name in attributes}
+                self.__dict__.update(copy.deepcopy(attributes, memo))
+                self.updateformulation(self.parameters)
+                return
+
+        before = dict(self.__dict__)
+        tempsolution = self.formulation()
+        if tempsolution != None:
+            print('Warning: returning a solution function from the "formulation" method is depreciated. Overwrite the "solution" method instead.')
+            self.solution = tempsolution
+
+        if key is not None:
+            attributes = {}
+            for name, value in self.__dict__.items():
+                if name in ['parameters', 'stateestimation', 'prediction']:
+                    continue
+                if not name in before or value is not before[name]:
+                    attributes[name] = value
+            memo = {id(attributes[name]): attributes[name] for name in self.sharedattributes if name in attributes}
+            _formulations[key] = copy.deepcopy(attributes, memo)
+
+        self.updateformulation(self.parameters)
         
     def solution(self,state,prediction):
         """
@@ -140,6 +294,103 @@ class Control(object):
         """
         sol = {}
         return sol
+
+    def fallbacksolution(self, starttime):
+        """
+        Returns the last solution shifted to a new starttime.
+
+        The values of the last solution are held (zero order hold) on the time
+        vector starting at :code:`starttime`, the last values are repeated after
+        the end of the last solution.
+
+        Parameters
+        ----------
+        starttime : real
+            Time at the beginning of the control horizon.
+
+        Returns
+        -------
+        dict
+            Dictionary with the shifted solution.
+
+        """
+
+        if self._lastsolution is None:
+            raise Exception('No solution available to fall back on')
+
+        last = self._lastsolution
+        time = self.time(starttime)
+
+        solution = {'time': time}
+        for key in last:
+            if key == 'time':
+                continue
+            value = np.asarray(last[key])
+            if value.ndim == 0 or len(value) > len(last['time']):
+                # not a time series
+                solution[key] = last[key]
+            else:
+                # time series can be shorter than the time vector, e.g. inputs defined over intervals
+                offset = len(last['time'])-len(value)
+                solution[key] = interp_zoh(time[:len(time)-offset], last['time'], value)
+
+        return solution
+
+    def _solve(self, starttime, state, prediction):
+        """
+        Calls the :code:`solution` method and falls back on the last solution
+        when it fails or exceeds the solve time limit.
+
+        """
+
+        if self._lastsolution is None:
+            timeout = None
+        else:
+            timeout = self.solvetimelimit
+
+        if self._pending is not None:
+            if not self._pending.done():
+                # the previous solution has not finished yet
+                self.statistics['timeouts'] += 1
+                self.statistics['fallbacks'] += 1
+                return self.fallbacksolution(starttime)
+            # harvest the solution which finished after the time limit
+            self._harvest(starttime)
+
+        # imported here to keep importing mpcpy fast
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        t0 = _time.time()
+        try:
+            if self.solvetimelimit is None:
+                solution = self.solution(state, prediction)
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                pending = self._executor.submit(self.solution, state, prediction)
+                wait([pending], timeout=timeout)
+                if not pending.done():
+                    print('Warning: solution time limit exceeded at time {}, using the last solution'.format(starttime))
+                    self._pending = pending
+                    self.statistics['timeouts'] += 1
+                    self.statistics['fallbacks'] += 1
+                    return self.fallbacksolution(starttime)
+                solution = pending.result()
+
+        except Exception as e:
+            if not self.fallback or self._lastsolution is None:
+                raise
+            print('Warning: error "{}" in the solution at time {}, using the last solution'.format(e, starttime))
+            self.statistics['failures'] += 1
+            self.statistics['fallbacks'] += 1
+            return self.fallbacksolution(starttime)
+
+        finally:
+            self.statistics['solvetime'] += _time.time()-t0
+
+        self.statistics['solutions'] += 1
+        self._lastsolution = solution
+        return solution
         
     
     def __call__(self,starttime):
@@ -161,21 +412,49 @@ class Control(object):
         
         # get the state and the predictions
         state = self.stateestimation(starttime)
-        prediction = self.prediction(self.time(starttime))
+        with self._phase('prediction'):
+            prediction = self.prediction(self.time(starttime))
         
         # formulate the ocp during the first call
         if not self._formulated:
-            tempsolution = self.formulation()
-            if tempsolution != None:
-                print('Warning: returning a solution function from the "formulation" method is depreciated. Overwrite the "solution" method instead.')
-                self.solution = tempsolution
-
+            self._formulate()
             self._formulated = True
         
         # solve the ocp    
-        solution = self.solution(state,prediction)    
+        with self._phase('solution'):
+            solution = self._solve(starttime, state, prediction)
 
-        
+        self._save_solution(solution)
+                
+        return solution
+
+    def _harvest(self, starttime):
+        """
+        Stores the result of a solution which finished after the time limit as
+        the last solution.
+
+        """
+
+        pending = self._pending
+        self._pending = None
+        try:
+            solution = pending.result()
+        except Exception as e:
+            if not self.fallback:
+                raise
+            print('Warning: error "{}" in a solution finished after the time limit, detected at time {}'.format(
+                e, starttime))
+            self.statistics['failures'] += 1
+            return
+        self.statistics['solutions'] += 1
+        self._lastsolution = solution
+
+    def _phase(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+
+    def _save_solution(self, solution):
         if self.savesolutions == -1:
             # save all solutions
             self.solutions.append(solution)
@@ -185,10 +464,453 @@ class Control(object):
             self.solutions.append(solution)
             if len(self.solutions) > self.savesolutions:
                 self.solutions.pop(0)
-                
+
+
+class ParallelControl(Control):
+    """
+    Control composed of several control objects, for instance one per zone,
+    which are solved concurrently every receding step.
+
+    The solutions of all controls are merged into a single solution dictionary.
+    Shared resources can be handled by redefining the :code:`coordination`
+    method in a child class.
+
+    """
+
+    def __init__(self, controls, executor=None, maxiterations=1, parameters=None, receding=None, savesolutions=0):
+        """
+        Parameters
+        ----------
+        controls : list of mpcpy.Control
+            The control objects to solve. All controls must return solutions
+            on the same time grid and with different keys.
+
+        executor : concurrent.futures.Executor, optional
+            The executor used to solve the controls. When not supplied, a
+            thread pool with a thread per control is used. When a process pool
+            is used the controls must be picklable and are copied to the worker
+            processes every step, the solver state of the copies, the last
+            solution, saved solutions, parameters and statistics, is copied
+            back, as are the formulation attributes after the first step.
+
+        maxiterations : int, optional
+            Maximum number of times the controls are solved per step when the
+            :code:`coordination` method returns parameter updates.
+
+        parameters : dict, optional
+            Dictionary with coordination parameters.
+
+        receding : number, optional
+            The receding time, defaults to the receding time of the first
+            control.
+
+        savesolutions : int
+            Number of merged solutions to be saved in the control object. Set
+            to -1 to save all solutions.
+
+        Examples
+        --------
+        >>> control = ParallelControl([control_zone1, control_zone2])
+        >>> mpc = MPC(emulator, control, disturbances)
+
+        """
+
+        self.controls = list(controls)
+        if receding is None:
+            receding = self.controls[0].receding
+
+        Control.__init__(self, None, None, parameters=parameters, horizon=self.controls[0].horizon,
+                         timestep=self.controls[0].timestep, receding=receding, savesolutions=savesolutions)
+
+        self.executor = executor
+        self.maxiterations = maxiterations
+
+    def time(self, starttime):
+        """
+        Returns the time vector of the first control.
+
+        Parameters
+        ----------
+        starttime : real
+            Time at the beginning of the control horizon.
+
+        """
+        return self.controls[0].time(starttime)
+
+    def coordination(self, starttime, solutions, iteration):
+        """
+        Can be redefined in a child class to coordinate the controls, for
+        instance through dual decomposition of a shared heat pump capacity.
+
+        Parameters
+        ----------
+        starttime : real
+            Time at the beginning of the control horizon.
+
+        solutions : list of dict
+            The solutions of all controls in the last iteration.
+
+        iteration : int
+            The number of the current iteration, starting at 1.
+
+        Returns
+        -------
+        list or None
+            None when the solutions are accepted or a list with a parameter
+            dictionary or None for each control. The parameters of the controls
+            are updated with these dictionaries before they are solved again.
+
+        """
+        return None
+
+    def merge(self, solutions):
+        """
+        Merges the solutions of all controls into a single dictionary.
+
+        Parameters
+        ----------
+        solutions : list of dict
+            The solutions of all controls.
+
+        """
+
+        solution = {'time': solutions[0]['time']}
+        for sol in solutions:
+            if len(sol['time']) != len(solution['time']) or np.any(sol['time'] != solution['time']):
+                raise Exception('All controls must return a solution on the same time grid')
+            for key in sol:
+                if key != 'time':
+                    if key in solution:
+                        raise Exception('Key {} is returned by more than one control'.format(key))
+                    solution[key] = sol[key]
         return solution
+
+    def _solvecontrols(self, starttime):
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=len(self.controls))
+
+        futures = [self.executor.submit(_solve_control, control, starttime) for control in self.controls]
+        solutions = []
+        for control, future in zip(self.controls, futures):
+            solution, state = future.result()
+            # a control solved in another process is a copy, its solver state is merged back into the original
+            # control, which keeps referring to the actual emulator for the state estimation
+            control.__dict__.update(state)
+            solutions.append(solution)
+        return solutions
+
+    def __call__(self, starttime):
+        """
+        Solves all controls and returns the merged solution.
+
+        Parameters
+        ----------
+        starttime : real
+            Time at the beginning of the control horizon.
+
+        """
+
+        solutions = self._solvecontrols(starttime)
+        for iteration in range(1, self.maxiterations):
+            updates = self.coordination(starttime, solutions, iteration)
+            if updates is None:
+                break
+            for control, update in zip(self.controls, updates):
+                if update is not None:
+                    control.parameters.update(update)
+            solutions = self._solvecontrols(starttime)
+
+        solution = self.merge(solutions)
+        self._save_solution(solution)
+
+        return solution
+
+
+class SamplingControl(Control):
+    """
+    Gradient free control which samples input trajectories around the previous
+    plan and averages them weighted by their cost, following the model
+    predictive path integral (MPPI) method.
+
+    All samples are simulated at once by the :code:`rollout` method, which must
+    work on arrays with the samples on the first axis, and rated by the
+    :code:`cost` method. Both can be supplied as functions or redefined in a
+    child class. The mean of the samples is the last solution shifted to the
+    new starttime, so the plan is refined over subsequent calls.
+
+    The inputs are defined over the intervals of the time vector, an input
+    array has one value less than the time vector.
+
+    """
+
+    def __init__(self, stateestimation, prediction, inputs, rollout=None, cost=None, samples=1000, noise=None,
+                 temperature=1., iterations=1, initial=None, seed=None, parameters=None, horizon=None,
+                 timestep=None, receding=None, savesolutions=0, fallback=False, solvetimelimit=None,
+                 timegrid=None, blocking=None):
+        """
+        Parameters
+        ----------
+        stateestimation : mpcpy.Stateestimation
+            The object used to determine the state at the beginning of the
+            control horizon.
+
+        prediction : mpcpy.Prediction object
+            The object used to determine the predictions over the control
+            horizon.
+
+        inputs : dict
+            Dictionary with the input names as keys and a tuple of the lower
+            and upper bound as values, None for an unbounded input.
+
+        rollout : function, optional
+            Function with the same arguments as the :code:`rollout` method.
+
+        cost : function, optional
+            Function with the same arguments as the :code:`cost` method.
+
+        samples : int, optional
+            Number of sampled input trajectories per iteration.
+
+        noise : dict, optional
+            Standard deviation of the sampled inputs around the mean, defaults
+            to a tenth of the range between the bounds or 1 for unbounded
+            inputs.
+
+        temperature : number, optional
+            Scale of the cost differences in the exponential weights, lower
+            values give more weight to the best samples.
+
+        iterations : int, optional
+            Number of times the samples are drawn around the updated mean per
+            call.
+
+        initial : dict, optional
+            Value of each input in the first mean, defaults to the center of
+            the bounds or 0 for unbounded inputs.
+
+        seed : int, optional
+            Seed of the sampling.
+
+        parameters, horizon, timestep, receding, savesolutions, fallback, solvetimelimit, timegrid, blocking :
+            See :code:`mpcpy.Control`.
+
+        Examples
+        --------
+        >>> def rollout(state, prediction, inputs):
+        ...     T = np.zeros((len(inputs['Q_flow_hp']), len(prediction['time'])))
+        ...     T[:, 0] = state['T_in']
+        ...     dt = np.diff(prediction['time'])
+        ...     for i in range(len(dt)):
+        ...         T[:, i+1] = T[:, i] + dt[i]*(inputs['Q_flow_hp'][:, i] - 200.*(T[:, i]-prediction['T_am'][i]))/5e6
+        ...     return {'T_in': T}
+        >>> def cost(prediction, inputs, trajectories):
+        ...     return np.sum((trajectories['T_in']-293.15)**2, axis=1) + 1e-4*np.sum(inputs['Q_flow_hp'], axis=1)
+        >>> control = SamplingControl(stateestimation, prediction, {'Q_flow_hp': (0., 10000.)}, rollout, cost,
+        ...                           samples=2000, horizon=24*3600., timestep=900.)
+
+        """
+
+        Control.__init__(self, stateestimation, prediction, parameters=parameters, horizon=horizon,
+                         timestep=timestep, receding=receding, savesolutions=savesolutions, fallback=fallback,
+                         solvetimelimit=solvetimelimit, timegrid=timegrid, blocking=blocking)
+
+        if rollout is not None:
+            self.rollout = rollout
+        if cost is not None:
+            self.cost = cost
+
+        self.inputs = list(inputs.keys())
+        self.lower = {}
+        self.upper = {}
+        for key in self.inputs:
+            lower, upper = inputs[key]
+            self.lower[key] = -np.inf if lower is None else float(lower)
+            self.upper[key] = np.inf if upper is None else float(upper)
+
+        self.noise = {}
+        self.initial = {}
+        for key in self.inputs:
+            bounded = np.isfinite(self.lower[key]) and np.isfinite(self.upper[key])
+            self.noise[key] = 0.1*(self.upper[key]-self.lower[key]) if bounded else 1.
+            self.initial[key] = 0.5*(self.lower[key]+self.upper[key]) if bounded else \
+                float(np.clip(0., self.lower[key], self.upper[key]))
+        if noise is not None:
+            self.noise.update(noise)
+        if initial is not None:
+            self.initial.update(initial)
+
+        self.samples = samples
+        self.temperature = temperature
+        self.iterations = iterations
+        self._rng = np.random.default_rng(seed)
+
+    def rollout(self, state, prediction, inputs):
+        """
+        Redefine in a child class when no rollout function is supplied.
+
+        Parameters
+        ----------
+        state : dict
+            Dictionary with the states at the start of the control horizon.
+
+        prediction : dict
+            Dictionary with the predictions over the control horizon.
+
+        inputs : dict
+            Dictionary with the sampled inputs with shape (number of samples,
+            number of time steps - 1).
+
+        Returns
+        -------
+        dict
+            Dictionary with the simulated trajectories of all samples.
+
+        """
+
+        raise NotImplementedError('the rollout method must be redefined or a rollout function supplied')
+
+    def cost(self, prediction, inputs, trajectories):
+        """
+        Redefine in a child class when no cost function is supplied.
+
+        Parameters
+        ----------
+        prediction : dict
+            Dictionary with the predictions over the control horizon.
+
+        inputs : dict
+            Dictionary with the sampled inputs.
+
+        trajectories : dict
+            Dictionary with the trajectories returned by :code:`rollout`.
+
+        Returns
+        -------
+        np.array
+            The cost of each sample.
+
+        """
+
+        raise NotImplementedError('the cost method must be redefined or a cost function supplied')
+
+    def _mean(self, time):
+        n = len(time)-1
+        if self._lastsolution is None:
+            return {key: np.full(n, self.initial[key]) for key in self.inputs}
+        last = self.fallbacksolution(time[0])
+        return {key: np.asarray(last[key], dtype=float)[:n] for key in self.inputs}
+
+    def solution(self, state, prediction):
+        """
+        Returns the cost weighted mean of the sampled inputs, the trajectories
+        of a rollout of these inputs and its cost.
+
+        Parameters
+        ----------
+        state : dict
+            Dictionary with the states at the start of the control horizon.
+
+        prediction : dict
+            Dictionary with the predictions over the control horizon.
+
+        """
+
+        time = prediction['time']
+        mean = self._mean(time)
+        n = len(time)-1
+
+        for iteration in range(self.iterations):
+            inputs = {}
+            for key in self.inputs:
+                values = mean[key] + self.noise[key]*self._rng.standard_normal((self.samples, n))
+                # the first sample is the mean itself
+                values[0] = mean[key]
+                inputs[key] = np.clip(values, self.lower[key], self.upper[key])
+
+            cost = np.asarray(self.cost(prediction, inputs, self.rollout(state, prediction, inputs)), dtype=float)
+            cost[~np.isfinite(cost)] = np.inf
+            if np.all(np.isinf(cost)):
+                raise Exception('The cost of all samples is not finite')
+            weights = np.exp(-(cost-np.min(cost))/self.temperature)
+            weights = weights/np.sum(weights)
+
+            mean = {key: weights.dot(inputs[key]) for key in self.inputs}
+
+        inputs = {key: mean[key][np.newaxis, :] for key in self.inputs}
+        trajectories = self.rollout(state, prediction, inputs)
+
+        solution = {'time': time}
+        for key in trajectories:
+            solution[key] = np.asarray(trajectories[key])[0]
+        solution.update(mean)
+        solution['cost'] = float(np.asarray(self.cost(prediction, inputs, trajectories))[0])
+        return solution
+
+
+# control attributes changed by solving, returned from worker processes
+_solverstate = ['_lastsolution', 'solutions', 'parameters', 'statistics']
+
+
+def _solve_control(control, starttime):
+    formulated = control._formulated
+    solution = control(starttime)
+    if formulated:
+        state = {key: getattr(control, key) for key in _solverstate}
+    else:
+        # the formulation is returned once, so it is sent with the control and not run again in later steps
+        state = {key: value for key, value in control.__getstate__().items()
+                 if not key in ['stateestimation', 'prediction', '_executor', '_pending']}
+    return solution, state
         
         
+def save_formulations(filename):
+    """
+    Saves all shared formulations to a file, e.g. to load them in worker
+    processes. All formulation attributes must be picklable.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file.
+
+    """
+
+    with open(filename, 'wb') as f:
+        pickle.dump(_formulations, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_formulations(filename):
+    """
+    Adds shared formulations saved with :code:`save_formulations`.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file.
+
+    Examples
+    --------
+    >>> save_formulations('formulations.pickle')
+    >>> with Pool(initializer=load_formulations, initargs=('formulations.pickle',)) as pool:
+    ...     pool.map(run, parameters)
+
+    """
+
+    with open(filename, 'rb') as f:
+        _formulations.update(pickle.load(f))
+
+
+def clear_formulations():
+    """
+    Removes all shared formulations.
+
+    """
+
+    _formulations.clear()
+
+
 def cplex_infeasibilityanalysis(ocp):
     """
     Give information about infeasible constraints in cplex.
@@ -0,0 +1,573 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import time as _time
+import zlib
+import pickle
+import socket
+import struct
+import hmac
+import hashlib
+import threading
+import traceback
+import socketserver
+import numpy as np
+
+
+class DirectoryQueue(object):
+    """
+    A work queue of MPC simulation tasks stored in a directory, which can be
+    shared by workers on several machines through a network file system.
+
+    Every task is a file which moves between the 'pending', 'running', 'done'
+    and 'failed' subdirectories. A task is claimed by an atomic rename, so it
+    is run by a single worker. Tasks which fail are retried, tasks of which the
+    worker stopped sending heartbeats are returned to the queue.
+
+    """
+
+    def __init__(self, path, maxretries=3, timeout=3600.):
+        """
+        Parameters
+        ----------
+        path : string
+            The directory of the queue, created when it does not exist.
+
+        maxretries : int, optional
+            Maximum number of times a task is retried after it failed or timed
+            out.
+
+        timeout : number, optional
+            Time in seconds without heartbeat after which a running task is
+            returned to the queue.
+
+        Examples
+        --------
+        >>> queue = DirectoryQueue('/shared/study')
+        >>> ids = [queue.put({'UA_in_am': value}) for value in [100., 200., 300.]]
+        >>> # on every node
+        >>> Worker(DirectoryQueue('/shared/study'), factory).run()
+        >>> res = queue.result(ids[0])
+
+        """
+
+        self.path = path
+        self.maxretries = maxretries
+        self.timeout = timeout
+        for state in ['pending', 'running', 'done', 'failed']:
+            directory = os.path.join(path, state)
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+    def _filename(self, state, taskid):
+        extension = '.result' if state == 'done' else '.task'
+        return os.path.join(self.path, state, taskid + extension)
+
+    def _write(self, filename, data):
+        temp = '{}.{}.{}.tmp'.format(filename, socket.gethostname(), os.getpid())
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, filename)
+
+    def _read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def put(self, spec, taskid=None):
+        """
+        Adds a task. Pending, running or done tasks with the same id are not
+        added again, failed tasks are.
+
+        Parameters
+        ----------
+        spec : object
+            Picklable specification of the task, passed to the factory of the
+            worker.
+
+        taskid : string, optional
+            The id of the task, defaults to a hash of the specification.
+
+        Returns
+        -------
+        string
+            The id of the task.
+
+        """
+
+        data = pickle.dumps(spec, protocol=pickle.HIGHEST_PROTOCOL)
+        if taskid is None:
+            taskid = hashlib.blake2b(data, digest_size=16).hexdigest()
+        for state in ['pending', 'running', 'done']:
+            if os.path.exists(self._filename(state, taskid)):
+                return taskid
+        self._write(self._filename('pending', taskid), pickle.dumps({'spec': spec, 'attempts': 0}))
+        return taskid
+
+    def get(self):
+        """
+        Claims a pending task.
+
+        Returns
+        -------
+        tuple or None
+            The task id and specification, None when no task is pending.
+
+        """
+
+        self.requeue()
+        directory = os.path.join(self.path, 'pending')
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.task'):
+                continue
+            taskid = filename[:-5]
+            try:
+                # the file is touched before the rename, a claimed task never appears stale in 'running'
+                os.utime(os.path.join(directory, filename))
+                os.rename(os.path.join(directory, filename), self._filename('running', taskid))
+            except OSError:
+                # claimed by another worker
+                continue
+            task = pickle.loads(self._read(self._filename('running', taskid)))
+            return taskid, task['spec']
+        return None
+
+    def heartbeat(self, taskid):
+        """
+        Marks a running task as alive.
+
+        """
+
+        try:
+            os.utime(self._filename('running', taskid))
+        except OSError:
+            pass
+
+    def complete(self, taskid, data):
+        """
+        Stores the compressed result of a task.
+
+        Parameters
+        ----------
+        taskid : string
+            The id of the task.
+
+        data : bytes
+            The result, compressed with :code:`compress`.
+
+        """
+
+        self._write(self._filename('done', taskid), data)
+        try:
+            os.remove(self._filename('running', taskid))
+        except OSError:
+            pass
+
+    def fail(self, taskid, error=''):
+        """
+        Returns a failed task to the queue, or moves it to the failed tasks
+        when the maximum number of retries is reached.
+
+        """
+
+        filename = self._filename('running', taskid)
+        try:
+            task = pickle.loads(self._read(filename))
+        except (IOError, OSError):
+            return
+        task['attempts'] += 1
+        task['error'] = error
+        if task['attempts'] > self.maxretries:
+            self._write(self._filename('failed', taskid), pickle.dumps(task))
+        else:
+            self._write(self._filename('pending', taskid), pickle.dumps(task))
+        os.remove(filename)
+
+    def requeue(self):
+        """
+        Returns running tasks without recent heartbeat to the queue.
+
+        """
+
+        directory = os.path.join(self.path, 'running')
+        now = _time.time()
+        for filename in os.listdir(directory):
+            if not filename.endswith('.task'):
+                continue
+            try:
+                if now - os.stat(os.path.join(directory, filename)).st_mtime > self.timeout:
+                    self.fail(filename[:-5], 'timeout')
+            except OSError:
+                pass
+
+    def result(self, taskid):
+        """
+        Returns the result of a task or None when it is not done.
+
+        """
+
+        try:
+            return decompress(self._read(self._filename('done', taskid)))
+        except (IOError, OSError):
+            return None
+
+    def error(self, taskid):
+        """
+        Returns the error of a failed task or None.
+
+        """
+
+        try:
+            return pickle.loads(self._read(self._filename('failed', taskid)))['error']
+        except (IOError, OSError):
+            return None
+
+    def status(self):
+        """
+        Returns the number of tasks in each state.
+
+        """
+
+        status = {}
+        for state in ['pending', 'running', 'done', 'failed']:
+            status[state] = len([filename for filename in os.listdir(os.path.join(self.path, state))
+                                 if filename.endswith('.task') or filename.endswith('.result')])
+        return status
+
+
+class QueueServer(object):
+    """
+    Serves a queue over TCP to workers and clients on the same machine.
+
+    Requests are pickled, so every request and response is signed with a
+    shared key and requests are only unpickled after the signature is
+    verified. The server only accepts connections from the loopback
+    interface, use an ssh tunnel to reach it from other machines.
+
+    """
+
+    def __init__(self, queue, port=0, authkey=None):
+        """
+        Parameters
+        ----------
+        queue : DirectoryQueue
+            The served queue.
+
+        port : int, optional
+            The port, 0 selects a free port.
+
+        authkey : bytes, optional
+            The key shared with the clients, defaults to a random key which is
+            available as the :code:`authkey` attribute.
+
+        Examples
+        --------
+        >>> with QueueServer(DirectoryQueue('study')) as server:
+        ...     client = QueueClient(server.address, server.authkey)
+        ...     client.put({'UA_in_am': 200.})
+        ...     Worker(client, factory).run()
+
+        """
+
+        self.queue = queue
+        self.authkey = authkey
+        if self.authkey is None:
+            self.authkey = os.urandom(32)
+        self._lock = threading.Lock()
+        self._server = _TCPServer(('127.0.0.1', port), _Handler)
+        self._server.queue = queue
+        self._server.lock = self._lock
+        self._server.authkey = self.authkey
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stops the server.
+
+        """
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def verify_request(self, request, client_address):
+        return client_address[0] in ['127.0.0.1', '::1']
+
+
+_methods = ['put', 'get', 'heartbeat', 'complete', 'fail', 'result', 'error', 'status']
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        authkey = self.server.authkey
+        try:
+            method = _receive(self.rfile, 64)
+            payload = _receive(self.rfile)
+            signature = _receive(self.rfile, 64)
+        except Exception:
+            return
+        # the arguments are only unpickled for valid and signed requests
+        if not hmac.compare_digest(signature, _sign(authkey, method, payload)):
+            return
+        method = method.decode('utf-8', 'replace')
+        try:
+            if not method in _methods:
+                raise Exception('Unknown method {}'.format(method))
+            args = pickle.loads(payload)
+            with self.server.lock:
+                response = ('ok', getattr(self.server.queue, method)(*args))
+        except Exception:
+            response = ('error', traceback.format_exc())
+        payload = pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL)
+        _send(self.wfile, payload)
+        _send(self.wfile, _sign(authkey, b'', payload))
+
+
+class QueueClient(object):
+    """
+    Client of a :code:`QueueServer` with the same methods as a
+    :code:`DirectoryQueue`.
+
+    """
+
+    def __init__(self, address, authkey, timeout=60.):
+        """
+        Parameters
+        ----------
+        address : tuple
+            The host and port of the server.
+
+        authkey : bytes
+            The key of the server.
+
+        timeout : number, optional
+            Socket timeout in seconds.
+
+        """
+
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.timeout = timeout
+
+    def _request(self, method, *args):
+        method = method.encode('utf-8')
+        payload = pickle.dumps(args, protocol=pickle.HIGHEST_PROTOCOL)
+        with socket.create_connection(self.address, timeout=self.timeout) as connection:
+            f = connection.makefile('rwb')
+            _send(f, method)
+            _send(f, payload)
+            _send(f, _sign(self.authkey, method, payload))
+            try:
+                payload = _receive(f)
+                signature = _receive(f, 64)
+            except Exception:
+                raise Exception('The queue server closed the connection, check the authkey')
+        if not hmac.compare_digest(signature, _sign(self.authkey, b'', payload)):
+            raise Exception('Invalid signature of the queue server response')
+        status, result = pickle.loads(payload)
+        if status == 'error':
+            raise Exception('Error in the queue server:\n{}'.format(result))
+        return result
+
+    def put(self, spec, taskid=None):
+        return self._request('put', spec, taskid)
+
+    def get(self):
+        return self._request('get')
+
+    def heartbeat(self, taskid):
+        return self._request('heartbeat', taskid)
+
+    def complete(self, taskid, data):
+        return self._request('complete', taskid, data)
+
+    def fail(self, taskid, error=''):
+        return self._request('fail', taskid, error)
+
+    def result(self, taskid):
+        return self._request('result', taskid)
+
+    def error(self, taskid):
+        return self._request('error', taskid)
+
+    def status(self):
+        return self._request('status')
+
+
+def _send(f, data):
+    f.write(struct.pack('!Q', len(data)))
+    f.write(data)
+    f.flush()
+
+
+def _receive(f, maxsize=None):
+    header = f.read(8)
+    if len(header) < 8:
+        raise Exception('Connection closed')
+    size = struct.unpack('!Q', header)[0]
+    if maxsize is not None and size > maxsize:
+        raise Exception('Message too large')
+    data = f.read(size)
+    if len(data) < size:
+        raise Exception('Connection closed')
+    return data
+
+
+def _sign(authkey, method, payload):
+    return hmac.new(authkey, method + b'\0' + payload, hashlib.sha256).digest()
+
+
+def compress(res, keys=None, level=6):
+    """
+    Returns the compressed results of an MPC simulation.
+
+    Parameters
+    ----------
+    res : dict
+        The results.
+
+    keys : list of strings, optional
+        The keys to store, defaults to all keys.
+
+    level : int, optional
+        The zlib compression level.
+
+    """
+
+    if keys is None:
+        keys = list(res.keys())
+    data = {key: np.asarray(res[key]) for key in keys}
+    return zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), level)
+
+
+def decompress(data):
+    """
+    Returns results compressed with :code:`compress`.
+
+    """
+
+    return pickle.loads(zlib.decompress(data))
+
+
+class Worker(object):
+    """
+    Runs the MPC simulations of the tasks in a queue.
+
+    """
+
+    def __init__(self, queue, factory, keys=None, poll=1., heartbeat=60.):
+        """
+        Parameters
+        ----------
+        queue : DirectoryQueue or QueueClient
+            The queue.
+
+        factory : function
+            Function :code:`factory(spec)` returning an :code:`mpcpy.MPC`
+            object for a task specification.
+
+        keys : list of strings, optional
+            The result keys which are stored, defaults to all keys.
+
+        poll : number, optional
+            Time in seconds between checks for new tasks when the queue is
+            empty.
+
+        heartbeat : number, optional
+            Time in seconds between heartbeats of a running task, must be
+            smaller than the timeout of the queue.
+
+        Examples
+        --------
+        >>> def factory(spec):
+        ...     emulator = MyEmulator(inputs, parameters=dict(parameters, **spec))
+        ...     ...
+        ...     return MPC(emulator, control, disturbances)
+        >>> Worker(QueueClient(('127.0.0.1', 5000), authkey), factory, keys=['time', 'T_in']).run(wait=True)
+
+        """
+
+        self.queue = queue
+        self.factory = factory
+        self.keys = keys
+        self.poll = poll
+        self.heartbeat = heartbeat
+        self.statistics = {'completed': 0, 'failed': 0}
+
+    def run(self, maxtasks=None, wait=False):
+        """
+        Runs tasks.
+
+        Parameters
+        ----------
+        maxtasks : int, optional
+            Maximum number of tasks to run.
+
+        wait : boolean, optional
+            Wait for new tasks when the queue is empty instead of returning.
+
+        """
+
+        tasks = 0
+        while maxtasks is None or tasks < maxtasks:
+            task = self.queue.get()
+            if task is None:
+                if not wait:
+                    break
+                _time.sleep(self.poll)
+                continue
+
+            taskid, spec = task
+            tasks += 1
+            stop = threading.Event()
+            thread = threading.Thread(target=self._heartbeat, args=(taskid, stop), daemon=True)
+            thread.start()
+            try:
+                res = self.factory(spec)()
+                data = compress(res, self.keys)
+            except Exception:
+                stop.set()
+                thread.join()
+                self.queue.fail(taskid, traceback.format_exc())
+                self.statistics['failed'] += 1
+                continue
+            stop.set()
+            thread.join()
+            self.queue.complete(taskid, data)
+            self.statistics['completed'] += 1
+
+    def _heartbeat(self, taskid, stop):
+        while not stop.wait(self.heartbeat):
+            try:
+                self.queue.heartbeat(taskid)
+            except Exception:
+                pass
@@ -26,7 +26,7 @@ class Disturbances(object):
 
     """
     
-    def __init__(self, data, periodic=True, extra_time=7*24*3600., zoh_keys=None):
+    def __init__(self, data, periodic=True, extra_time=7*24*3600., zoh_keys=None, dtypes=None):
         """
         Create a disturbances object.
         
@@ -46,6 +46,11 @@ class Disturbances(object):
         zoh_keys : list of strings, optional
             Keys which will be interpolated with zero-order hold. All other
             values are interpolated linearly.
+
+        dtypes : dict, optional
+            Storage data type per key, e.g. :code:`{'T_amb': np.float32,
+            'occupancy': np.uint8}` to reduce memory. Values are converted to
+            float when interpolated. The time is always stored as float.
     
         Examples
         --------
@@ -72,13 +77,46 @@ class Disturbances(object):
             for key in data:
                 if key != 'time':
                     self.data[key] = np.concatenate((data[key][:-1], data[key][-1]*np.ones(len(ind))))
+
+        if not dtypes is None:
+            for key in dtypes:
+                if key != 'time':
+                    self.data[key] = self.data[key].astype(dtypes[key])
         
         if zoh_keys is None:
             self.zoh_keys = []
         else:
             self.zoh_keys = zoh_keys
 
-    def interp(self, key, time):
+    def weights(self, time):
+        """
+        Computes the indices and weights used to interpolate all keys to an
+        array of timesteps.
+
+        Parameters
+        ----------
+        time : number or np.array
+            An array of times to interpolate to.
+
+        Returns
+        -------
+        tuple
+            The indices of the data points before each time, the linear
+            interpolation weights of the next data points and the zero order
+            hold indices.
+
+        """
+
+        xp = self.data['time']
+        time = np.asarray(time, dtype=float)
+
+        zoh = np.clip(np.searchsorted(xp, time, side='right')-1, 0, len(xp)-1)
+        ind = np.minimum(zoh, len(xp)-2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.clip(np.nan_to_num((time-xp[ind])/(xp[ind+1]-xp[ind])), 0., 1.)
+        return ind, weight, zoh
+
+    def interp(self, key, time, weights=None):
         """
         Interpolate a value to an array of timesteps
         
@@ -89,27 +127,34 @@ class Disturbances(object):
             
         time : np.array
             An array of times to interpolate to.
+
+        weights : tuple, optional
+            Indices and weights returned by the :code:`weights` method for the
+            same time, to share them between keys.
             
         """
-        
-        if len(np.array(self.data[key]).shape) == 1:
-            if key in self.zoh_keys:
-                value = interp_zoh(time, self.data['time'], self.data[key])
-            else:
-                value = np.interp(time, self.data['time'], self.data[key])
-                
-        elif len(np.array(self.data[key]).shape) == 2:
-            # 2d boundary conditions support
-            value = np.zeros((len(time), self.data[key].shape[1]))
-            if key in self.zoh_keys:
-                for j in range(self.data[key].shape[1]):
-                    value[:, j] = interp_zoh(time, self.data['time'], self.data[key][:, j])
-            else:
-                for j in range(self.data[key].shape[1]):
-                    value[:, j] = np.interp(time, self.data['time'], self.data[key][:, j])
+
+        data = self.data[key]
+        if data.ndim == 1 and not key in self.zoh_keys:
+            return np.interp(time, self.data['time'], data)
+
+        # N-d boundary conditions and zero order hold use a single set of indices and weights for all columns
+        if weights is None:
+            weights = self.weights(time)
+        ind, weight, zoh = weights
+
+        if key in self.zoh_keys:
+            value = data[zoh].astype(float)
         else:
-                raise Exception('Only 1D or 2D data allowed as boundary conditions')
-                
+            weight = weight.reshape(weight.shape + (1,)*(data.ndim-1))
+            value = data[ind].astype(float, copy=False)
+            delta = data[ind+1]-value
+            delta *= weight
+            value += delta
+
+        if value.ndim == 0:
+            # a scalar time
+            value = value[()]
         return value
         
     def __call__(self, time):
@@ -128,9 +173,12 @@ class Disturbances(object):
             
         """
         
+        weights = None
         dst_int = {}
         for key in self.data:
-            dst_int[key] = self.interp(key, time)
+            if weights is None and (self.data[key].ndim > 1 or key in self.zoh_keys):
+                weights = self.weights(time)
+            dst_int[key] = self.interp(key, time, weights=weights)
             
         return dst_int
 
@@ -158,10 +206,12 @@ def interp_zoh(x, xp, fp):
         
     xp : np.array
         An array of independent variables where the values are known, must be
-        monotonic and increasing.
+        monotonic and increasing, need not be uniformly spaced.
         
     fp : np.array
-        The known values at points xp.
+        The known values at points xp, can be shorter than xp when values are
+        defined over intervals. The first and last values are held outside of
+        the range of xp.
         
     Returns
     -------
@@ -169,5 +219,6 @@ def interp_zoh(x, xp, fp):
         The interpolated values
     
     """
-    
-    return np.array([fp[int((len(xp)-1)*(xi-xp[0])/(xp[-1]-xp[0]))] for xi in x])
+
+    ind = np.clip(np.searchsorted(xp, x, side='right')-1, 0, len(fp)-1)
+    return np.asarray(fp)[ind]
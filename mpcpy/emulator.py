@@ -17,16 +17,26 @@
 #    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
 
+import os
+import copy
+import types
+import hashlib
 import numpy as np
 
 
+# compiled functions, shared by all OdeEmulator objects
+_kernels = {}
+
+
 class Emulator(object):
     """
     Base class for defining an emulator object
     
     """
+
+    cache = None
     
-    def __init__(self, input_keys, parameters=None, initial_conditions=None):
+    def __init__(self, input_keys, parameters=None, initial_conditions=None, cache=None):
         """
         Initializes the emulator object
         :code:`self.inputs` and :code:`self.res` attributes must be defined
@@ -46,9 +56,18 @@ class Emulator(object):
         initial_conditions : dict
             A dictionary of initial conditions of the system under
             consideration.
+
+        cache : SimulationCache or string, optional
+            A cache or the directory of a cache storing the results of the
+            :code:`simulate` method. Only valid when the results of
+            :code:`simulate` are determined by the parameters, the attributes,
+            the last sample of the results and the inputs.
         """
 
         self.inputs = input_keys
+        if isinstance(cache, str):
+            cache = SimulationCache(cache)
+        self.cache = cache
         self.initial_conditions = {}
         if not initial_conditions is None:
             # set only the last value for each key
@@ -135,7 +154,14 @@ class Emulator(object):
         
         """
         
-        res = self.simulate(time[0], time[-1], input)
+        if self.cache is None:
+            res = self.simulate(time[0], time[-1], input)
+        else:
+            key = self.cache.key(self, time[0], time[-1], input)
+            res = self.cache.get(key)
+            if res is None:
+                res = self.simulate(time[0], time[-1], input)
+                self.cache.put(key, res)
         
         # adding the inputs to the result
         for key in input.keys():
@@ -168,6 +194,97 @@ class Emulator(object):
                     self.res[key] = np.interp(time, res['time'], res[key])
         return self.res
 
+    def savestate(self):
+        """
+        Can be redefined in a child class to return the state which is not
+        contained in the last sample of the results, e.g. the memory of an
+        integrator. Returns None by default.
+
+        """
+
+        return None
+
+    def loadstate(self, state):
+        """
+        Can be redefined in a child class to set the state returned by
+        :code:`savestate`.
+
+        """
+
+        pass
+
+    def snapshot(self):
+        """
+        Returns the current state of the emulator.
+
+        Only the last sample of the results, the lengths of the results, the
+        parameters and the state returned by :code:`savestate` are stored.
+
+        Returns
+        -------
+        dict
+            The snapshot, which can be passed to :code:`restore`.
+
+        Examples
+        --------
+        >>> snapshot = emulator.snapshot()
+        >>> emulator(time, input_plan_a)
+        >>> emulator.restore(snapshot)
+        >>> emulator(time, input_plan_b)
+
+        """
+
+        return {
+            'length': {key: len(self.res[key]) for key in self.res},
+            'tail': {key: np.array(self.res[key][-1:]) for key in self.res},
+            'parameters': dict(self.parameters),
+            'state': copy.deepcopy(self.savestate()),
+        }
+
+    def restore(self, snapshot):
+        """
+        Returns the emulator to a snapshot, the results after the snapshot are
+        removed.
+
+        Parameters
+        ----------
+        snapshot : dict
+            A snapshot returned by :code:`snapshot`.
+
+        """
+
+        res = {}
+        for key in snapshot['length']:
+            length = snapshot['length'][key]
+            if key in self.res and len(self.res[key]) >= length > 1:
+                res[key] = np.concatenate((self.res[key][:length-1], snapshot['tail'][key]))
+            else:
+                res[key] = snapshot['tail'][key].copy()
+        self.res = res
+        self.parameters = dict(snapshot['parameters'])
+        self.loadstate(copy.deepcopy(snapshot['state']))
+
+    def fork(self):
+        """
+        Returns a copy of the emulator in the current state, of which the
+        results only contain the last sample.
+
+        Can be used to simulate several control plans from the current state
+        without changing the emulator.
+
+        Returns
+        -------
+        Emulator
+            The copy.
+
+        """
+
+        # the results history is not copied and a cache is shared
+        memo = {id(self.res): {key: np.array(self.res[key][-1:]) for key in self.res}}
+        if self.cache is not None:
+            memo[id(self.cache)] = self.cache
+        return copy.deepcopy(self, memo)
+
     def set_initial_conditions(self, ini):
         print('Warning: Depreciated,'
               'set the initial conditions during the object creation with the "initial_conditions" keyword parameter.')
@@ -183,7 +300,329 @@ class Emulator(object):
               'set the initial conditions during the object creation with the "parameters" keyword parameter.')
         self.parameters = par
 
+
+class OdeEmulator(Emulator):
+    """
+    An emulator for systems described by ordinary differential equations
+    :code:`dx/dt = rhs(t, x, u, p)`, integrated with a fixed step Runge-Kutta 4
+    or an adaptive Runge-Kutta 4(5) (Dormand-Prince) method.
+
+    """
+
+    def __init__(self, input_keys, state_keys, rhs=None, parameters=None, initial_conditions=None,
+                 parameter_keys=None, timestep=60., method='rk4', rtol=1e-6, atol=1e-6, compiled=False, cache=None):
+        """
+        Parameters
+        ----------
+        input_keys : list of strings
+            List of strings of inputs, the order determines the order in the
+            input array passed to :code:`rhs`.
+
+        state_keys : list of strings
+            List of strings of states, the order determines the order in the
+            state array.
+
+        rhs : function, optional
+            Function :code:`rhs(t, x, u, p)` returning the state derivatives as
+            an array, with :code:`x`, :code:`u` and :code:`p` arrays of states,
+            inputs and parameters. When not supplied the :code:`rhs` method
+            must be redefined in a child class.
+
+        parameters : dict
+            A dictionary of parameters used by the emulator.
+
+        initial_conditions : dict
+            A dictionary of initial conditions of the states.
+
+        parameter_keys : list of strings, optional
+            The order of the parameters in the parameter array, defaults to the
+            order of the parameters dictionary.
+
+        timestep : number, optional
+            Integration time step for the rk4 method and output time step for
+            the rk45 method.
+
+        method : str, optional
+            Integration method, 'rk4' or 'rk45'.
+
+        rtol : number, optional
+            Relative tolerance of the rk45 method.
+
+        atol : number, optional
+            Absolute tolerance of the rk45 method.
+
+        compiled : boolean, optional
+            Compile :code:`rhs` and the integration loop with numba on first
+            use. The compiled functions are cached and reused by all
+            emulators. Requires :code:`numba` and a :code:`rhs` function.
+
+        cache : SimulationCache or string, optional
+            A cache or the directory of a cache storing the simulation results.
+
+        Examples
+        --------
+        >>> def rhs(t, x, u, p):
+        ...     return np.array([(u[0] - p[0]*(x[0]-u[1]))/p[1]])
+        >>> em = OdeEmulator(['Q_flow_hp', 'T_am'], ['T_in'], rhs, parameters={'UA': 200., 'C': 5e6},
+        ...                  initial_conditions={'T_in': 293.15})
+
+        """
+
+        Emulator.__init__(self, input_keys, parameters=parameters, initial_conditions=initial_conditions,
+                          cache=cache)
+
+        self.states = state_keys
+        if rhs is not None:
+            self.rhs = rhs
+        if parameter_keys is None:
+            parameter_keys = list(self.parameters.keys())
+        self.parameter_keys = parameter_keys
+
+        self.timestep = timestep
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.compiled = compiled
+
+    def rhs(self, t, x, u, p):
+        """
+        Redefine in a child class when no rhs function is supplied.
+
+        Parameters
+        ----------
+        t : number
+            Time.
+
+        x : np.array
+            State values.
+
+        u : np.array
+            Input values.
+
+        p : np.array
+            Parameter values.
+
+        Returns
+        -------
+        np.array
+            The state derivatives.
+
+        """
+
+        raise NotImplementedError('the rhs method must be redefined or an rhs function supplied')
+
+    def _functions(self):
+        if self.method == 'rk4':
+            kernel = _rk4
+        elif self.method == 'rk45':
+            kernel = _rk45
+        else:
+            raise Exception('Unknown integration method {}'.format(self.method))
+
+        if not self.compiled:
+            return self.rhs, kernel, _interp_inputs
+
+        try:
+            import numba
+        except ImportError:
+            print('Warning: numba is not available, using the uncompiled integrator')
+            self.compiled = False
+            return self.rhs, kernel, _interp_inputs
+
+        for function in [self.rhs, kernel, _interp_inputs]:
+            if not function in _kernels:
+                _kernels[function] = numba.njit(function)
+        return _kernels[self.rhs], _kernels[kernel], _kernels[_interp_inputs]
+
+    def simulate(self, starttime, stoptime, input):
+        n = max(1, int(np.ceil((stoptime-starttime)/self.timestep-1e-6)))
+        time = np.linspace(starttime, stoptime, n+1)
+
+        x0 = np.array([self.res[key][-1] for key in self.states], dtype=float)
+        p = np.array([self.parameters[key] for key in self.parameter_keys], dtype=float)
+        tp = np.asarray(input['time'], dtype=float)
+        up = np.array([input[key] for key in self.inputs], dtype=float).reshape((len(self.inputs), -1)).T
+
+        rhs, kernel, interp = self._functions()
+        if self.method == 'rk4':
+            # interpolate all inputs at the nodes and midpoints at once
+            u = np.array([np.interp(time, tp, up[:, j]) for j in range(up.shape[1])]).reshape((-1, len(time))).T
+            uh = np.array([np.interp(0.5*(time[:-1]+time[1:]), tp, up[:, j])
+                           for j in range(up.shape[1])]).reshape((-1, len(time)-1)).T
+            x = kernel(rhs, time, x0, u, uh, p)
+        else:
+            x = kernel(rhs, interp, time, x0, tp, up, p, self.rtol, self.atol)
+
+        res = {'time': time}
+        for i, key in enumerate(self.states):
+            res[key] = x[:, i]
+        return res
+
                 
+class SimulationCache(object):
+    """
+    Disk cache of emulator simulation results.
+
+    Results are stored in a file named after a hash of the emulator class and
+    the code of its methods, its parameters and attributes, including
+    functions such as :code:`rhs`, the last sample of its results, the start
+    and stop time and the inputs. Emulators with an attribute which can not be
+    hashed are not cached. When the total size exceeds the maximum size, the
+    least recently used files are removed.
+
+    """
+
+    def __init__(self, directory, maxsize=1e9):
+        """
+        Parameters
+        ----------
+        directory : string
+            The directory of the cache, created when it does not exist.
+
+        maxsize : number, optional
+            Maximum total size of the cached files in bytes.
+
+        Examples
+        --------
+        >>> cache = SimulationCache('simulations', maxsize=10e9)
+        >>> emulator = OdeEmulator(['Q_flow_hp', 'T_am'], ['T_in'], rhs, parameters=parameters, cache=cache)
+
+        """
+
+        self.directory = directory
+        self.maxsize = maxsize
+        self.statistics = {'hits': 0, 'misses': 0}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._size = sum(os.path.getsize(filename) for filename in self._files())
+
+    def _files(self):
+        return [os.path.join(self.directory, filename) for filename in os.listdir(self.directory)
+                if filename.endswith('.npz')]
+
+    def key(self, emulator, starttime, stoptime, input):
+        """
+        Returns the hash identifying a simulation, or None when the emulator
+        can not be hashed.
+
+        """
+
+        h = hashlib.blake2b(digest_size=20)
+        try:
+            for cls in type(emulator).__mro__[:-1]:
+                h.update('{}.{}'.format(cls.__module__, cls.__qualname__).encode())
+                _hash(h, {name: value for name, value in cls.__dict__.items()
+                          if isinstance(value, (types.FunctionType, staticmethod, classmethod))})
+            _hash(h, {name: value for name, value in emulator.__dict__.items() if not name in ['res', 'cache']})
+            _hash(h, {key: np.asarray(emulator.res[key])[-1:] for key in emulator.res})
+            _hash(h, [starttime, stoptime])
+            _hash(h, {key: input[key] for key in input})
+        except TypeError:
+            return None
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Returns cached results or None.
+
+        """
+
+        if key is None:
+            self.statistics['misses'] += 1
+            return None
+        filename = os.path.join(self.directory, key + '.npz')
+        try:
+            with np.load(filename) as data:
+                res = {name: data[name] for name in data.files}
+        except (IOError, ValueError):
+            self.statistics['misses'] += 1
+            return None
+        # the access time is used for the eviction
+        os.utime(filename)
+        self.statistics['hits'] += 1
+        return res
+
+    def put(self, key, res):
+        """
+        Stores results and removes the least recently used files when the
+        cache is too large.
+
+        """
+
+        if key is None:
+            return
+        filename = os.path.join(self.directory, key + '.npz')
+        temp = os.path.join(self.directory, '{}.{}.tmp'.format(key, os.getpid()))
+        with open(temp, 'wb') as f:
+            np.savez(f, **res)
+        if os.path.exists(filename):
+            # the replaced file is no longer part of the cache size
+            self._size -= os.path.getsize(filename)
+        os.replace(temp, filename)
+        self._size += os.path.getsize(filename)
+
+        if self._size > self.maxsize:
+            files = sorted(self._files(), key=lambda filename: os.stat(filename).st_mtime)
+            self._size = sum(os.path.getsize(filename) for filename in files)
+            for filename in files:
+                if self._size <= self.maxsize:
+                    break
+                size = os.path.getsize(filename)
+                try:
+                    os.remove(filename)
+                    self._size -= size
+                except OSError:
+                    pass
+
+    def clear(self):
+        """
+        Removes all cached files.
+
+        """
+
+        for filename in self._files():
+            os.remove(filename)
+        self._size = 0
+
+
+def _hash(h, value):
+    # raises a TypeError for values which can not be hashed reliably
+    if isinstance(value, dict):
+        for key in sorted(value.keys(), key=repr):
+            h.update(repr(key).encode())
+            _hash(h, value[key])
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        value = np.asarray(value) if isinstance(value, np.ndarray) else value
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            value = np.ascontiguousarray(value)
+            h.update('{}{}'.format(value.dtype.str, value.shape).encode())
+            h.update(value.tobytes())
+        else:
+            h.update('{}{}'.format(type(value).__name__, len(value)).encode())
+            for item in value:
+                _hash(h, item)
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic)):
+        h.update('{}:{}'.format(type(value).__name__, repr(value)).encode())
+    elif isinstance(value, (staticmethod, classmethod)):
+        _hash(h, value.__func__)
+    elif isinstance(value, types.MethodType):
+        _hash(h, value.__func__)
+    elif isinstance(value, types.FunctionType):
+        h.update('{}.{}'.format(value.__module__, value.__qualname__).encode())
+        _hash(h, value.__code__)
+        _hash(h, value.__defaults__)
+        _hash(h, [cell.cell_contents for cell in (value.__closure__ or ())])
+    elif isinstance(value, types.CodeType):
+        h.update(value.co_code)
+        _hash(h, value.co_consts)
+        _hash(h, value.co_names)
+    elif isinstance(value, (types.BuiltinFunctionType, np.ufunc)):
+        h.update(repr(value).encode())
+    else:
+        raise TypeError('Can not hash {}'.format(type(value)))
+
+
 class DympyEmulator(Emulator):
     """
     A class defining an emulator object using dympy for the simulation
@@ -276,6 +715,13 @@ class DympyEmulator(Emulator):
         for key in res:
             self.res[key] = np.array([res[key][0]])
 
+    def savestate(self):
+        # the state is held in the files of the dymola working directory
+        raise Exception('Snapshots are not supported by the DympyEmulator')
+
+    def fork(self):
+        raise Exception('Forking is not supported by the DympyEmulator')
+
     def simulate(self, starttime, stoptime, input):
         """
         """
@@ -293,8 +739,8 @@ class DympyEmulator(Emulator):
             
         try:
             res = self.dymola.get_result()
-        except:
-            print('Ignoring error while loading dymola res file at time {}'.format(input['time'][0]))
+        except Exception as e:
+            raise Exception('Could not load the dymola res file at time {}: {}'.format(input['time'][0], e))
     
         return res
 
@@ -307,3 +753,79 @@ def interp_averaged(t, tp, yp):
     y[-1] = np.interp(t[-1], tp, yp)
     
     return y
+
+
+def _rk4(rhs, time, x0, u, uh, p):
+    # the states can have extra axes, e.g. a population of parameter sets
+    x = np.zeros((len(time),) + x0.shape)
+    x[0] = x0
+    for i in range(len(time)-1):
+        t = time[i]
+        dt = time[i+1]-time[i]
+        k1 = np.asarray(rhs(t, x[i], u[i], p))
+        k2 = np.asarray(rhs(t+0.5*dt, x[i]+0.5*dt*k1, uh[i], p))
+        k3 = np.asarray(rhs(t+0.5*dt, x[i]+0.5*dt*k2, uh[i], p))
+        k4 = np.asarray(rhs(t+dt, x[i]+dt*k3, u[i+1], p))
+        x[i+1] = x[i] + dt/6.*(k1+2*k2+2*k3+k4)
+    return x
+
+
+def _interp_inputs(t, tp, up):
+    u = np.zeros(up.shape[1])
+    for j in range(up.shape[1]):
+        u[j] = np.interp(t, tp, up[:, j])
+    return u
+
+
+def _rk45(rhs, interp, time, x0, tp, up, p, rtol, atol):
+    # Dormand-Prince coefficients
+    x = np.zeros((len(time), len(x0)))
+    x[0] = x0
+    xi = x[0].copy()
+    t = time[0]
+    h = time[1]-time[0]
+    hmin = 1e-10*(time[-1]-time[0])
+    steps = 0
+    for i in range(len(time)-1):
+        while t < time[i+1]:
+            steps += 1
+            if steps > 1000000:
+                raise Exception('Maximum number of rk45 steps exceeded')
+            last = h >= time[i+1]-t
+            if last:
+                h = time[i+1]-t
+            k1 = np.asarray(rhs(t, xi, interp(t, tp, up), p))
+            k2 = np.asarray(rhs(t+h/5., xi+h*(k1/5.), interp(t+h/5., tp, up), p))
+            k3 = np.asarray(rhs(t+3.*h/10., xi+h*(3./40.*k1+9./40.*k2), interp(t+3.*h/10., tp, up), p))
+            k4 = np.asarray(rhs(t+4.*h/5., xi+h*(44./45.*k1-56./15.*k2+32./9.*k3),
+                                interp(t+4.*h/5., tp, up), p))
+            k5 = np.asarray(rhs(t+8.*h/9., xi+h*(19372./6561.*k1-25360./2187.*k2+64448./6561.*k3-212./729.*k4),
+                                interp(t+8.*h/9., tp, up), p))
+            k6 = np.asarray(rhs(t+h, xi+h*(9017./3168.*k1-355./33.*k2+46732./5247.*k3+49./176.*k4
+                                           -5103./18656.*k5),
+                                interp(t+h, tp, up), p))
+            xn = xi+h*(35./384.*k1+500./1113.*k3+125./192.*k4-2187./6784.*k5+11./84.*k6)
+            k7 = np.asarray(rhs(t+h, xn, interp(t+h, tp, up), p))
+
+            err = h*(71./57600.*k1-71./16695.*k3+71./1920.*k4-17253./339200.*k5+22./525.*k6-1./40.*k7)
+            scale = atol + rtol*np.maximum(np.abs(xi), np.abs(xn))
+            errnorm = np.sqrt(np.mean((err/scale)**2))
+            if not np.isfinite(errnorm):
+                raise Exception('Non-finite state derivatives in the rk45 integration')
+
+            if errnorm <= 1.:
+                # accept the step
+                if last:
+                    t = time[i+1]
+                else:
+                    t = t+h
+                xi = xn
+
+            if errnorm == 0.:
+                h = 5.*h
+            else:
+                h = h*min(5., max(0.2, 0.9*errnorm**-0.2))
+            if errnorm > 1. and h < hmin:
+                raise Exception('rk45 step size below the minimum step size')
+        x[i+1] = xi
+    return x
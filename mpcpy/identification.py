@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import numpy as np
+
+from .disturbances import Disturbances
+from .emulator import _rk4
+
+
+class Identification(object):
+    """
+    Grey-box parameter identification of an ordinary differential equation
+    model from measured data.
+
+    All candidate parameter sets of a population are simulated at once with the
+    Runge-Kutta 4 integrator of :code:`mpcpy.OdeEmulator`. A global search over
+    the parameter bounds, random sampling or differential evolution, is
+    followed by a Levenberg-Marquardt refinement of the best candidate, of
+    which the finite difference Jacobian is also computed as a single
+    population simulation.
+
+    The model is described by an :code:`mpcpy.OdeEmulator`. Its :code:`rhs`
+    function must work on arrays with the states, inputs and parameters on the
+    first axis and the candidates on the second axis, which holds for most
+    functions written with :code:`x[0]`, :code:`u[1]`, :code:`p[2]`
+    elementwise expressions.
+
+    """
+
+    def __init__(self, model, data, outputs, parameters, time=None, weights=None, method='differentialevolution',
+                 population=40, generations=30, maxiterations=50, seed=None):
+        """
+        Parameters
+        ----------
+        model : mpcpy.OdeEmulator
+            The model structure. Parameters which are not identified and
+            initial conditions are taken from this object.
+
+        data : mpcpy.Disturbances or dict
+            The measured inputs and outputs. A dictionary with a 'time' key is
+            converted to a non periodic :code:`mpcpy.Disturbances` object.
+
+        outputs : list of strings
+            Measured state keys which are compared with the simulation.
+
+        parameters : dict
+            Dictionary with the identified parameter names as keys and a tuple
+            of the lower and upper bound as values. A state name identifies the
+            initial condition of that state.
+
+        time : np.array, optional
+            Simulation time grid, defaults to the time of the data when it is
+            a dictionary. Required for a :code:`mpcpy.Disturbances` object.
+
+        weights : dict, optional
+            Weight of the squared error of each output, defaults to 1.
+
+        method : string, optional
+            Global search method, 'differentialevolution' or 'random'.
+
+        population : int, optional
+            Number of candidates evaluated simultaneously during the global
+            search.
+
+        generations : int, optional
+            Number of populations evaluated during the global search.
+
+        maxiterations : int, optional
+            Maximum number of Levenberg-Marquardt iterations, 0 disables the
+            local refinement.
+
+        seed : int, optional
+            Seed of the global search.
+
+        Examples
+        --------
+        >>> def rhs(t, x, u, p):
+        ...     return np.array([(u[0] - p[0]*(x[0]-u[1]))/p[1]])
+        >>> model = OdeEmulator(['Q_flow_hp', 'T_am'], ['T_in'], rhs, parameters={'UA': 200., 'C': 5e6},
+        ...                     initial_conditions={'T_in': 293.15})
+        >>> identification = Identification(model, measurements, ['T_in'],
+        ...                                 {'UA': (50., 500.), 'C': (1e6, 1e7)})
+        >>> parameters = identification()
+
+        """
+
+        if not method in ['differentialevolution', 'random']:
+            raise Exception('Unknown method {}'.format(method))
+
+        self.model = model
+        self.outputs = outputs
+        self.names = list(parameters.keys())
+        self.lower = np.array([parameters[name][0] for name in self.names], dtype=float)
+        self.upper = np.array([parameters[name][1] for name in self.names], dtype=float)
+        self.method = method
+        self.population = population
+        self.generations = generations
+        self.maxiterations = maxiterations
+        self.seed = seed
+
+        if not isinstance(data, Disturbances):
+            if time is None:
+                time = data['time']
+            data = Disturbances(data, periodic=False)
+        if time is None:
+            raise Exception('time must be supplied when the data is a Disturbances object')
+        self.data = data
+        self.time = np.asarray(time, dtype=float)
+
+        self.weights = np.ones(len(outputs))
+        if weights is not None:
+            self.weights = np.array([weights.get(key, 1.) for key in outputs], dtype=float)
+
+        # inputs at the nodes and midpoints of the time grid
+        midpoints = 0.5*(self.time[:-1]+self.time[1:])
+        self._u = np.array([data.interp(key, self.time) for key in model.inputs], dtype=float).reshape((-1, len(self.time)))
+        self._uh = np.array([data.interp(key, midpoints) for key in model.inputs], dtype=float).reshape((-1, len(midpoints)))
+        self._measured = np.array([data.interp(key, self.time) for key in outputs], dtype=float)
+        self._outputs = [model.states.index(key) for key in outputs]
+
+        self.res = {}
+
+    def _expand(self, values):
+        """
+        Returns the parameter and initial state arrays of a population from the
+        identified values, with shape (number of values, population).
+
+        """
+
+        pop = values.shape[1]
+        p = np.array([[self.model.parameters[key]] for key in self.model.parameter_keys], dtype=float)
+        p = np.repeat(p.reshape((-1, 1)), pop, axis=1)
+        x0 = np.array([[self.model.initial_conditions[key]] for key in self.model.states], dtype=float)
+        x0 = np.repeat(x0.reshape((-1, 1)), pop, axis=1)
+        for i, name in enumerate(self.names):
+            if name in self.model.parameter_keys:
+                p[self.model.parameter_keys.index(name)] = values[i]
+            else:
+                x0[self.model.states.index(name)] = values[i]
+        return x0, p
+
+    def simulate(self, values):
+        """
+        Simulates a population of candidates.
+
+        Parameters
+        ----------
+        values : np.array
+            The identified parameter values with shape (number of parameters,
+            population).
+
+        Returns
+        -------
+        np.array
+            The states with shape (number of time steps, number of states,
+            population).
+
+        """
+
+        values = np.asarray(values, dtype=float).reshape((len(self.names), -1))
+        x0, p = self._expand(values)
+        # inputs with shape (number of time steps, number of inputs, 1) broadcast over the population
+        return _rk4(self.model.rhs, self.time, x0, self._u.T[:, :, np.newaxis], self._uh.T[:, :, np.newaxis], p)
+
+    def residuals(self, values):
+        """
+        Returns the weighted residuals of a population.
+
+        Parameters
+        ----------
+        values : np.array
+            The identified parameter values with shape (number of parameters,
+            population).
+
+        Returns
+        -------
+        np.array
+            The residuals with shape (number of residuals, population).
+
+        """
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            x = self.simulate(values)[:, self._outputs, :]
+        residuals = (x-self._measured.T[:, :, np.newaxis])*np.sqrt(self.weights)[np.newaxis, :, np.newaxis]
+        return residuals.reshape((-1, x.shape[2]))
+
+    def cost(self, values):
+        """
+        Returns the sum of squared weighted residuals of a population.
+
+        """
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            cost = np.sum(self.residuals(values)**2, axis=0)
+        # unstable candidates
+        cost[~np.isfinite(cost)] = np.inf
+        return cost
+
+    def _scale(self, z):
+        return self.lower[:, np.newaxis] + z*(self.upper-self.lower)[:, np.newaxis]
+
+    def _search(self, rng):
+        k = len(self.names)
+        n = self.population
+
+        z = rng.random((k, n))
+        cost = self.cost(self._scale(z))
+
+        for generation in range(1, self.generations):
+            if self.method == 'random':
+                trial = rng.random((k, n))
+            else:
+                # differential evolution, rand/1/bin
+                indices = np.array([rng.choice(n, 3, replace=False) for j in range(n)]).T
+                mutant = z[:, indices[0]] + 0.7*(z[:, indices[1]]-z[:, indices[2]])
+                mutant = np.clip(mutant, 0., 1.)
+                crossover = rng.random((k, n)) < 0.9
+                crossover[rng.integers(k, size=n), np.arange(n)] = True
+                trial = np.where(crossover, mutant, z)
+
+            trialcost = self.cost(self._scale(trial))
+            if self.method == 'random':
+                # keep the best candidates of both populations
+                z = np.concatenate((z, trial), axis=1)
+                cost = np.concatenate((cost, trialcost))
+                order = np.argsort(cost)[:n]
+                z = z[:, order]
+                cost = cost[order]
+            else:
+                better = trialcost < cost
+                z[:, better] = trial[:, better]
+                cost[better] = trialcost[better]
+
+        best = np.argmin(cost)
+        return z[:, best], cost[best]
+
+    def _refine(self, z, cost):
+        k = len(self.names)
+        step = 1e-6
+        damping = 1e-3
+
+        for iteration in range(self.maxiterations):
+            # residuals of the candidate and the perturbed candidates in a single simulation
+            zp = np.repeat(z[:, np.newaxis], k+1, axis=1)
+            h = step*np.where(z < 0.5, 1., -1.)
+            zp[np.arange(k), np.arange(1, k+1)] += h
+            residuals = self.residuals(self._scale(zp))
+            r = residuals[:, 0]
+            jacobian = (residuals[:, 1:]-r[:, np.newaxis])/h
+
+            gradient = jacobian.T.dot(r)
+            hessian = jacobian.T.dot(jacobian)
+
+            improved = False
+            while damping < 1e10:
+                delta = np.linalg.solve(hessian + damping*np.diag(np.diag(hessian)+1e-12), -gradient)
+                znew = np.clip(z+delta, 0., 1.)
+                newcost = self.cost(self._scale(znew[:, np.newaxis]))[0]
+                if newcost < cost:
+                    improved = True
+                    damping = max(damping/10., 1e-12)
+                    break
+                damping *= 10.
+
+            if not improved:
+                break
+            converged = cost-newcost < 1e-10*cost or np.max(np.abs(znew-z)) < 1e-10
+            z = znew
+            cost = newcost
+            if converged:
+                break
+        return z, cost
+
+    def __call__(self):
+        """
+        Identifies the parameters.
+
+        Returns
+        -------
+        dict
+            Dictionary with the identified parameter values. The cost and
+            root mean square error per output are stored in the res attribute.
+
+        """
+
+        rng = np.random.default_rng(self.seed)
+        z, cost = self._search(rng)
+        if self.maxiterations > 0:
+            z, cost = self._refine(z, cost)
+
+        values = self._scale(z[:, np.newaxis])[:, 0]
+        parameters = dict(zip(self.names, (float(value) for value in values)))
+
+        x = self.simulate(values[:, np.newaxis])[:, self._outputs, 0]
+        rmse = np.sqrt(np.mean((x-self._measured.T)**2, axis=0))
+        self.res = {'parameters': parameters, 'cost': cost, 'rmse': dict(zip(self.outputs, rmse))}
+        return parameters
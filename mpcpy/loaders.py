@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import json
+import itertools
+import numpy as np
+
+
+# column indices of EnergyPlus weather files
+epw_columns = {
+    'dry_bulb_temperature': 6,
+    'dew_point_temperature': 7,
+    'relative_humidity': 8,
+    'atmospheric_pressure': 9,
+    'extraterrestrial_horizontal_radiation': 10,
+    'extraterrestrial_direct_normal_radiation': 11,
+    'horizontal_infrared_radiation': 12,
+    'global_horizontal_radiation': 13,
+    'direct_normal_radiation': 14,
+    'diffuse_horizontal_radiation': 15,
+    'wind_direction': 20,
+    'wind_speed': 21,
+    'total_sky_cover': 22,
+    'opaque_sky_cover': 23,
+}
+
+_days = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+
+def read_csv(filename, columns=None, delimiter=',', dtypes=None, chunksize=100000, cache=True):
+    """
+    Reads a numeric csv file with a header line into a dictionary of arrays
+    which can be passed to :code:`mpcpy.Disturbances`.
+
+    The file is parsed in chunks into preallocated arrays, so the peak memory
+    is about the size of the result. When caching is enabled the columns are
+    stored as binary files in the :code:`<filename>.mpcpy-cache` directory and
+    later calls load them as memory mapped arrays, as long as the file is not
+    modified.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file.
+
+    columns : list of strings, optional
+        Names of the columns to read, defaults to all columns.
+
+    delimiter : string, optional
+        The column delimiter.
+
+    dtypes : dict, optional
+        Data type per column name, defaults to float.
+
+    chunksize : int, optional
+        Number of lines parsed at once.
+
+    cache : boolean, optional
+        Use the binary cache.
+
+    Returns
+    -------
+    dict
+        Dictionary with an array per column.
+
+    Examples
+    --------
+    >>> data = read_csv('prices.csv', columns=['time', 'price'], dtypes={'price': np.float32})
+    >>> disturbances = Disturbances(data)
+
+    """
+
+    with open(filename, 'r') as f:
+        header = [name.strip().strip('"') for name in f.readline().strip().split(delimiter)]
+    if columns is None:
+        columns = header
+    for name in columns:
+        if not name in header:
+            raise Exception('Column {} not found in {}'.format(name, filename))
+
+    return _read(filename, columns, [header.index(name) for name in columns], 1, delimiter, dtypes, chunksize,
+                 cache, columns, None)
+
+
+def read_epw(filename, columns=None, dtypes=None, chunksize=100000, cache=True):
+    """
+    Reads an EnergyPlus weather file into a dictionary of arrays which can be
+    passed to :code:`mpcpy.Disturbances`.
+
+    The time is the number of seconds since the start of the year at the end
+    of each hourly record, leap days are not taken into account. The file is
+    parsed in chunks and cached as with :code:`read_csv`.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file.
+
+    columns : list of strings, optional
+        Names of the columns to read, keys of :code:`epw_columns`, defaults to
+        all.
+
+    dtypes : dict, optional
+        Data type per column name, defaults to float.
+
+    chunksize : int, optional
+        Number of lines parsed at once.
+
+    cache : boolean, optional
+        Use the binary cache.
+
+    Returns
+    -------
+    dict
+        Dictionary with the 'time' and an array per column.
+
+    Examples
+    --------
+    >>> data = read_epw('weather.epw', columns=['dry_bulb_temperature', 'global_horizontal_radiation'])
+    >>> data['T_am'] = data.pop('dry_bulb_temperature') + 273.15
+    >>> disturbances = Disturbances(data)
+
+    """
+
+    if columns is None:
+        columns = list(epw_columns.keys())
+    for name in columns:
+        if not name in epw_columns:
+            raise Exception('Unknown epw column {}'.format(name))
+
+    # the minute field is 0 or 60 in most files and is not read
+    names = ['month', 'day', 'hour'] + list(columns)
+    indices = [1, 2, 3] + [epw_columns[name] for name in columns]
+
+    def time(data):
+        month = data.pop('month').astype(int)
+        day = data.pop('day')
+        hour = data.pop('hour')
+        data['time'] = ((_days[month-1] + day - 1)*24 + hour)*3600.
+        return data
+
+    return _read(filename, names, indices, 8, ',', dtypes, chunksize, cache, ['time'] + list(columns), time)
+
+
+def _read(filename, names, indices, skiprows, delimiter, dtypes, chunksize, cache, keys, postprocess):
+    directory = filename + '.mpcpy-cache'
+    stat = os.stat(filename)
+    source = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if dtypes is None:
+        dtypes = {}
+
+    if cache:
+        data = _load_cache(directory, source, keys, dtypes)
+        if data is not None:
+            return data
+
+    # count the lines to preallocate the columns
+    with open(filename, 'rb') as f:
+        lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            lines += 1
+    rows = lines - skiprows
+
+    data = {name: np.empty(rows, dtype=dtypes.get(name, float)) for name in names}
+    row = 0
+    with open(filename, 'r') as f:
+        for i in range(skiprows):
+            f.readline()
+        while True:
+            chunk = [line for line in itertools.islice(f, chunksize) if line.strip()]
+            if len(chunk) == 0:
+                break
+            values = np.loadtxt(chunk, delimiter=delimiter, usecols=indices, ndmin=2)
+            for j, name in enumerate(names):
+                data[name][row:row+len(values)] = values[:, j]
+            row += len(values)
+    for name in names:
+        data[name] = data[name][:row]
+
+    if postprocess is not None:
+        data = postprocess(data)
+
+    if cache:
+        _save_cache(directory, source, data)
+    return data
+
+
+def _load_cache(directory, source, names, dtypes):
+    try:
+        with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if manifest['source'] != source:
+        return None
+    for name in names:
+        if not name in manifest['columns'] or np.dtype(dtypes.get(name, float)).str != manifest['columns'][name]:
+            return None
+
+    data = {}
+    for name in names:
+        data[name] = np.load(os.path.join(directory, '{}.npy'.format(manifest['files'][name])), mmap_mode='r')
+    return data
+
+
+def _save_cache(directory, source, data):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    manifest = {'source': source, 'columns': {}, 'files': {}}
+    try:
+        with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+            previous = json.load(f)
+        if previous['source'] == source:
+            # keep the columns of previous calls
+            manifest = previous
+    except (IOError, ValueError):
+        pass
+
+    for name in data:
+        # column names are not necessarily valid file names
+        if not name in manifest['files']:
+            manifest['files'][name] = 'column{}'.format(len(manifest['files']))
+        # replace the file, arrays mapped from the old file remain valid
+        filename = os.path.join(directory, '{}.npy'.format(manifest['files'][name]))
+        with open(filename + '.tmp', 'wb') as f:
+            np.save(f, data[name])
+        os.replace(filename + '.tmp', filename)
+        manifest['columns'][name] = data[name].dtype.str
+
+    temp = os.path.join(directory, 'manifest.json.tmp')
+    with open(temp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp, os.path.join(directory, 'manifest.json'))
@@ -17,14 +17,19 @@
 #    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
 
-import sys
+import contextlib
 import numpy as np
 
+from .disturbances import interp_zoh
+from .results import LazyResults
+from .profiling import nbytes
+
 
 class MPC(object):
 
     def __init__(self, emulator, control, disturbances,
-                 emulationtime=7 * 24 * 3600, resulttimestep=600, nextstepcalculator=None, plotfunction=None):
+                 emulationtime=7 * 24 * 3600, resulttimestep=600, nextstepcalculator=None, plotfunction=None,
+                 sink=None, performance=None, profiler=None):
         """
         initialize an MPC object
         
@@ -53,6 +58,21 @@ class MPC(object):
         plotfunction : function
             A function which creates or updates a plot for live viewing of
             results, probably broken, untested.
+
+        sink : mpcpy.ResultSink, optional
+            When supplied, the results are written to the sink after every
+            receding step together with the interpolated disturbances, and only
+            the last result sample is kept in the emulator :code:`res`
+            attribute. The sink is then returned instead of a dictionary.
+            Only results with the same length as the time vector are written.
+
+        performance : mpcpy.Performance, optional
+            When supplied, the control plan is compared with the realized
+            results after every receding step.
+
+        profiler : mpcpy.MemoryProfiler, optional
+            When supplied, the memory allocated in the phases of each receding
+            step and the size of the results and saved solutions are recorded.
         
         """
         
@@ -70,6 +90,10 @@ class MPC(object):
         self.nextstepcalculator = nextstepcalculator
             
         self.plotfunction = plotfunction
+
+        self.sink = sink
+        self.performance = performance
+        self.profiler = profiler
         
         self.res = {}
         self.appendres = {}
@@ -87,6 +111,8 @@ class MPC(object):
         -------
         dict
             A dictionary with results, also stored in the res attribute.
+            Disturbances are interpolated to the result time vector when they
+            are first accessed.
             
         """
         
@@ -94,77 +120,157 @@ class MPC(object):
         self.emulator.initialize()
         starttime = 0
 
-        if self.plotfunction:
-            (fig,ax,pl) = self.plotfunction()
+        if self.sink is not None:
+            self.sink.open()
 
-        # prepare a progress bar
-        barwidth = 80-2
-        barvalue = 0
-        if verbose > 0:
-            print('Running MPC')
-            print('[' + (' '*barwidth) + ']', end='')
+        if self.performance is not None:
+            self.performance.reset()
+
+        # clear the state of recursive forecasts of a previous simulation
+        for control in getattr(self.control, 'controls', [self.control]):
+            # any callable can be used as a prediction
+            reset = getattr(control.prediction, 'reset', None)
+            if reset is not None:
+                reset()
+
+        previousprofiler = self.control.profiler
+        if self.profiler is not None:
+            self.profiler.start()
+            self.control.profiler = self.profiler
 
-        while starttime < self.emulationtime:
+        try:
+            if self.plotfunction:
+                (fig,ax,pl) = self.plotfunction()
+
+            # prepare a progress bar
+            barwidth = 80-2
+            barvalue = 0
+            if verbose > 0:
+                print('Running MPC')
+                print('[' + (' '*barwidth) + ']', end='')
+
+            while starttime < self.emulationtime:
+                if self.profiler is not None:
+                    self.profiler.begin()
         
-            # calculate control signals for the control horizon
-            control = self.control(starttime)
-            
-            # create a simulation time vector
-            nextStep = self.nextstepcalculator(control)
-            time = np.arange(
-                starttime,
-                min(self.emulationtime+self.resulttimestep, starttime+nextStep*self.control.receding+0.01*self.resulttimestep),
-                self.resulttimestep, dtype=np.float
-            )
-            time[-1] = min(time[-1], self.emulationtime)
-            
-            # create input of all controls and the required boundary conditions
-            # add times at the control time steps minus 1e-6 times the result time step to achieve zero order hold
-            ind = np.where(
-                (control['time']-1e-6*self.resulttimestep > time[0])
-                & (control['time']-1e-6*self.resulttimestep <= time[-1])
-            )
-            inputtime = np.sort(np.concatenate((time, control['time'][ind]-1e-6*self.resulttimestep)))
-            input = {'time': inputtime}
-            
-            # add controls first
-            for key in control:
-                if not key in input:
-                    input[key] = interp_zoh(input['time'], control['time'], control[key])
+                # calculate control signals for the control horizon
+                with self._phase('control'):
+                    control = self.control(starttime)
             
-            # add the rest of the inputs from the boundary conditions
-            for key in self.emulator.inputs:
-                if not key in input and key in self.disturbances:
-                    input[key] = self.disturbances.interp(key, input['time'])
-                elif not key in input:
-                    print('Warning {} not found in disturbances object'.format(key))
+                with self._phase('input'):
+                    # create a simulation time vector
+                    nextStep = self.nextstepcalculator(control)
+                    time = np.arange(
+                        starttime,
+                        min(self.emulationtime+self.resulttimestep, starttime+nextStep*self.control.receding+0.01*self.resulttimestep),
+                        self.resulttimestep, dtype=float
+                    )
+                    time[-1] = min(time[-1], self.emulationtime)
+                
+                    # create input of all controls and the required boundary conditions
+                    # add times at the control time steps minus 1e-6 times the result time step to achieve zero order hold
+                    ind = np.where(
+                        (control['time']-1e-6*self.resulttimestep > time[0])
+                        & (control['time']-1e-6*self.resulttimestep <= time[-1])
+                    )
+                    inputtime = np.sort(np.concatenate((time, control['time'][ind]-1e-6*self.resulttimestep)))
+                    input = {'time': inputtime}
+                
+                    # add controls first, values which are not time series are not inputs
+                    for key in control:
+                        value = np.asarray(control[key])
+                        if not key in input and value.ndim > 0 and len(value) <= len(control['time']):
+                            input[key] = interp_zoh(input['time'], control['time'], value)
+                
+                    # add the rest of the inputs from the boundary conditions
+                    for key in self.emulator.inputs:
+                        if not key in input and key in self.disturbances:
+                            input[key] = self.disturbances.interp(key, input['time'])
+                        elif not key in input:
+                            print('Warning {} not found in disturbances object'.format(key))
                     
-            # prepare and run the simulation
-            self.emulator(time, input)
+                # prepare and run the simulation
+                with self._phase('emulator'):
+                    self.emulator(time, input)
+
+                # compare the plan with the realization of this step
+                if self.performance is not None and len(time) > 1:
+                    window = {}
+                    for key in self.emulator.res:
+                        if len(self.emulator.res[key]) >= len(time):
+                            window[key] = self.emulator.res[key][-len(time):]
+                    self.performance.update(control, window, self.disturbances)
             
-            # plot results
-            if self.plotfunction:
-                self.plotfunction(pl=pl, res=self.emulator.res)
+                # plot results
+                if self.plotfunction:
+                    self.plotfunction(pl=pl, res=self.emulator.res)
             
-            # update starting time
-            starttime = self.emulator.res['time'][-1]
+                # update starting time
+                starttime = self.emulator.res['time'][-1]
 
-            # update the progress bar
-            if verbose > 0:
-                if starttime/self.emulationtime*barwidth >= barvalue:
-                    barvalue += int(round(starttime/self.emulationtime*barwidth-barvalue))
-                    print('\r[' + ('='*barvalue) + (' '*(barwidth-barvalue)) + ']', end='')
+                # write all but the last result sample to the sink, the last sample is overwritten by the next step
+                if self.sink is not None:
+                    self._flush(final=False)
+
+                if self.profiler is not None and self.profiler.active:
+                    self.profiler.end(starttime, emulator=nbytes(self.emulator.res),
+                                      solutions=nbytes(self.control.solutions))
+
+                # update the progress bar
+                if verbose > 0:
+                    if starttime/self.emulationtime*barwidth >= barvalue:
+                        barvalue += int(round(starttime/self.emulationtime*barwidth-barvalue))
+                        print('\r[' + ('='*barvalue) + (' '*(barwidth-barvalue)) + ']', end='')
+        finally:
+            # the profiler is only used for this simulation
+            self.control.profiler = previousprofiler
+            if self.profiler is not None:
+                self.profiler.stop()
+
+        if self.sink is not None:
+            self._flush(final=True)
+            self.sink.close()
+            self.res = self.sink
+        else:
+            # copy the results to a local res dictionary, the boundary conditions are interpolated on access
+            self.res = LazyResults(self.emulator.res, self.disturbances)
 
-        # copy the results to a local res dictionary
-        self.res.update(self.emulator.res)
-        
-        # interpolate the boundary conditions and add them to self.res
-        self.res.update(self.disturbances(self.res['time']))
         if verbose > 0:
             print(' done')
         
         return self.res
 
+    def _phase(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+
+    def _flush(self, final=False):
+        """
+        Writes the results of the last receding step to the sink and truncates
+        the emulator results to their last sample.
+
+        """
+
+        res = self.emulator.res
+        length = len(res['time'])
+        if final:
+            ind = slice(length-1, length)
+        else:
+            ind = slice(0, length-1)
+
+        chunk = {}
+        for key in res:
+            if len(res[key]) == length:
+                chunk[key] = res[key][ind]
+
+        if len(chunk['time']) == 0:
+            return
+
+        chunk.update(self.disturbances(chunk['time']))
+        self.sink.write(chunk)
 
-def interp_zoh(x, xp, fp):
-    return np.array([fp[int((len(xp)-1)*(xi-xp[0])/(xp[-1]-xp[0]))] for xi in x])
+        if not final:
+            for key in res:
+                if len(res[key]) == length:
+                    res[key] = res[key][-1:].copy()
@@ -0,0 +1,609 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import multiprocessing
+import queue
+import traceback
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from .disturbances import Disturbances
+from .emulator import Emulator
+
+
+# state of a worker process
+_worker = {}
+
+
+class SharedDisturbances(object):
+    """
+    Copies the data of a disturbances object to shared memory, so it can be
+    used by worker processes without copying.
+
+    """
+
+    def __init__(self, disturbances):
+        """
+        Parameters
+        ----------
+        disturbances : mpcpy.Disturbances
+            The disturbances object to share.
+
+        Examples
+        --------
+        >>> with SharedDisturbances(disturbances) as shared:
+        ...     pool = multiprocessing.Pool(initializer=initialize, initargs=(shared.spec,))
+
+        """
+
+        self._memory = []
+        self.spec = {'attributes': {}, 'data': {}}
+        for key in disturbances.__dict__:
+            if key != 'data':
+                self.spec['attributes'][key] = disturbances.__dict__[key]
+
+        for key in disturbances.data:
+            value = np.ascontiguousarray(disturbances.data[key])
+            memory = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+            np.ndarray(value.shape, dtype=value.dtype, buffer=memory.buf)[...] = value
+            self._memory.append(memory)
+            self.spec['data'][key] = (memory.name, value.shape, value.dtype.str)
+
+    def close(self):
+        """
+        Releases the shared memory.
+
+        """
+
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
+        self._memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach_disturbances(spec):
+    """
+    Creates a read-only disturbances object from shared memory in a worker
+    process.
+
+    Parameters
+    ----------
+    spec : dict
+        The :code:`spec` attribute of a :code:`SharedDisturbances` object.
+
+    Returns
+    -------
+    mpcpy.Disturbances
+        A disturbances object using the shared arrays.
+
+    """
+
+    disturbances = Disturbances.__new__(Disturbances)
+    disturbances.__dict__.update(spec['attributes'])
+    disturbances.data = {}
+    for key in spec['data']:
+        name, shape, dtype = spec['data'][key]
+        if not name in _worker:
+            memory = shared_memory.SharedMemory(name=name)
+            try:
+                # the memory is owned by the parent process
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(memory._name, 'shared_memory')
+            except Exception:
+                pass
+            _worker[name] = memory
+        value = np.ndarray(shape, dtype=dtype, buffer=_worker[name].buf)
+        value.flags.writeable = False
+        disturbances.data[key] = value
+    return disturbances
+
+
+class MonteCarlo(object):
+    """
+    Runs an MPC simulation many times in parallel processes with perturbed
+    parameters or predictions and aggregates the results.
+
+    The disturbances are shared between all processes and the statistics are
+    updated as results arrive, so only a single result per process is held in
+    memory at once.
+
+    """
+
+    def __init__(self, factory, disturbances, runs=100, keys=None, quantiles=(0.05, 0.5, 0.95),
+                 processes=None, seed=None):
+        """
+        Parameters
+        ----------
+        factory : function
+            Function :code:`factory(disturbances, rng)` returning an
+            :code:`mpcpy.MPC` object, with :code:`rng` a
+            :code:`numpy.random.Generator` with an independent stream for every
+            run. Must be picklable.
+
+        disturbances : mpcpy.Disturbances
+            The disturbances passed to the factory.
+
+        runs : int, optional
+            The number of simulations.
+
+        keys : list of strings, optional
+            Result keys for which statistics are computed, defaults to all
+            keys of the first result.
+
+        quantiles : list of numbers, optional
+            Quantiles which are estimated for each key.
+
+        processes : int, optional
+            Number of worker processes, defaults to the number of cpus.
+
+        seed : int, optional
+            Seed from which the streams of all runs are derived.
+
+        Examples
+        --------
+        >>> def factory(disturbances, rng):
+        ...     parameters = dict(emulator_parameters, UA_in_am=rng.normal(200., 20.))
+        ...     ...
+        ...     return MPC(emulator, control, disturbances)
+        >>> stats = MonteCarlo(factory, disturbances, runs=100)()
+        >>> stats['T_in']['mean']
+
+        """
+
+        self.factory = factory
+        self.disturbances = disturbances
+        self.runs = runs
+        self.keys = keys
+        self.quantiles = quantiles
+        self.processes = processes
+        self.seed = seed
+
+        self.res = {}
+
+    def __call__(self, verbose=0):
+        """
+        Runs all simulations.
+
+        Parameters
+        ----------
+        verbose: optional, int
+            Controls the amount of print output
+
+        Returns
+        -------
+        dict
+            Dictionary with the result 'time' and for each key a dictionary
+            with the 'mean', 'std', 'min', 'max' and a 'quantiles' dictionary.
+            Also stored in the res attribute.
+
+        """
+
+        seeds = np.random.SeedSequence(self.seed).spawn(self.runs)
+        statistics = {}
+        time = None
+
+        with SharedDisturbances(self.disturbances) as shared:
+            pool = multiprocessing.Pool(self.processes, initializer=_initialize,
+                                        initargs=(shared.spec, self.factory, self.keys))
+            try:
+                for i, res in enumerate(pool.imap_unordered(_run, seeds)):
+                    if time is None:
+                        time = res['time']
+                    for key in res:
+                        if key == 'time':
+                            continue
+                        value = np.asarray(res[key], dtype=float)
+                        if value.ndim != 1:
+                            continue
+                        if len(res['time']) != len(time) or np.any(res['time'] != time):
+                            value = np.interp(time, res['time'], value)
+                        if not key in statistics:
+                            statistics[key] = _Statistics(self.quantiles)
+                        statistics[key].add(value)
+
+                    if verbose > 0:
+                        print('\rrun {} of {}'.format(i+1, self.runs), end='')
+            finally:
+                pool.close()
+                pool.join()
+
+        if verbose > 0:
+            print(' done')
+
+        self.res = {'time': time}
+        for key in statistics:
+            self.res[key] = statistics[key].result()
+        return self.res
+
+
+def _initialize(spec, factory, keys):
+    _worker['disturbances'] = attach_disturbances(spec)
+    _worker['factory'] = factory
+    _worker['keys'] = keys
+
+
+def _run(seed):
+    mpc = _worker['factory'](_worker['disturbances'], np.random.default_rng(seed))
+    res = mpc()
+    keys = _worker['keys']
+    if keys is None:
+        keys = list(res.keys())
+    result = {'time': np.asarray(res['time'])}
+    for key in keys:
+        result[key] = np.asarray(res[key])
+    return result
+
+
+class EmulatorPool(object):
+    """
+    A pool of long-lived worker processes each holding an emulator, for
+    instance an opened and compiled simulation model, which is reused by many
+    MPC simulations.
+
+    """
+
+    def __init__(self, factory, processes=1):
+        """
+        Parameters
+        ----------
+        factory : function
+            Function without arguments returning an :code:`mpcpy.Emulator`
+            object. It is called once in each worker process. Must be
+            picklable.
+
+        processes : int, optional
+            The number of worker processes.
+
+        Examples
+        --------
+        >>> def factory():
+        ...     dymola = dympy.Dymola()
+        ...     dymola.openModel('model.mo')
+        ...     dymola.compile('model')
+        ...     return DympyEmulator(dymola, ['T_amb', 'Q_flow_hp'])
+        >>> with EmulatorPool(factory, processes=4) as pool:
+        ...     with pool.emulator(parameters={'UA.G': 200.}) as emulator:
+        ...         mpc = MPC(emulator, control, disturbances)
+
+        """
+
+        self._connections = []
+        self._processes = []
+        self._inputs = []
+        self._free = queue.Queue()
+
+        for i in range(processes):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_pool_worker, args=(child, factory), daemon=True)
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        for i, connection in enumerate(self._connections):
+            status, result = connection.recv()
+            if status == 'error':
+                self.close()
+                raise Exception('Error while creating the emulator in a worker process:\n{}'.format(result))
+            self._inputs.append(result)
+            self._free.put(i)
+
+    def acquire(self, parameters=None, initial_conditions=None, timeout=None):
+        """
+        Returns an emulator from the pool, blocks until one is available.
+
+        Parameters
+        ----------
+        parameters : dict, optional
+            Parameters updating the parameters of the worker emulator during
+            initialization.
+
+        initial_conditions : dict, optional
+            Initial conditions updating those of the worker emulator during
+            initialization.
+
+        timeout : number, optional
+            Maximum time to wait for a free emulator.
+
+        Returns
+        -------
+        PoolEmulator
+            An emulator which must be released after use.
+
+        """
+
+        index = self._free.get(timeout=timeout)
+        return PoolEmulator(self, index, parameters=parameters, initial_conditions=initial_conditions)
+
+    def release(self, emulator):
+        """
+        Returns an emulator to the pool.
+
+        Parameters
+        ----------
+        emulator : PoolEmulator
+            An emulator acquired from this pool.
+
+        """
+
+        if emulator._index is not None:
+            self._free.put(emulator._index)
+            emulator._index = None
+
+    def emulator(self, parameters=None, initial_conditions=None, timeout=None):
+        """
+        Returns a context manager acquiring and releasing an emulator.
+
+        """
+        return _Acquired(self, self.acquire(parameters=parameters, initial_conditions=initial_conditions,
+                                            timeout=timeout))
+
+    def _command(self, index, command, *args):
+        self._connections[index].send((command, args))
+        status, result = self._connections[index].recv()
+        if status == 'error':
+            raise Exception('Error in emulator worker process {}:\n{}'.format(self._processes[index].pid, result))
+        return result
+
+    def close(self):
+        """
+        Stops all worker processes.
+
+        """
+
+        for connection in self._connections:
+            try:
+                connection.send(('close', ()))
+            except Exception:
+                pass
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PoolEmulator(Emulator):
+    """
+    An emulator running the simulations in a worker process of an
+    :code:`EmulatorPool`. The results are kept in this object, the worker only
+    keeps the current state.
+
+    """
+
+    def __init__(self, pool, index, parameters=None, initial_conditions=None):
+        Emulator.__init__(self, pool._inputs[index], parameters=parameters, initial_conditions=initial_conditions)
+        self.pool = pool
+        self.pid = pool._processes[index].pid
+        self._index = index
+
+    def initialize(self):
+        """
+        Resets the worker emulator to its initial conditions, updated with the
+        parameters and initial conditions of this object.
+
+        """
+
+        res = self.pool._command(self._index, 'initialize', self.parameters, self.initial_conditions)
+        self.res = {}
+        for key in res:
+            self.res[key] = np.array(res[key])
+
+    def __call__(self, time, input):
+        """
+        Simulates the system in the worker process and updates the results
+        dictionary.
+
+        """
+
+        res = self.pool._command(self._index, 'call', time, input)
+        for key in res:
+            if key in self.res and len(res[key]) == len(time) and len(time) > 1:
+                self.res[key] = np.append(self.res[key][:-1], res[key])
+            else:
+                self.res[key] = res[key]
+        return self.res
+
+    def savestate(self):
+        return self.pool._command(self._index, 'savestate')
+
+    def loadstate(self, state):
+        # the worker emulator is set to the last sample of the restored results
+        tail = {key: self.res[key][-1:] for key in self.res}
+        self.pool._command(self._index, 'loadstate', tail, self.parameters, state)
+
+    def fork(self):
+        raise Exception('Forking is not supported by the PoolEmulator, acquire another emulator from the pool')
+
+
+class _Acquired(object):
+    def __init__(self, pool, emulator):
+        self.pool = pool
+        self.emulator = emulator
+
+    def __enter__(self):
+        return self.emulator
+
+    def __exit__(self, *args):
+        self.pool.release(self.emulator)
+
+
+def _pool_worker(connection, factory):
+    try:
+        emulator = factory()
+        parameters = dict(emulator.parameters)
+        initial_conditions = dict(emulator.initial_conditions)
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
+        return
+    connection.send(('ok', list(emulator.inputs)))
+
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            break
+        if command == 'close':
+            break
+
+        try:
+            if command == 'initialize':
+                emulator.parameters = dict(parameters)
+                emulator.parameters.update(args[0])
+                emulator.initial_conditions = dict(initial_conditions)
+                emulator.initial_conditions.update(args[1])
+                emulator.initialize()
+                result = emulator.res
+
+            elif command == 'call':
+                time, input = args
+                emulator(time, input)
+                # return the results of this call and only keep the last sample in the worker
+                result = {}
+                for key in emulator.res:
+                    if len(emulator.res[key]) >= len(time):
+                        result[key] = emulator.res[key][-len(time):]
+                    else:
+                        result[key] = emulator.res[key]
+                    emulator.res[key] = emulator.res[key][-1:].copy()
+
+            elif command == 'savestate':
+                result = emulator.savestate()
+
+            elif command == 'loadstate':
+                tail, overrides, state = args
+                emulator.parameters = dict(parameters)
+                emulator.parameters.update(overrides)
+                emulator.res = {key: np.array(tail[key]) for key in tail}
+                emulator.loadstate(state)
+                result = None
+            else:
+                raise Exception('Unknown command {}'.format(command))
+
+            connection.send(('ok', result))
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+
+
+class _Statistics(object):
+    """
+    Streaming mean, standard deviation, extrema and quantiles of arrays.
+
+    """
+
+    def __init__(self, quantiles):
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+        self.quantiles = [_P2Quantile(p) for p in quantiles]
+
+    def add(self, value):
+        self.n += 1
+        if self.n == 1:
+            self.mean = value.copy()
+            self.m2 = np.zeros_like(value)
+            self.min = value.copy()
+            self.max = value.copy()
+        else:
+            # Welford's algorithm
+            delta = value-self.mean
+            self.mean += delta/self.n
+            self.m2 += delta*(value-self.mean)
+            self.min = np.minimum(self.min, value)
+            self.max = np.maximum(self.max, value)
+        for quantile in self.quantiles:
+            quantile.add(value)
+
+    def result(self):
+        std = np.zeros_like(self.mean)
+        if self.n > 1:
+            std = np.sqrt(self.m2/(self.n-1))
+        return {
+            'mean': self.mean, 'std': std, 'min': self.min, 'max': self.max,
+            'quantiles': {quantile.p: quantile.result() for quantile in self.quantiles}
+        }
+
+
+class _P2Quantile(object):
+    """
+    Element-wise streaming quantile estimate of arrays with the P-square
+    algorithm of Jain and Chlamtac, memory does not grow with the number of
+    observations.
+
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.buffer = []
+        self.q = None
+
+    def add(self, x):
+        if self.q is None:
+            self.buffer.append(x)
+            if len(self.buffer) == 5:
+                p = self.p
+                self.q = np.sort(np.array(self.buffer), axis=0)
+                self.n = np.ones_like(self.q)*np.arange(5.).reshape((5,)+(1,)*x.ndim)
+                self.nd = np.ones_like(self.q)*np.array([0., 2*p, 4*p, 2+2*p, 4.]).reshape((5,)+(1,)*x.ndim)
+                self.dn = np.array([0., p/2, p, (1+p)/2, 1.]).reshape((5,)+(1,)*x.ndim)
+                self.buffer = []
+            return
+
+        q = self.q
+        n = self.n
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        k = (x >= q[1]).astype(int) + (x >= q[2]) + (x >= q[3])
+        for i in range(1, 5):
+            n[i] += (i > k)
+        self.nd += self.dn
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(1, 4):
+                d = self.nd[i]-n[i]
+                adjust = ((d >= 1) & (n[i+1]-n[i] > 1)) | ((d <= -1) & (n[i-1]-n[i] < -1))
+                s = np.sign(d)
+                # parabolic prediction
+                qp = q[i] + s/(n[i+1]-n[i-1])*((n[i]-n[i-1]+s)*(q[i+1]-q[i])/(n[i+1]-n[i])
+                                               + (n[i+1]-n[i]-s)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+                # linear prediction
+                ql = np.where(s > 0, q[i] + (q[i+1]-q[i])/(n[i+1]-n[i]), q[i] - (q[i-1]-q[i])/(n[i-1]-n[i]))
+                parabolic = (q[i-1] < qp) & (qp < q[i+1])
+                q[i] = np.where(adjust, np.where(parabolic, qp, ql), q[i])
+                n[i] = np.where(adjust, n[i]+s, n[i])
+
+    def result(self):
+        if self.q is None:
+            return np.percentile(np.array(self.buffer), 100*self.p, axis=0)
+        return self.q[2].copy()
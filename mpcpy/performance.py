@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import numpy as np
+
+from .disturbances import interp_zoh
+
+
+class Performance(object):
+    """
+    Accumulates key performance indicators comparing the control plan with the
+    realized emulator results every receding step of an MPC simulation.
+
+    For every step only a few numbers per key are stored, so the summary is
+    available as soon as the simulation finishes.
+
+    """
+
+    def __init__(self, keys=None, constraints=None, costs=None, zoh_keys=None):
+        """
+        Parameters
+        ----------
+        keys : list of strings, optional
+            Keys of which the plan is compared with the realization. Defaults
+            to all keys in both the control solution and the results.
+
+        constraints : dict, optional
+            Dictionary with a result key as key and a tuple of a lower and
+            upper bound as value. Bounds can be None, a number or a key of the
+            disturbances.
+
+        costs : dict, optional
+            Dictionary with a cost name as key and a tuple of a result key and a
+            price as value. The price can be a number or a key of the
+            disturbances, the cost is the time integral of price times value.
+
+        zoh_keys : list of strings, optional
+            Keys of which the plan is interpolated with zero order hold, all
+            other keys are interpolated linearly.
+
+        Examples
+        --------
+        >>> performance = Performance(keys=['T_in'], constraints={'T_in': ('T_in_min', None)},
+        ...                           costs={'energy': ('Q_flow_hp', 'p_el')})
+        >>> mpc = MPC(emulator, control, disturbances, performance=performance)
+        >>> res = mpc()
+        >>> print(performance.report())
+
+        """
+
+        self.keys = keys
+
+        self.constraints = {}
+        if not constraints is None:
+            self.constraints = constraints
+
+        self.costs = {}
+        if not costs is None:
+            self.costs = costs
+
+        self.zoh_keys = []
+        if not zoh_keys is None:
+            self.zoh_keys = zoh_keys
+
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all accumulated values, called at the start of an MPC
+        simulation.
+
+        """
+
+        self.steps = {'time': [], 'duration': []}
+        self.tracking = {}
+        self.violation = {}
+        self.cost = {}
+
+    def _value(self, value, res, disturbances):
+        if value is None or not isinstance(value, str):
+            return value
+        elif value in res:
+            return res[value]
+        else:
+            return disturbances.interp(value, res['time'])
+
+    def update(self, plan, res, disturbances):
+        """
+        Adds the indicators of a single receding step.
+
+        Parameters
+        ----------
+        plan : dict
+            The control solution used during the step.
+
+        res : dict
+            The realized results during the step, 'time' must be a key.
+
+        disturbances : mpcpy.Disturbances
+            The disturbances, used for bounds and prices.
+
+        """
+
+        time = res['time']
+        dt = np.diff(time)
+
+        def integral(value):
+            return np.sum(0.5*(value[1:]+value[:-1])*dt)
+
+        self.steps['time'].append(time[0])
+        self.steps['duration'].append(time[-1]-time[0])
+
+        # tracking errors
+        keys = self.keys
+        if keys is None:
+            keys = [key for key in plan if key != 'time' and key in res]
+        for key in keys:
+            value = np.asarray(plan[key])
+            if value.ndim != 1 or not key in res:
+                continue
+            if key in self.zoh_keys:
+                planned = interp_zoh(time, plan['time'], value)
+            else:
+                planned = np.interp(time, plan['time'][:len(value)], value)
+            error = res[key]-planned
+
+            if not key in self.tracking:
+                self.tracking[key] = {'squared': [], 'max': []}
+            self.tracking[key]['squared'].append(integral(error**2))
+            self.tracking[key]['max'].append(np.max(np.abs(error)))
+
+        # constraint violations
+        for key in self.constraints:
+            lower = self._value(self.constraints[key][0], res, disturbances)
+            upper = self._value(self.constraints[key][1], res, disturbances)
+            violation = np.zeros_like(time)
+            if lower is not None:
+                violation = np.maximum(violation, lower-res[key])
+            if upper is not None:
+                violation = np.maximum(violation, res[key]-upper)
+
+            if not key in self.violation:
+                self.violation[key] = {'integral': [], 'max': []}
+            self.violation[key]['integral'].append(integral(violation))
+            self.violation[key]['max'].append(np.max(violation))
+
+        # costs
+        for name in self.costs:
+            key, price = self.costs[name]
+            price = self._value(price, res, disturbances)
+
+            if not name in self.cost:
+                self.cost[name] = []
+            self.cost[name].append(integral(price*res[key]))
+
+    def summary(self):
+        """
+        Returns a summary of all indicators.
+
+        Returns
+        -------
+        dict
+            Dictionary with the root mean square and maximum tracking error
+            per key, the time integral and maximum of the constraint violation
+            per key and the total costs.
+
+        """
+
+        duration = np.sum(self.steps['duration'])
+        summary = {'steps': len(self.steps['time']), 'duration': duration, 'tracking': {}, 'violation': {}, 'cost': {}}
+        for key in self.tracking:
+            summary['tracking'][key] = {
+                'rmse': np.sqrt(np.sum(self.tracking[key]['squared'])/duration),
+                'max': np.max(self.tracking[key]['max']),
+            }
+        for key in self.violation:
+            summary['violation'][key] = {
+                'integral': np.sum(self.violation[key]['integral']),
+                'max': np.max(self.violation[key]['max']),
+                'steps': int(np.sum(np.array(self.violation[key]['max']) > 0)),
+            }
+        for name in self.cost:
+            summary['cost'][name] = np.sum(self.cost[name])
+        return summary
+
+    def report(self):
+        """
+        Returns a printable summary of all indicators.
+
+        """
+
+        summary = self.summary()
+        lines = ['{} steps, {} s'.format(summary['steps'], summary['duration'])]
+        for key in sorted(summary['tracking']):
+            lines.append('tracking {}: rmse {:.4g}, max {:.4g}'.format(
+                key, summary['tracking'][key]['rmse'], summary['tracking'][key]['max']))
+        for key in sorted(summary['violation']):
+            lines.append('violation {}: integral {:.4g}, max {:.4g}, {} steps'.format(
+                key, summary['violation'][key]['integral'], summary['violation'][key]['max'],
+                summary['violation'][key]['steps']))
+        for name in sorted(summary['cost']):
+            lines.append('cost {}: {:.4g}'.format(name, summary['cost'][name]))
+        return '\n'.join(lines)
@@ -17,7 +17,6 @@
 #    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
 
-import sys
 import numpy as np
 
 class Prediction(object):
@@ -64,6 +63,397 @@ class Prediction(object):
         """
         return self.boundaryconditions(time)
 
-        
+    def reset(self):
+        """
+        Called at the start of an MPC simulation. Can be redefined in a child
+        class to clear the state of the prediction algorithm.
+
+        """
+        pass
+
     def __call__(self,time):
-        return self.prediction(time)
\ No newline at end of file
+        return self.prediction(time)
+
+class OnlinePrediction(Prediction):
+    """
+    Base class for forecasts which are updated recursively with measurements.
+
+    Every call, the measurements since the previous call are taken from the
+    boundary conditions at a fixed sample interval and passed one by one to the
+    :code:`update` method, so the cost per step does not grow with the length
+    of the simulation. The forecast keys are then computed over the horizon by
+    the :code:`forecast` method, all other keys are perfect predictions. The
+    first value of a forecast is the measurement at the start of the horizon.
+
+    """
+
+    def __init__(self, boundaryconditions, keys, timestep=900., warmup=0., parameters=None):
+        """
+        Parameters
+        ----------
+        boundaryconditions: mpcpy.Disturbances
+            An :code:`mpcpy.Disturbances` object from which the measurements
+            and the perfect predictions of the other keys are taken.
+
+        keys : list of strings
+            The keys which are forecast.
+
+        timestep : number, optional
+            Time between measurements.
+
+        warmup : number, optional
+            Duration of the history which is used to initialize the forecast
+            during the first call.
+
+        parameters : dict
+            A dictionary of parameters used by the prediction algorithm.
+
+        """
+
+        Prediction.__init__(self, boundaryconditions, parameters=parameters)
+        self.keys = keys
+        self.timestep = timestep
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the state of the forecast, called at the start of an MPC
+        simulation.
+
+        """
+
+        self._lasttime = None
+
+    def update(self, key, time, value):
+        """
+        Must be redefined in a child class to update the state of the forecast
+        of a key with a single measurement.
+
+        Parameters
+        ----------
+        key : string
+            The key.
+
+        time : number
+            The time of the measurement.
+
+        value : number
+            The measured value.
+
+        """
+
+        raise NotImplementedError('the update method must be redefined in a child class')
+
+    def forecast(self, key, time):
+        """
+        Must be redefined in a child class to return the forecast of a key.
+
+        Parameters
+        ----------
+        key : string
+            The key.
+
+        time : np.array
+            The times at which the forecast is required, the first value is
+            the time of the last measurement.
+
+        Returns
+        -------
+        np.array
+            The forecast values.
+
+        """
+
+        raise NotImplementedError('the forecast method must be redefined in a child class')
+
+    def prediction(self, time):
+        time = np.atleast_1d(np.asarray(time, dtype=float))
+
+        # measurements since the previous call
+        if self._lasttime is None:
+            start = max(time[0]-self.warmup, self.boundaryconditions.data['time'][0])
+            samples = np.arange(start, time[0]+0.01*self.timestep, self.timestep)
+        else:
+            samples = np.arange(self._lasttime+self.timestep, time[0]+0.01*self.timestep, self.timestep)
+        if len(samples) > 0:
+            self._lasttime = samples[-1]
+            for key in self.keys:
+                for t, value in zip(samples, self.boundaryconditions.interp(key, samples)):
+                    self.update(key, t, value)
+
+        prediction = self.boundaryconditions(time)
+        for key in self.keys:
+            value = self.forecast(key, time)
+            value[0] = prediction[key][0]
+            prediction[key] = value
+        return prediction
+
+
+class RLSPrediction(OnlinePrediction):
+    """
+    Linear regression on Fourier terms of the time and optional regressors,
+    fitted with recursive least squares with exponential forgetting.
+
+    """
+
+    def __init__(self, boundaryconditions, keys, periods=(24*3600.,), harmonics=2, regressors=None,
+                 forgetting=0.999, timestep=900., warmup=0., parameters=None):
+        """
+        Parameters
+        ----------
+        boundaryconditions: mpcpy.Disturbances
+            An :code:`mpcpy.Disturbances` object from which the measurements
+            and the perfect predictions of the other keys are taken.
+
+        keys : list of strings
+            The keys which are forecast.
+
+        periods : list of numbers, optional
+            Periods of the Fourier terms, e.g. a day and a week.
+
+        harmonics : int, optional
+            Number of harmonics per period.
+
+        regressors : list of strings, optional
+            Keys of the boundary conditions used as regressors, which are
+            perfectly predicted over the horizon.
+
+        forgetting : number, optional
+            Forgetting factor, 1 weighs all measurements equally.
+
+        timestep : number, optional
+            Time between measurements.
+
+        warmup : number, optional
+            Duration of the history which is used to initialize the forecast
+            during the first call.
+
+        parameters : dict
+            A dictionary of parameters used by the prediction algorithm.
+
+        Examples
+        --------
+        >>> prediction = RLSPrediction(disturbances, ['Q_flow_int'], periods=[24*3600., 7*24*3600.],
+        ...                            regressors=['T_am'], warmup=7*24*3600.)
+        >>> control = MyControl(stateestimation, prediction)
+
+        """
+
+        self.periods = periods
+        self.harmonics = harmonics
+        self.regressors = []
+        if regressors is not None:
+            self.regressors = regressors
+        self.forgetting = forgetting
+        OnlinePrediction.__init__(self, boundaryconditions, keys, timestep=timestep, warmup=warmup,
+                                  parameters=parameters)
+
+    def reset(self):
+        OnlinePrediction.reset(self)
+        n = 1 + 2*len(self.periods)*self.harmonics + len(self.regressors)
+        self.theta = {key: np.zeros(n) for key in self.keys}
+        self.covariance = {key: 1e6*np.eye(n) for key in self.keys}
+
+    def features(self, time):
+        """
+        Returns the regression features.
+
+        Parameters
+        ----------
+        time : np.array
+            Times at which the features are required.
+
+        Returns
+        -------
+        np.array
+            Features with shape (len(time), number of features).
+
+        """
+
+        time = np.atleast_1d(time)
+        features = [np.ones_like(time)]
+        for period in self.periods:
+            for k in range(1, self.harmonics+1):
+                features.append(np.sin(2*np.pi*k*time/period))
+                features.append(np.cos(2*np.pi*k*time/period))
+        for key in self.regressors:
+            features.append(self.boundaryconditions.interp(key, time))
+        return np.array(features).T
+
+    def update(self, key, time, value):
+        phi = self.features(time)[0]
+        P = self.covariance[key]
+        Pphi = P.dot(phi)
+        gain = Pphi/(self.forgetting + phi.dot(Pphi))
+        self.theta[key] = self.theta[key] + gain*(value-phi.dot(self.theta[key]))
+        self.covariance[key] = (P-np.outer(gain, Pphi))/self.forgetting
+
+    def forecast(self, key, time):
+        return self.features(time).dot(self.theta[key])
+
+
+class ExponentialSmoothingPrediction(OnlinePrediction):
+    """
+    Additive Holt-Winters exponential smoothing with a level, a trend and an
+    optional seasonal component.
+
+    """
+
+    def __init__(self, boundaryconditions, keys, alpha=0.3, beta=0.05, gamma=0.1, period=None, damping=1.,
+                 timestep=900., warmup=0., parameters=None):
+        """
+        Parameters
+        ----------
+        boundaryconditions: mpcpy.Disturbances
+            An :code:`mpcpy.Disturbances` object from which the measurements
+            and the perfect predictions of the other keys are taken.
+
+        keys : list of strings
+            The keys which are forecast.
+
+        alpha : number, optional
+            Smoothing factor of the level.
+
+        beta : number, optional
+            Smoothing factor of the trend.
+
+        gamma : number, optional
+            Smoothing factor of the seasonal component.
+
+        period : number, optional
+            Period of the seasonal component, a multiple of the timestep. No
+            seasonal component is used when omitted.
+
+        damping : number, optional
+            Damping factor of the trend per timestep.
+
+        timestep : number, optional
+            Time between measurements.
+
+        warmup : number, optional
+            Duration of the history which is used to initialize the forecast
+            during the first call.
+
+        parameters : dict
+            A dictionary of parameters used by the prediction algorithm.
+
+        Examples
+        --------
+        >>> prediction = ExponentialSmoothingPrediction(disturbances, ['T_am'], period=24*3600., warmup=7*24*3600.)
+
+        """
+
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.period = period
+        self.damping = damping
+        OnlinePrediction.__init__(self, boundaryconditions, keys, timestep=timestep, warmup=warmup,
+                                  parameters=parameters)
+
+    def reset(self):
+        OnlinePrediction.reset(self)
+        m = 1
+        if self.period is not None:
+            m = int(round(self.period/self.timestep))
+        self.state = {key: {'level': None, 'trend': 0., 'season': np.zeros(m), 'time': None} for key in self.keys}
+
+    def _slot(self, time):
+        return np.floor(np.asarray(time)/self.timestep+1e-6).astype(int) % len(self.state[self.keys[0]]['season'])
+
+    def update(self, key, time, value):
+        state = self.state[key]
+        slot = self._slot(time)
+        season = state['season']
+        if state['level'] is None:
+            state['level'] = value
+        else:
+            level = state['level']
+            state['level'] = self.alpha*(value-season[slot]) + (1-self.alpha)*(level+self.damping*state['trend'])
+            state['trend'] = self.beta*(state['level']-level) + (1-self.beta)*self.damping*state['trend']
+            if self.period is not None:
+                season[slot] = self.gamma*(value-state['level']) + (1-self.gamma)*season[slot]
+        state['time'] = time
+
+    def forecast(self, key, time):
+        state = self.state[key]
+        h = np.maximum((np.asarray(time)-state['time'])/self.timestep, 0.)
+        if self.damping == 1.:
+            trend = h
+        else:
+            trend = self.damping*(1-self.damping**h)/(1-self.damping)
+        return np.array([np.ones_like(h), trend]).T.dot([state['level'], state['trend']]) \
+            + state['season'][self._slot(time)]
+
+
+class SeasonalNaivePrediction(OnlinePrediction):
+    """
+    Forecasts the value one period earlier, corrected with an exponentially
+    smoothed bias of the seasonal naive forecast errors.
+
+    """
+
+    def __init__(self, boundaryconditions, keys, period=24*3600., smoothing=0.05, timestep=900., warmup=None,
+                 parameters=None):
+        """
+        Parameters
+        ----------
+        boundaryconditions: mpcpy.Disturbances
+            An :code:`mpcpy.Disturbances` object from which the measurements
+            and the perfect predictions of the other keys are taken.
+
+        keys : list of strings
+            The keys which are forecast.
+
+        period : number, optional
+            The period, a multiple of the timestep.
+
+        smoothing : number, optional
+            Smoothing factor of the bias.
+
+        timestep : number, optional
+            Time between measurements.
+
+        warmup : number, optional
+            Duration of the history which is used to initialize the forecast
+            during the first call, defaults to the period.
+
+        parameters : dict
+            A dictionary of parameters used by the prediction algorithm.
+
+        Examples
+        --------
+        >>> prediction = SeasonalNaivePrediction(disturbances, ['Q_flow_int'], period=7*24*3600.)
+
+        """
+
+        self.period = period
+        self.smoothing = smoothing
+        if warmup is None:
+            warmup = period
+        OnlinePrediction.__init__(self, boundaryconditions, keys, timestep=timestep, warmup=warmup,
+                                  parameters=parameters)
+
+    def reset(self):
+        OnlinePrediction.reset(self)
+        m = int(round(self.period/self.timestep))
+        # ring buffer with the values of the last period
+        self.buffer = {key: np.nan*np.ones(m) for key in self.keys}
+        self.bias = {key: 0. for key in self.keys}
+
+    def _slot(self, time):
+        return np.floor(np.asarray(time)/self.timestep+1e-6).astype(int) % len(self.buffer[self.keys[0]])
+
+    def update(self, key, time, value):
+        slot = self._slot(time)
+        previous = self.buffer[key][slot]
+        if not np.isnan(previous):
+            self.bias[key] += self.smoothing*(value-previous-self.bias[key])
+        self.buffer[key][slot] = value
+
+    def forecast(self, key, time):
+        value = self.buffer[key][self._slot(time)] + self.bias[key]
+        # slots without measurements hold the last measurement
+        last = self.buffer[key][self._slot(self._lasttime)]
+        return np.where(np.isnan(value), last, value)
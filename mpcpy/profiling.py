@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import tracemalloc
+import numpy as np
+
+
+class MemoryProfiler(object):
+    """
+    Records the memory allocated in the phases of the receding steps of an MPC
+    simulation with :code:`tracemalloc`, and the size of the emulator results
+    and the saved control solutions.
+
+    For every phase the peak allocation, the maximum memory allocated above the
+    memory at the start of the phase, and the retained allocation, the memory
+    still allocated at the end of the phase, are recorded. The phases are
+    'control', with the nested 'prediction' and 'solution' phases, 'input' for
+    the assembly of the emulator inputs and 'emulator' for the simulation and
+    the merge of the results.
+
+    """
+
+    def __init__(self, every=1):
+        """
+        Parameters
+        ----------
+        every : int, optional
+            Only every n-th step is profiled. Tracing is then stopped between
+            profiled steps, which reduces the overhead but only measures the
+            retained allocation within a step.
+
+        Examples
+        --------
+        >>> profiler = MemoryProfiler(every=10)
+        >>> mpc = MPC(emulator, control, disturbances, profiler=profiler)
+        >>> res = mpc()
+        >>> print(profiler.report())
+
+        """
+
+        self.every = every
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all recorded values.
+
+        """
+
+        self.phases = {}
+        self.sizes = {'time': []}
+        self.active = False
+        self._step = 0
+        self._stack = []
+        self._tracing = False
+
+    def start(self):
+        """
+        Starts tracing, called at the start of an MPC simulation.
+
+        """
+
+        self.reset()
+        if self.every == 1:
+            self._trace()
+
+    def stop(self):
+        """
+        Stops tracing, called at the end of an MPC simulation.
+
+        """
+
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        self.active = False
+
+    def _trace(self):
+        # tracing started by the user is not stopped
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def begin(self):
+        """
+        Marks the start of a receding step.
+
+        """
+
+        self.active = self._step % self.every == 0
+        self._step += 1
+        if self.active:
+            self._trace()
+
+    def end(self, time, **sizes):
+        """
+        Marks the end of a receding step.
+
+        Parameters
+        ----------
+        time : number
+            The time of the step.
+
+        **sizes :
+            Sizes in bytes of objects at the end of the step.
+
+        """
+
+        if not self.active:
+            return
+        self.sizes['time'].append(time)
+        for name in sizes:
+            if not name in self.sizes:
+                self.sizes[name] = []
+            self.sizes[name].append(sizes[name])
+        if self.every > 1 and self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def phase(self, name):
+        """
+        Returns a context manager recording the allocations of a phase.
+
+        Parameters
+        ----------
+        name : string
+            The name of the phase.
+
+        """
+
+        return _Phase(self, name)
+
+    def _enter(self, name):
+        if not self.active or not tracemalloc.is_tracing():
+            self._stack.append(None)
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack and self._stack[-1] is not None:
+            # keep the peak of the enclosing phase
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+        tracemalloc.reset_peak()
+        self._stack.append([name, current, current])
+
+    def _exit(self):
+        entry = self._stack.pop()
+        if entry is None or not tracemalloc.is_tracing():
+            return
+        name, start, peak = entry
+        current, tracedpeak = tracemalloc.get_traced_memory()
+        peak = max(peak, tracedpeak)
+        if self._stack and self._stack[-1] is not None:
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+
+        if not name in self.phases:
+            self.phases[name] = {'peak': [], 'retained': []}
+        self.phases[name]['peak'].append(peak-start)
+        self.phases[name]['retained'].append(current-start)
+
+    def summary(self):
+        """
+        Returns a summary of the recorded values.
+
+        Returns
+        -------
+        dict
+            Dictionary with per phase the number of profiled calls, the mean and
+            maximum peak allocation and the total and maximum retained
+            allocation, and per size the last and maximum value, all in bytes.
+
+        """
+
+        summary = {'steps': len(self.sizes['time']), 'phases': {}, 'sizes': {}}
+        for name in self.phases:
+            peak = np.array(self.phases[name]['peak'])
+            retained = np.array(self.phases[name]['retained'])
+            summary['phases'][name] = {'calls': len(peak), 'peak_mean': np.mean(peak), 'peak_max': np.max(peak),
+                                       'retained_total': np.sum(retained), 'retained_max': np.max(retained)}
+        for name in self.sizes:
+            if name != 'time' and len(self.sizes[name]) > 0:
+                summary['sizes'][name] = {'last': self.sizes[name][-1], 'max': np.max(self.sizes[name])}
+        return summary
+
+    def report(self):
+        """
+        Returns a printable summary of the recorded values.
+
+        """
+
+        summary = self.summary()
+        lines = ['{} profiled steps'.format(summary['steps'])]
+        for name in sorted(summary['phases']):
+            phase = summary['phases'][name]
+            lines.append('phase {}: {} calls, peak mean {}, peak max {}, retained total {}, retained max {}'.format(
+                name, phase['calls'], _format(phase['peak_mean']), _format(phase['peak_max']),
+                _format(phase['retained_total']), _format(phase['retained_max'])))
+        for name in sorted(summary['sizes']):
+            lines.append('size {}: last {}, max {}'.format(
+                name, _format(summary['sizes'][name]['last']), _format(summary['sizes'][name]['max'])))
+        return '\n'.join(lines)
+
+
+class _Phase(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+
+    def __exit__(self, *args):
+        self.profiler._exit()
+
+
+def nbytes(value):
+    """
+    Returns the total size in bytes of the arrays in a dictionary or list of
+    dictionaries.
+
+    """
+
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    else:
+        return np.asarray(value).nbytes
+
+
+def _format(value):
+    for unit in ['B', 'kB', 'MB']:
+        if abs(value) < 1024:
+            return '{:.1f} {}'.format(value, unit)
+        value = value/1024.
+    return '{:.1f} GB'.format(value)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import asyncio
+import heapq
+import inspect
+import time as _time
+import numpy as np
+
+
+class MonotonicClock(object):
+    """
+    Wall clock based on :code:`time.monotonic`, used to run controls against
+    real systems.
+
+    """
+
+    def time(self):
+        return _time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(max(seconds, 0.))
+
+    async def run_until(self, time):
+        """
+        Waits until the clock reaches a time.
+
+        """
+
+        await asyncio.sleep(max(time-self.time(), 0.))
+
+
+class SimulatedClock(object):
+    """
+    Discrete event clock for testing real-time controls offline.
+
+    The clock does not advance by itself but jumps to the next wake up time
+    when the scheduler waits, so a day of control steps runs in a fraction of a
+    second. The wall-clock time spent by solutions is not added to the clock.
+
+    """
+
+    def __init__(self, starttime=0.):
+        """
+        Parameters
+        ----------
+        starttime : number, optional
+            The initial time of the clock.
+
+        """
+
+        self.now = starttime
+        self._waiters = []
+        self._count = 0
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self._count += 1
+        heapq.heappush(self._waiters, (self.now+max(seconds, 0.), self._count, future))
+        await future
+
+    async def run_until(self, time):
+        """
+        Advances the clock to a time, waking up all sleeping tasks in order.
+
+        """
+
+        while self._waiters and self._waiters[0][0] <= time:
+            wakeup, count, future = heapq.heappop(self._waiters)
+            self.now = max(self.now, wakeup)
+            if not future.done():
+                future.set_result(None)
+            # let the woken task run up to its next await
+            await asyncio.sleep(0)
+        self.now = max(self.now, time)
+
+
+class Measurements(object):
+    """
+    Bounded history of acquired measurements.
+
+    The history is available in the :code:`res` attribute with the same layout
+    as the results of an emulator, so a state estimation written for an
+    emulator can be used on measurements by passing a :code:`Measurements`
+    object instead of the emulator.
+
+    """
+
+    def __init__(self, history=1000):
+        """
+        Parameters
+        ----------
+        history : int, optional
+            Maximum number of samples kept.
+
+        Examples
+        --------
+        >>> measurements = Measurements()
+        >>> stateestimation = MyStateestimation(measurements)
+
+        """
+
+        self.history = history
+        self.res = {}
+
+    def append(self, time, values):
+        """
+        Adds a sample.
+
+        Parameters
+        ----------
+        time : number
+            Time of the sample.
+
+        values : dict
+            Dictionary with the measured values.
+
+        """
+
+        # the new dictionary is assigned at once, a state estimation in another thread always sees equal lengths
+        old = self.res
+        length = len(old['time']) if 'time' in old else 0
+
+        res = {'time': np.append(old.get('time', np.zeros(0)), time)}
+        for key in set(old.keys()) | set(values.keys()):
+            if key == 'time':
+                continue
+            # keys which are missing in a sample or were added later are padded with nan
+            value = values.get(key, np.nan)
+            res[key] = np.append(old.get(key, np.nan*np.ones(length)), value)
+            if len(res[key]) > self.history:
+                res[key] = res[key][-self.history:]
+        if len(res['time']) > self.history:
+            res['time'] = res['time'][-self.history:]
+
+        self.res = res
+
+
+class RealtimeMPC(object):
+    """
+    Runs a control object every receding step against a real system.
+
+    Solutions are started at fixed times on a monotonic clock. When a solution
+    is not finished before the deadline the last solution, shifted to the new
+    starttime, is applied instead and no new solution is started until the
+    running one has finished. Measurements are acquired concurrently on the
+    asyncio event loop.
+
+    """
+
+    def __init__(self, control, interval=None, acquire=None, apply=None, clock=None, deadline=None,
+                 starttime=0., measurements=None, acquisitioninterval=None, maxacquisitionerrors=None):
+        """
+        Parameters
+        ----------
+        control : mpcpy.Control
+            The control object.
+
+        interval : number, optional
+            Time between solutions, defaults to the receding time of the
+            control.
+
+        acquire : coroutine function, optional
+            Called as :code:`await acquire(time)` and returns a dictionary with
+            measurements, which are added to :code:`measurements`.
+
+        apply : function, optional
+            Called as :code:`apply(time, solution)` to send the solution to the
+            system, can be a coroutine function.
+
+        clock : MonotonicClock or SimulatedClock, optional
+            The clock, defaults to a :code:`MonotonicClock`.
+
+        deadline : number, optional
+            Wall-clock time in seconds after the scheduled time at which a
+            solution must be available, defaults to half the interval. With a
+            simulated clock the deadline is still applied in wall-clock
+            seconds. The first solution is always awaited.
+
+        starttime : number, optional
+            Control time of the first solution. The control time of later
+            solutions is incremented by the interval.
+
+        measurements : Measurements, optional
+            Object to which the acquired measurements are added.
+
+        acquisitioninterval : number, optional
+            Time between measurements, defaults to the interval.
+
+        maxacquisitionerrors : int, optional
+            Number of consecutive failed acquisitions after which the run is
+            aborted. By default errors are only logged and counted and the
+            acquisition continues.
+
+        Examples
+        --------
+        >>> measurements = Measurements()
+        >>> control = MyControl(MyStateestimation(measurements), prediction, horizon=24*3600., timestep=900.)
+        >>> mpc = RealtimeMPC(control, acquire=read_sensors, apply=write_setpoints, measurements=measurements)
+        >>> mpc()
+
+        """
+
+        self.control = control
+
+        self.interval = interval
+        if self.interval is None:
+            self.interval = control.receding
+
+        self.acquire = acquire
+        self.apply = apply
+
+        self.clock = clock
+        if self.clock is None:
+            self.clock = MonotonicClock()
+
+        self.deadline = deadline
+        if self.deadline is None:
+            self.deadline = 0.5*self.interval
+
+        self.starttime = starttime
+
+        self.measurements = measurements
+        if self.measurements is None:
+            self.measurements = Measurements()
+
+        self.acquisitioninterval = acquisitioninterval
+        if self.acquisitioninterval is None:
+            self.acquisitioninterval = self.interval
+
+        self.maxacquisitionerrors = maxacquisitionerrors
+
+        self.metrics = {'time': [], 'jitter': [], 'latency': [], 'status': [], 'acquisitionerrors': []}
+        self._pending = None
+        self._stopped = False
+
+    def stop(self):
+        """
+        Stops the scheduler after the current step.
+
+        """
+
+        self._stopped = True
+
+    async def _acquisition(self, clockstart, main):
+        errors = 0
+        while True:
+            now = self.clock.time()
+            time = self.starttime+now-clockstart
+            try:
+                values = await self.acquire(time)
+            except Exception as e:
+                print('Warning: error "{}" in the acquisition at time {}'.format(e, time))
+                self.metrics['acquisitionerrors'].append(time)
+                errors += 1
+                if self.maxacquisitionerrors is not None and errors > self.maxacquisitionerrors:
+                    # abort the scheduler immediately
+                    self._acquisitionerror = e
+                    main.cancel()
+                    return
+            else:
+                errors = 0
+                self.measurements.append(time, values)
+            await self.clock.sleep(now+self.acquisitioninterval-self.clock.time())
+
+    async def _solve(self, executor, time):
+        loop = asyncio.get_running_loop()
+
+        if self._pending is not None and not self._pending.done():
+            # the previous solution has not finished yet
+            return self.control.fallbacksolution(time), 'skipped'
+
+        self._pending = loop.run_in_executor(executor, self.control, time)
+        try:
+            if self.control._lastsolution is None:
+                solution = await self._pending
+            else:
+                solution = await asyncio.wait_for(asyncio.shield(self._pending), self.deadline)
+        except asyncio.TimeoutError:
+            print('Warning: solution deadline exceeded at time {}, using the last solution'.format(time))
+            return self.control.fallbacksolution(time), 'timeout'
+        except Exception as e:
+            if self.control._lastsolution is None:
+                raise
+            print('Warning: error "{}" in the solution at time {}, using the last solution'.format(e, time))
+            return self.control.fallbacksolution(time), 'failure'
+
+        return solution, 'solution'
+
+    async def run(self, steps=None):
+        """
+        Runs the scheduler.
+
+        Parameters
+        ----------
+        steps : int, optional
+            Number of solutions after which the scheduler stops, runs until
+            :code:`stop` is called when omitted.
+
+        """
+
+        # imported here to keep importing mpcpy fast
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        clockstart = self.clock.time()
+        self._stopped = False
+        self._acquisitionerror = None
+
+        acquisition = None
+        if self.acquire is not None:
+            acquisition = asyncio.ensure_future(self._acquisition(clockstart, asyncio.current_task()))
+            # acquire the first measurements before the first solution
+            await asyncio.sleep(0)
+
+        step = 0
+        try:
+            while not self._stopped and (steps is None or step < steps):
+                scheduled = clockstart + step*self.interval
+                await self.clock.run_until(scheduled)
+                jitter = self.clock.time()-scheduled
+                time = self.starttime + step*self.interval
+
+                t0 = _time.perf_counter()
+                solution, status = await self._solve(executor, time)
+                latency = _time.perf_counter()-t0
+
+                if self.apply is not None:
+                    result = self.apply(time, solution)
+                    if inspect.isawaitable(result):
+                        await result
+
+                self.metrics['time'].append(time)
+                self.metrics['jitter'].append(jitter)
+                self.metrics['latency'].append(latency)
+                self.metrics['status'].append(status)
+                step += 1
+        except asyncio.CancelledError:
+            if self._acquisitionerror is None:
+                raise
+            raise Exception('Measurement acquisition failed {} times in a row'.format(
+                self.maxacquisitionerrors+1)) from self._acquisitionerror
+        finally:
+            if acquisition is not None:
+                acquisition.cancel()
+                try:
+                    await acquisition
+                except asyncio.CancelledError:
+                    pass
+            executor.shutdown(wait=False)
+
+    def __call__(self, steps=None):
+        """
+        Runs the scheduler in a new event loop.
+
+        Parameters
+        ----------
+        steps : int, optional
+            Number of solutions after which the scheduler stops.
+
+        """
+
+        asyncio.run(self.run(steps))
+
+    def summary(self):
+        """
+        Returns a summary of the scheduling metrics.
+
+        Returns
+        -------
+        dict
+            Dictionary with the number of steps, the mean and maximum jitter
+            and latency, the number of steps per status and the number of
+            failed acquisitions.
+
+        """
+
+        summary = {'steps': len(self.metrics['time']), 'jitter': {}, 'latency': {}, 'status': {}}
+        for key in ['jitter', 'latency']:
+            if len(self.metrics[key]) > 0:
+                summary[key] = {'mean': np.mean(self.metrics[key]), 'max': np.max(self.metrics[key])}
+        for status in self.metrics['status']:
+            summary['status'][status] = summary['status'].get(status, 0) + 1
+        summary['acquisitionerrors'] = len(self.metrics['acquisitionerrors'])
+        return summary
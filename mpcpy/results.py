@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import glob
+import numpy as np
+
+from collections import deque
+from collections.abc import MutableMapping
+
+
+class LazyResults(MutableMapping):
+    """
+    A results dictionary in which the disturbance columns are only interpolated
+    to the result time vector when they are first accessed.
+
+    Disturbances take precedence over results with the same key, as when all
+    disturbances were interpolated and added to the results.
+
+    """
+
+    def __init__(self, res, disturbances):
+        """
+        Parameters
+        ----------
+        res : dict
+            Dictionary with results, 'time' must be a key.
+
+        disturbances : mpcpy.Disturbances
+            The disturbances object used to compute the missing columns.
+
+        """
+
+        self.disturbances = disturbances
+        self._data = dict(res)
+        self._lazy = []
+        for key in disturbances:
+            if key != 'time':
+                self._lazy.append(key)
+                if key in self._data:
+                    del self._data[key]
+
+    def __getitem__(self, key):
+        if key in self._data:
+            return self._data[key]
+        elif key in self._lazy:
+            # interpolate and cache the value
+            value = self.disturbances.interp(key, self._data['time'])
+            self._data[key] = value
+            self._lazy.remove(key)
+            return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._lazy:
+            self._lazy.remove(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key in self._lazy:
+            self._lazy.remove(key)
+        else:
+            del self._data[key]
+
+    def __contains__(self, item):
+        return item in self._data or item in self._lazy
+
+    def __iter__(self):
+        for key in list(self._data.keys()):
+            yield key
+        for key in list(self._lazy):
+            yield key
+
+    def __len__(self):
+        return len(self._data) + len(self._lazy)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, list(self))
+
+
+class ResultSink(object):
+    """
+    Base class for storing mpc results outside of the :code:`MPC.res`
+    dictionary.
+
+    When a sink is passed to an :code:`mpcpy.MPC` object, the results are
+    written to it after every receding step and only the last result sample is
+    kept in memory. The :code:`open`, :code:`write`, :code:`close` and
+    :code:`__getitem__` methods must be redefined in a child class.
+
+    """
+
+    def open(self):
+        """
+        Called once at the start of an MPC simulation, should clear previously
+        stored results.
+
+        """
+        pass
+
+    def write(self, res):
+        """
+        Store a chunk of results.
+
+        Parameters
+        ----------
+        res : dict
+            Dictionary with result arrays, all arrays have the same length
+            along their first axis as the 'time' array.
+
+        """
+        pass
+
+    def close(self):
+        """
+        Called once at the end of an MPC simulation.
+
+        """
+        pass
+
+    def keys(self):
+        return []
+
+    def __getitem__(self, key):
+        """
+        Returns the complete stored array of a key.
+
+        """
+        raise KeyError(key)
+
+    def __contains__(self, item):
+        return item in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+class NpzSink(ResultSink):
+    """
+    Stores results as a directory of numbered :code:`.npz` chunks, each
+    containing several receding steps.
+
+    """
+
+    def __init__(self, path, chunksize=100):
+        """
+        Parameters
+        ----------
+        path : str
+            Directory in which the chunks are written, it is created when it
+            does not exist.
+
+        chunksize : int, optional
+            Number of receding steps which are buffered in memory and written
+            to a single chunk.
+
+        Examples
+        --------
+        >>> sink = NpzSink('results')
+        >>> mpc = MPC(emulator, control, disturbances, sink=sink)
+        >>> res = mpc()
+        >>> res['T_in']
+
+        """
+
+        self.path = path
+        self.chunksize = chunksize
+        self._count = 0
+        self._keys = []
+        self._buffer = []
+        self._cache = {}
+
+    def _files(self):
+        return sorted(glob.glob(os.path.join(self.path, 'chunk_*.npz')))
+
+    def open(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for filename in self._files():
+            os.remove(filename)
+        self._count = 0
+        self._keys = []
+        self._buffer = []
+        self._cache = {}
+
+    def write(self, res):
+        for key in res:
+            if not key in self._keys:
+                self._keys.append(key)
+        self._buffer.append(res)
+        self._cache = {}
+        if len(self._buffer) >= self.chunksize:
+            self._flush()
+
+    def _flush(self):
+        if len(self._buffer) == 0:
+            return
+        chunk = {}
+        for key in self._keys:
+            values = [res[key] for res in self._buffer if key in res]
+            if len(values) > 0:
+                chunk[key] = np.concatenate(values)
+        np.savez(os.path.join(self.path, 'chunk_{:06d}.npz'.format(self._count)), **chunk)
+        self._count += 1
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+
+    def keys(self):
+        if len(self._keys) == 0:
+            # results written by another object
+            for filename in self._files():
+                with np.load(filename) as data:
+                    for key in data.files:
+                        if not key in self._keys:
+                            self._keys.append(key)
+        return list(self._keys)
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            return self._cache[key]
+        values = []
+        for filename in self._files():
+            with np.load(filename) as data:
+                if key in data.files:
+                    values.append(data[key])
+        values += [res[key] for res in self._buffer if key in res]
+        if len(values) == 0:
+            raise KeyError(key)
+        # the concatenated array is kept until new results are written
+        self._cache[key] = np.concatenate(values)
+        return self._cache[key]
+
+
+class HDF5Sink(ResultSink):
+    """
+    Stores results in resizable datasets of an HDF5 file, requires
+    :code:`h5py`.
+
+    """
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            The HDF5 file, it is overwritten when the simulation starts.
+
+        """
+
+        self.filename = filename
+        self._file = None
+
+    def open(self):
+        import h5py
+
+        self._file = h5py.File(self.filename, 'w')
+
+    def write(self, res):
+        for key in res:
+            value = np.asarray(res[key])
+            if key in self._file:
+                dataset = self._file[key]
+                dataset.resize(dataset.shape[0]+value.shape[0], axis=0)
+                dataset[-value.shape[0]:] = value
+            else:
+                self._file.create_dataset(key, data=value, maxshape=(None,)+value.shape[1:], chunks=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def keys(self):
+        import h5py
+
+        with h5py.File(self.filename, 'r') as f:
+            return list(f.keys())
+
+    def __getitem__(self, key):
+        import h5py
+
+        with h5py.File(self.filename, 'r') as f:
+            if not key in f:
+                raise KeyError(key)
+            return f[key][...]
+
+
+class MultiResolutionSink(ResultSink):
+    """
+    Keeps full-rate results for a bounded recent window and aggregates all
+    results into minimum, mean and maximum values over coarser intervals.
+
+    The memory use is bounded when a duration is given for every level.
+
+    """
+
+    def __init__(self, window=3*24*3600., levels=((3600., None),)):
+        """
+        Parameters
+        ----------
+        window : number, optional
+            Duration of the most recent results which are kept at full rate.
+
+        levels : list of tuples, optional
+            List of (interval, duration) tuples. For each level the results are
+            aggregated over intervals of the given length and aggregates older
+            than the duration are dropped. A duration of None keeps all
+            aggregates of that level.
+
+        Examples
+        --------
+        >>> sink = MultiResolutionSink(window=3*24*3600., levels=[(3600., 30*24*3600.), (24*3600., None)])
+        >>> mpc = MPC(emulator, control, disturbances, emulationtime=365*24*3600., resulttimestep=60, sink=sink)
+        >>> res = mpc()
+        >>> res['T_in']  # the last 3 days
+        >>> res.level(3600.)['T_in']['mean']  # the last 30 days
+
+        """
+
+        self.window = window
+        self.levels = [_Level(interval, duration) for interval, duration in levels]
+        self._recent = {}
+
+    def open(self):
+        self._recent = {}
+        for level in self.levels:
+            level.clear()
+
+    def write(self, res):
+        time = np.asarray(res['time'])
+        if len(time) == 0:
+            return
+
+        # keep the recent results at full rate
+        for key in res:
+            if key in self._recent:
+                self._recent[key] = np.concatenate((self._recent[key], res[key]))
+            else:
+                self._recent[key] = np.array(res[key])
+        ind = np.searchsorted(self._recent['time'], self._recent['time'][-1]-self.window, side='left')
+        if ind > 0:
+            for key in self._recent:
+                self._recent[key] = self._recent[key][ind:]
+
+        for level in self.levels:
+            level.add(res)
+
+    def close(self):
+        for level in self.levels:
+            level.finish()
+
+    def keys(self):
+        return list(self._recent.keys())
+
+    def __getitem__(self, key):
+        return self._recent[key]
+
+    def level(self, interval):
+        """
+        Returns the aggregated results of a level.
+
+        Parameters
+        ----------
+        interval : number
+            The aggregation interval of the level.
+
+        Returns
+        -------
+        dict
+            Dictionary with the start 'time' of each interval and for each key
+            a dictionary with 'min', 'mean' and 'max' arrays. Means are sample
+            means.
+
+        """
+
+        for level in self.levels:
+            if level.interval == interval:
+                return level.result()
+        raise KeyError(interval)
+
+
+class _Level(object):
+    """
+    Running minimum, mean and maximum per interval.
+
+    """
+
+    def __init__(self, interval, duration):
+        self.interval = interval
+        self.maxlen = None
+        if duration is not None:
+            self.maxlen = int(np.ceil(duration/interval))
+        self.clear()
+
+    def clear(self):
+        self.bins = deque(maxlen=self.maxlen)
+        self.aggregates = {}
+        self.current = None
+        self.state = {}
+
+    def add(self, res):
+        time = np.asarray(res['time'])
+        bins = np.floor(time/self.interval).astype(int)
+        starts = np.concatenate(([0], np.where(np.diff(bins) != 0)[0]+1))
+        counts = np.diff(np.append(starts, len(bins)))
+
+        # statistics of each run of samples in the same bin
+        stats = {}
+        for key in res:
+            if key != 'time':
+                value = np.asarray(res[key], dtype=float)
+                stats[key] = (np.minimum.reduceat(value, starts, axis=0), np.add.reduceat(value, starts, axis=0),
+                              np.maximum.reduceat(value, starts, axis=0))
+
+        for i, start in enumerate(starts):
+            if self.current is not None and bins[start] != self.current:
+                self.finish()
+            if self.current is None:
+                self.current = bins[start]
+                self.state = {'count': 0}
+            self.state['count'] += counts[i]
+            for key in stats:
+                vmin, vsum, vmax = stats[key][0][i], stats[key][1][i], stats[key][2][i]
+                if key in self.state:
+                    self.state[key] = (np.minimum(self.state[key][0], vmin), self.state[key][1]+vsum,
+                                       np.maximum(self.state[key][2], vmax))
+                else:
+                    self.state[key] = (vmin, vsum, vmax)
+
+    def finish(self):
+        if self.current is None:
+            return
+        self.bins.append(self.current*self.interval)
+        for key in self.state:
+            if key == 'count':
+                continue
+            if not key in self.aggregates:
+                self.aggregates[key] = deque(maxlen=self.maxlen)
+            vmin, vsum, vmax = self.state[key]
+            self.aggregates[key].append((vmin, vsum/self.state['count'], vmax))
+        self.current = None
+        self.state = {}
+
+    def result(self):
+        result = {'time': np.array(self.bins)}
+        for key in self.aggregates:
+            values = list(self.aggregates[key])
+            result[key] = {
+                'min': np.array([v[0] for v in values]),
+                'mean': np.array([v[1] for v in values]),
+                'max': np.array([v[2] for v in values]),
+            }
+        return result
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import numpy as np
+
+
+class ScenarioTree(object):
+    """
+    Scenario tree built from an ensemble of forecasts by clustering the
+    scenarios stage by stage.
+
+    Scenarios which are similar after a stage share the nodes before it, so a
+    robust control problem only needs variables per tree element instead of
+    per scenario and time step, and the non-anticipativity of the shared
+    decisions holds by construction.
+
+    The tree is stored in flat arrays. Every node covers a range of time
+    indices, every element is a pair of a node and a time index. Variables of a
+    control problem can be indexed by element, the :code:`previous` array links
+    each element to the element at the previous time index on the same path,
+    which is what is needed to write the dynamics.
+
+    Attributes
+    ----------
+    time : np.array
+        The time vector of the ensemble.
+
+    predecessor : np.array
+        The parent node of each node, -1 for the root.
+
+    stage : np.array
+        The stage of each node, 0 for the root.
+
+    probability : np.array
+        The probability of each node.
+
+    start, stop : np.array
+        The range of time indices of each node.
+
+    offset : np.array
+        The first element of each node, node :code:`n` has elements
+        :code:`offset[n]` to :code:`offset[n+1]`.
+
+    elementnode, elementtime : np.array
+        The node and time index of each element.
+
+    previous : np.array
+        The element at the previous time index on the same path, -1 for the
+        first element of the root.
+
+    values : dict
+        Probability weighted mean of the scenarios in a node per element for
+        each key.
+
+    leaves : np.array
+        The leaf nodes.
+
+    scenarioleaf : np.array
+        The leaf node of each scenario.
+
+    paths : np.array
+        The elements of the path to each leaf with shape (number of leaves,
+        number of time steps).
+
+    """
+
+    def __init__(self, ensemble, stages, branching, keys=None, probability=None, iterations=20, seed=None):
+        """
+        Parameters
+        ----------
+        ensemble : dict
+            Dictionary with a 'time' vector and for each key an array with
+            shape (number of scenarios, number of time steps).
+
+        stages : list of ints
+            Time indices at which the tree branches, increasing.
+
+        branching : list of ints
+            Maximum number of children of the nodes at each branching time.
+
+        keys : list of strings, optional
+            Keys used for the clustering, defaults to all keys. All keys are
+            stored in the tree.
+
+        probability : np.array, optional
+            Probability of each scenario, defaults to equal probabilities.
+
+        iterations : int, optional
+            Number of k-means iterations.
+
+        seed : int, optional
+            Seed of the k-means initialization.
+
+        Examples
+        --------
+        >>> tree = ScenarioTree(ensemble, stages=[4, 12], branching=[3, 2])
+        >>> T = model.addVars(tree.elements)  # one variable per element instead of per scenario and time
+        >>> for e in range(tree.elements):
+        ...     if tree.previous[e] >= 0:
+        ...         model.addConstr(T[e] == a*T[tree.previous[e]] + b*tree.values['T_am'][e])
+        >>> tree.root(solution)  # the decisions to apply
+
+        """
+
+        if len(stages) != len(branching):
+            raise Exception('stages and branching must have the same length')
+
+        self.time = np.asarray(ensemble['time'])
+        names = [key for key in ensemble if key != 'time']
+        if keys is None:
+            keys = names
+        data = {key: np.atleast_2d(np.asarray(ensemble[key], dtype=float)) for key in names}
+        nscenarios, nt = data[names[0]].shape
+
+        if probability is None:
+            probability = np.ones(nscenarios)/nscenarios
+        probability = np.asarray(probability, dtype=float)
+
+        bounds = [0] + list(stages) + [nt]
+        rng = np.random.default_rng(seed)
+
+        # scaled features for the clustering
+        features = np.concatenate([(data[key]-np.mean(data[key]))/(np.std(data[key]) or 1.) for key in keys], axis=1)
+        columns = np.concatenate([np.arange(nt) for key in keys])
+
+        # build the nodes stage by stage
+        members = [np.arange(nscenarios)]
+        predecessor = [-1]
+        stage = [0]
+        current = [0]
+        for s in range(len(stages)):
+            selection = columns >= bounds[s+1]
+            children = []
+            for node in current:
+                labels = _kmeans(features[members[node]][:, selection], probability[members[node]], branching[s],
+                                 iterations, rng)
+                for label in np.unique(labels):
+                    members.append(members[node][labels == label])
+                    predecessor.append(node)
+                    stage.append(s+1)
+                    children.append(len(members)-1)
+            current = children
+
+        self.predecessor = np.array(predecessor)
+        self.stage = np.array(stage)
+        self.probability = np.array([np.sum(probability[m]) for m in members])
+        self.start = np.array([bounds[s] for s in stage])
+        self.stop = np.array([bounds[s+1] for s in stage])
+        self.leaves = np.array(current)
+
+        self.scenarioleaf = np.zeros(nscenarios, dtype=int)
+        for leaf in self.leaves:
+            self.scenarioleaf[members[leaf]] = leaf
+
+        # elements
+        lengths = self.stop-self.start
+        self.offset = np.concatenate(([0], np.cumsum(lengths)))
+        self.elementnode = np.repeat(np.arange(len(members)), lengths)
+        self.elementtime = np.concatenate([np.arange(a, b) for a, b in zip(self.start, self.stop)])
+
+        self.values = {}
+        for key in names:
+            self.values[key] = np.zeros(self.elements)
+            for node, m in enumerate(members):
+                weights = probability[m]/np.sum(probability[m])
+                self.values[key][self.offset[node]:self.offset[node+1]] = \
+                    weights.dot(data[key][m, self.start[node]:self.stop[node]])
+
+        self.previous = np.arange(self.elements)-1
+        first = self.offset[:-1]
+        self.previous[first] = np.where(self.predecessor >= 0, self.offset[1:][self.predecessor]-1, -1)
+
+        # paths from the root to each leaf
+        self.paths = np.zeros((len(self.leaves), nt), dtype=int)
+        for i, leaf in enumerate(self.leaves):
+            node = leaf
+            while node >= 0:
+                self.paths[i, self.start[node]:self.stop[node]] = np.arange(self.offset[node], self.offset[node+1])
+                node = self.predecessor[node]
+
+    @property
+    def nodes(self):
+        """
+        The number of nodes.
+
+        """
+
+        return len(self.predecessor)
+
+    @property
+    def elements(self):
+        """
+        The number of elements.
+
+        """
+
+        return int(self.offset[-1])
+
+    def expand(self, values):
+        """
+        Returns the trajectories along all paths of element values.
+
+        Parameters
+        ----------
+        values : np.array
+            An array with a value per element.
+
+        Returns
+        -------
+        np.array
+            Values with shape (number of leaves, number of time steps), the
+            order of the leaves is the order of :code:`leaves`.
+
+        """
+
+        return np.asarray(values)[self.paths]
+
+    def root(self, values):
+        """
+        Returns the values of the root node, the decisions shared by all
+        scenarios.
+
+        Parameters
+        ----------
+        values : np.array
+            An array with a value per element.
+
+        Returns
+        -------
+        np.array
+            The values at the time indices of the root node.
+
+        """
+
+        return np.asarray(values)[self.offset[0]:self.offset[1]]
+
+
+def _kmeans(x, weights, k, iterations, rng):
+    """
+    Weighted k-means clustering with k-means++ initialization, returns the
+    cluster label of each row.
+
+    """
+
+    n = len(x)
+    if n <= k:
+        return np.arange(n)
+
+    # k-means++ initialization
+    centers = [x[rng.choice(n, p=weights/np.sum(weights))]]
+    for i in range(1, k):
+        distance = np.min(np.sum((x[:, np.newaxis, :]-np.array(centers)[np.newaxis, :, :])**2, axis=2), axis=1)
+        if np.sum(distance) == 0:
+            break
+        p = weights*distance
+        centers.append(x[rng.choice(n, p=p/np.sum(p))])
+    centers = np.array(centers)
+
+    labels = np.zeros(n, dtype=int)
+    for iteration in range(iterations):
+        distance = np.sum((x[:, np.newaxis, :]-centers[np.newaxis, :, :])**2, axis=2)
+        newlabels = np.argmin(distance, axis=1)
+        if iteration > 0 and np.all(newlabels == labels):
+            break
+        labels = newlabels
+        for j in range(len(centers)):
+            if np.any(labels == j):
+                centers[j] = np.average(x[labels == j], axis=0, weights=weights[labels == j])
+
+    # consecutive labels
+    return np.unique(labels, return_inverse=True)[1]
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import multiprocessing
+import numpy as np
+
+from .parallel import SharedDisturbances, attach_disturbances
+
+
+_worker = {}
+
+
+class Sensitivity(object):
+    """
+    Sensitivity analysis of closed-loop key performance indicators with
+    respect to emulator or control parameters.
+
+    The MPC simulations of a sample design are run in parallel processes which
+    share the disturbances. Every simulation returns only a few performance
+    indicators, which are accumulated into the sensitivity indices as soon as
+    all simulations of a group of samples have finished, so the memory use
+    does not grow with the number of samples.
+
+    Three designs are available:
+
+    - 'finitedifference': central differences around the base values,
+      :code:`2*k+1` simulations for :code:`k` parameters.
+    - 'morris': elementary effects along :code:`samples` random one at a time
+      trajectories, :code:`samples*(k+1)` simulations.
+    - 'sobol': first order (Saltelli) and total (Jansen) variance based
+      indices from :code:`samples` pairs of random samples,
+      :code:`samples*(k+2)` simulations.
+
+    """
+
+    def __init__(self, factory, disturbances, parameters, kpi, method='morris', samples=10, base=None,
+                 step=0.01, levels=4, processes=None, seed=None):
+        """
+        Parameters
+        ----------
+        factory : function
+            Function :code:`factory(disturbances, parameters)` returning an
+            :code:`mpcpy.MPC` object, with :code:`parameters` a dictionary with
+            the sampled parameter values. Must be picklable.
+
+        disturbances : mpcpy.Disturbances
+            The disturbances passed to the factory.
+
+        parameters : dict
+            Dictionary with parameter names as keys and a tuple of the lower
+            and upper bound as values. Parameters are sampled uniformly
+            between the bounds.
+
+        kpi : function
+            Function :code:`kpi(res)` returning a dictionary with scalar
+            performance indicators computed from the MPC results. Must be
+            picklable.
+
+        method : string, optional
+            The design, 'finitedifference', 'morris' or 'sobol'.
+
+        samples : int, optional
+            Number of trajectories for the Morris design or number of sample
+            pairs for the Sobol design.
+
+        base : dict, optional
+            Base values for the finite difference design, defaults to the
+            middle of the bounds.
+
+        step : number, optional
+            Relative step of the finite difference design as a fraction of the
+            range between the bounds.
+
+        levels : int, optional
+            Number of grid levels of the Morris design.
+
+        processes : int, optional
+            Number of worker processes, defaults to the number of cpus.
+
+        seed : int, optional
+            Seed of the random designs.
+
+        Examples
+        --------
+        >>> def factory(disturbances, parameters):
+        ...     emulator = MyEmulator(inputs, parameters=dict(emulator_parameters, **parameters))
+        ...     ...
+        ...     return MPC(emulator, control, disturbances)
+        >>> def kpi(res):
+        ...     return {'energy': np.trapz(res['Q_flow_hp'], res['time'])}
+        >>> sensitivity = Sensitivity(factory, disturbances, {'UA_in_am': (150., 250.), 'C_em': (5e6, 15e6)}, kpi,
+        ...                           method='sobol', samples=500)
+        >>> res = sensitivity()
+        >>> res['energy']['total']
+
+        """
+
+        if not method in ['finitedifference', 'morris', 'sobol']:
+            raise Exception('Unknown method {}'.format(method))
+
+        self.factory = factory
+        self.disturbances = disturbances
+        self.parameters = parameters
+        self.names = list(parameters.keys())
+        self.kpi = kpi
+        self.method = method
+        self.samples = samples
+        self.step = step
+        self.levels = levels
+        self.processes = processes
+        self.seed = seed
+
+        self.lower = np.array([parameters[name][0] for name in self.names], dtype=float)
+        self.upper = np.array([parameters[name][1] for name in self.names], dtype=float)
+        self.base = 0.5*(self.lower+self.upper)
+        if base is not None:
+            self.base = np.array([base.get(name, value) for name, value in zip(self.names, self.base)], dtype=float)
+
+        self.res = {}
+
+    @property
+    def runs(self):
+        """
+        The number of simulations of the design.
+
+        """
+
+        k = len(self.names)
+        if self.method == 'finitedifference':
+            return 2*k+1
+        elif self.method == 'morris':
+            return self.samples*(k+1)
+        else:
+            return self.samples*(k+2)
+
+    def design(self):
+        """
+        Generates the sample design.
+
+        Yields
+        ------
+        tuple
+            Tuples of the group, the position in the group and a dictionary
+            with the parameter values. All samples of a group are generated
+            consecutively.
+
+        """
+
+        k = len(self.names)
+        rng = np.random.default_rng(self.seed)
+
+        def values(x):
+            return dict(zip(self.names, (float(v) for v in self.lower + x*(self.upper-self.lower))))
+
+        if self.method == 'finitedifference':
+            x0 = (self.base-self.lower)/(self.upper-self.lower)
+            yield 0, 0, values(x0)
+            for i in range(k):
+                for j, sign in enumerate([1., -1.]):
+                    x = x0.copy()
+                    x[i] += sign*self.step
+                    yield i+1, j, values(x)
+
+        elif self.method == 'morris':
+            delta = self.levels/(2.*(self.levels-1))
+            grid = np.arange(self.levels)/(self.levels-1.)
+            grid = grid[grid <= 1-delta+1e-12]
+            for group in range(self.samples):
+                x = rng.choice(grid, size=k)
+                yield group, 0, values(x)
+                for position, i in enumerate(rng.permutation(k)):
+                    x = x.copy()
+                    x[i] += delta
+                    # the position encodes the changed parameter
+                    yield group, (position+1, i), values(x)
+
+        else:
+            for group in range(self.samples):
+                a = rng.random(k)
+                b = rng.random(k)
+                yield group, 'A', values(a)
+                yield group, 'B', values(b)
+                for i in range(k):
+                    ab = a.copy()
+                    ab[i] = b[i]
+                    yield group, i, values(ab)
+
+    def __call__(self, verbose=0):
+        """
+        Runs all simulations and computes the sensitivity indices.
+
+        Parameters
+        ----------
+        verbose: optional, int
+            Controls the amount of print output
+
+        Returns
+        -------
+        dict
+            Dictionary with 'parameters', the list of parameter names, and for
+            each performance indicator a dictionary with arrays with a value
+            per parameter. For the finite difference design: 'base', the value
+            at the base, 'gradient' and 'elasticity'. For the Morris design:
+            'mu', 'mu_star' and 'sigma' of the elementary effects, scaled to
+            the parameter range. For the Sobol design: 'variance', 'first' and
+            'total'. Also stored in the res attribute.
+
+        """
+
+        k = len(self.names)
+        if self.method == 'finitedifference':
+            accumulator = _FiniteDifference(self.base, self.step*(self.upper-self.lower))
+            groupsize = lambda group: 1 if group == 0 else 2
+        elif self.method == 'morris':
+            accumulator = _Morris(self.levels/(2.*(self.levels-1)))
+            groupsize = lambda group: k+1
+        else:
+            accumulator = _Sobol()
+            groupsize = lambda group: k+2
+
+        processes = self.processes
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        chunksize = max(1, self.runs//(4*processes))
+
+        groups = {}
+        with SharedDisturbances(self.disturbances) as shared:
+            pool = multiprocessing.Pool(processes, initializer=_initialize,
+                                        initargs=(shared.spec, self.factory, self.kpi))
+            try:
+                for i, (group, position, kpis) in enumerate(pool.imap_unordered(_run, self.design(), chunksize)):
+                    if not group in groups:
+                        groups[group] = {}
+                    groups[group][position] = kpis
+                    if len(groups[group]) == groupsize(group):
+                        accumulator.add(group, groups.pop(group))
+
+                    if verbose > 0:
+                        print('\rrun {} of {}'.format(i+1, self.runs), end='')
+            finally:
+                pool.close()
+                pool.join()
+
+        if verbose > 0:
+            print(' done')
+
+        self.res = accumulator.result()
+        self.res['parameters'] = self.names
+        return self.res
+
+
+def _initialize(spec, factory, kpi):
+    _worker['disturbances'] = attach_disturbances(spec)
+    _worker['factory'] = factory
+    _worker['kpi'] = kpi
+
+
+def _run(sample):
+    group, position, parameters = sample
+    mpc = _worker['factory'](_worker['disturbances'], parameters)
+    return group, position, _worker['kpi'](mpc())
+
+
+class _FiniteDifference(object):
+    """
+    Central difference gradients.
+
+    """
+
+    def __init__(self, base, step):
+        self.base = base
+        self.step = step
+        self.values = {}
+        self.gradients = {}
+
+    def add(self, group, kpis):
+        if group == 0:
+            self.values = kpis[0]
+            return
+        for name in kpis[0]:
+            if not name in self.gradients:
+                self.gradients[name] = np.zeros(len(self.base))
+            self.gradients[name][group-1] = (kpis[0][name]-kpis[1][name])/(2*self.step[group-1])
+
+    def result(self):
+        result = {}
+        for name in self.gradients:
+            result[name] = {'base': self.values[name], 'gradient': self.gradients[name]}
+            if self.values[name] != 0:
+                result[name]['elasticity'] = self.gradients[name]*self.base/self.values[name]
+        return result
+
+
+class _Morris(object):
+    """
+    Running mean, absolute mean and standard deviation of elementary effects.
+
+    """
+
+    def __init__(self, delta):
+        self.delta = delta
+        self.count = 0
+        self.mean = {}
+        self.absmean = {}
+        self.m2 = {}
+
+    def add(self, group, kpis):
+        positions = sorted([position for position in kpis if position != 0])
+        self.count += 1
+        for name in kpis[0]:
+            if not name in self.mean:
+                self.mean[name] = np.zeros(len(positions))
+                self.absmean[name] = np.zeros(len(positions))
+                self.m2[name] = np.zeros(len(positions))
+            previous = kpis[0][name]
+            for position in positions:
+                i = position[1]
+                effect = (kpis[position][name]-previous)/self.delta
+                previous = kpis[position][name]
+
+                delta = effect-self.mean[name][i]
+                self.mean[name][i] += delta/self.count
+                self.m2[name][i] += delta*(effect-self.mean[name][i])
+                self.absmean[name][i] += (abs(effect)-self.absmean[name][i])/self.count
+
+    def result(self):
+        result = {}
+        for name in self.mean:
+            result[name] = {'mu': self.mean[name], 'mu_star': self.absmean[name],
+                            'sigma': np.sqrt(self.m2[name]/max(self.count-1, 1))}
+        return result
+
+
+class _Sobol(object):
+    """
+    Running sums of the Saltelli first order and Jansen total effect
+    estimators.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.first = {}
+        self.total = {}
+        self.values = {}
+
+    def add(self, group, kpis):
+        k = len(kpis)-2
+        self.count += 1
+        for name in kpis['A']:
+            if not name in self.first:
+                self.first[name] = np.zeros(k)
+                self.total[name] = np.zeros(k)
+                self.values[name] = [0, 0., 0.]
+            fa = kpis['A'][name]
+            fb = kpis['B'][name]
+            fab = np.array([kpis[i][name] for i in range(k)])
+            self.first[name] += fb*(fab-fa)
+            self.total[name] += (fa-fab)**2
+
+            # variance of the A and B samples
+            for value in [fa, fb]:
+                count, mean, m2 = self.values[name]
+                count += 1
+                delta = value-mean
+                mean += delta/count
+                m2 += delta*(value-mean)
+                self.values[name] = [count, mean, m2]
+
+    def result(self):
+        result = {}
+        for name in self.first:
+            count, mean, m2 = self.values[name]
+            variance = m2/max(count-1, 1)
+            result[name] = {'variance': variance, 'first': self.first[name]/self.count/variance,
+                            'total': self.total[name]/(2*self.count)/variance}
+        return result
@@ -17,7 +17,6 @@
 #    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
 
-import sys
 import numpy as np
 
 class Stateestimation(object):
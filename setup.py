@@ -32,6 +32,9 @@ setup(
         'dev': [
             'pyomo',
             'matplotlib'
+        ],
+        'compiled': [
+            'numba'
         ]
     },
     classifiers=['Programming Language :: Python :: 2.7'],
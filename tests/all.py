@@ -22,7 +22,17 @@ import unittest
 from .boundaryconditions import *
 from .prediction import *
 from .stateestimation import *
+from .control import *
 from .emulator import *
+from .mpc import *
+from .parallel import *
+from .realtime import *
+from .sensitivity import *
+from .identification import *
+from .loaders import *
+from .scenariotree import *
+from .distributed import *
+from .importtime import *
 from .examples import *
           
 if __name__ == '__main__':
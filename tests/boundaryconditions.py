@@ -90,7 +90,48 @@ class TestBoundaryconditions(unittest.TestCase):
 
         self.assertEqual(val0['y0'],val1['y0'])
         self.assertEqual(val0['y1'],val1['y1'])
-    
+
+    def test_dtypes(self):
+        bcs_int = dict(bcs)
+        bcs_int['y2'] = (y1 > 0.5).astype(int)
+        boundaryconditions = mpcpy.Disturbances(bcs_int, dtypes={'y0': np.float32, 'y2': np.uint8}, zoh_keys=['y2'])
+        reference = mpcpy.Disturbances(bcs_int, zoh_keys=['y2'])
+
+        self.assertEqual(boundaryconditions['y0'].dtype, np.float32)
+        self.assertEqual(boundaryconditions['y2'].dtype, np.uint8)
+        self.assertEqual(boundaryconditions['time'].dtype, np.float64)
+
+        t = np.arange(0., 2*24*3600., 500.)
+        val = boundaryconditions(t)
+        val_reference = reference(t)
+        for key in val:
+            self.assertEqual(val[key].dtype, np.float64)
+        np.testing.assert_allclose(val['y0'], val_reference['y0'], rtol=1e-6)
+        np.testing.assert_allclose(val['y2'], val_reference['y2'])
+
+
+    def test_value_nd(self):
+        bcs_nd = dict(bcs)
+        bcs_nd['y2'] = np.random.random((len(time), 20))
+        bcs_nd['y3'] = np.random.random((len(time), 4, 5))
+        bcs_nd['y4'] = np.random.random((len(time), 4))
+        boundaryconditions = mpcpy.Disturbances(bcs_nd, zoh_keys=['y4'])
+
+        t = np.array([-100., 0., 450., 1.5*24*3600., 12*24*3600.])
+        val = boundaryconditions(t)
+        xp = boundaryconditions['time']
+
+        self.assertEqual(val['y2'].shape, (len(t), 20))
+        self.assertEqual(val['y3'].shape, (len(t), 4, 5))
+        for j in range(20):
+            np.testing.assert_allclose(val['y2'][:, j], np.interp(t, xp, boundaryconditions['y2'][:, j]))
+        np.testing.assert_allclose(val['y3'][:, 1, 2], np.interp(t, xp, boundaryconditions['y3'][:, 1, 2]))
+        for j in range(4):
+            np.testing.assert_allclose(val['y4'][:, j],
+                                       mpcpy.disturbances.interp_zoh(t, xp, boundaryconditions['y4'][:, j]))
+
+        # scalar time
+        np.testing.assert_allclose(boundaryconditions(450.)['y2'], val['y2'][2])
     
     
 if __name__ == '__main__':
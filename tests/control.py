@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import os
+import tempfile
+import shutil
+import time as _time
+import mpcpy
+import numpy as np
+
+from .mpc import create_mpc, Control as ProportionalControl
+
+# define variables
+time = np.arange(0.0, 7*24*3600.+1., 900.)
+bcs = {'time': time, 'demand': 1000.+500.*np.sin(2*np.pi*time/(24*3600.))}
+boundaryconditions = mpcpy.Disturbances(bcs)
+prediction = mpcpy.Prediction(boundaryconditions)
+
+
+class Stateestimation(mpcpy.Stateestimation):
+    def stateestimation(self, time):
+        return {}
+
+stateestimation = Stateestimation(None)
+
+
+class ZoneControl(mpcpy.Control):
+    # returns the demand times a zone fraction, limited to a capacity parameter
+    def solution(self, sta, pre):
+        value = np.minimum(self.parameters['fraction']*pre['demand'], self.parameters.get('capacity', np.inf))
+        return {'time': pre['time'], self.parameters['key']: value}
+
+
+class CapacityControl(mpcpy.ParallelControl):
+    # distributes a shared capacity proportional to the demand of each zone
+    def coordination(self, starttime, solutions, iteration):
+        total = sum(np.max(sol[control.parameters['key']]) for sol, control in zip(solutions, self.controls))
+        if total <= self.parameters['capacity']:
+            return None
+        return [{'capacity': self.parameters['capacity']*np.max(sol[control.parameters['key']])/total}
+                for sol, control in zip(solutions, self.controls)]
+
+
+class FailingControl(mpcpy.Control):
+    # fails or sleeps after the first call
+    def solution(self, sta, pre):
+        if pre['time'][0] > 0:
+            if self.parameters.get('sleep'):
+                _time.sleep(self.parameters['sleep'])
+            else:
+                raise self.parameters.get('error', Exception)('solver failed')
+        return {'time': pre['time'], 'Q': np.arange(len(pre['time'])-1, dtype=float), 'par': 1.}
+
+
+class SlowControl(mpcpy.Control):
+    # sleeps after the first call and returns the starttime
+    def solution(self, sta, pre):
+        if pre['time'][0] > 0:
+            _time.sleep(self.parameters['sleep'])
+        return {'time': pre['time'], 'Q': pre['time'][0]*np.ones(len(pre['time'])-1)}
+
+
+class FormulationControl(mpcpy.Control):
+    # builds a matrix which depends on the number of steps only
+    formulations = 0
+
+    def formulationkey(self):
+        return len(self.time(0.))
+
+    def formulation(self):
+        FormulationControl.formulations += 1
+        n = len(self.time(0.))
+        self.matrix = np.eye(n) + np.eye(n, k=1)
+
+    def solution(self, sta, pre):
+        return {'time': pre['time'], 'Q': self.parameters['gain']*self.matrix.dot(pre['demand'])}
+
+
+class ParameterControl(FormulationControl):
+    # stores the gain in the formulation and shares the matrix
+    sharedattributes = ('matrix',)
+
+    def formulation(self):
+        FormulationControl.formulation(self)
+        self.gain = self.parameters['gain']
+
+    def updateformulation(self, parameters):
+        self.gain = parameters['gain']
+
+    def solution(self, sta, pre):
+        return {'time': pre['time'], 'Q': self.gain*self.matrix.dot(pre['demand'])}
+
+
+class FormulatedControl(ProportionalControl):
+    # counts the formulations in an attribute, which is also copied from worker processes
+    def formulation(self):
+        self.formulations = getattr(self, 'formulations', 0) + 1
+
+
+def create_zones():
+    return [
+        ZoneControl(stateestimation, prediction, parameters={'key': 'Q_1', 'fraction': 0.25},
+                    horizon=24*3600., timestep=3600.),
+        ZoneControl(stateestimation, prediction, parameters={'key': 'Q_2', 'fraction': 0.75},
+                    horizon=24*3600., timestep=3600.),
+    ]
+
+
+class TestTimegrid(unittest.TestCase):
+
+    def test_uniform(self):
+        control = mpcpy.Control(stateestimation, prediction, horizon=24*3600., timestep=900.)
+        np.testing.assert_allclose(control.time(100.), np.arange(100., 100.+24*3600.+1., 900.))
+
+        control.timestep = 3600.
+        self.assertEqual(len(control.time(0.)), 25)
+
+    def test_blocking(self):
+        control = mpcpy.Control(stateestimation, prediction, blocking=[(2*3600., 900.), (4*3600., 3600.)])
+        np.testing.assert_allclose(control.time(100.), 100. + np.concatenate((np.arange(0., 7201., 900.),
+                                                                               np.arange(10800., 21601., 3600.))))
+        self.assertEqual(control.horizon, 6*3600.)
+        self.assertEqual(control.timestep, 900.)
+        self.assertEqual(control.receding, 900.)
+
+    def test_timegrid(self):
+        control = mpcpy.Control(stateestimation, prediction, timegrid=[0., 600., 3600.])
+        np.testing.assert_allclose(control.time(3600.), [3600., 4200., 7200.])
+        self.assertRaises(Exception, mpcpy.Control, stateestimation, prediction, timegrid=[0., 600., 600.])
+
+    def test_interp_zoh(self):
+        xp = np.array([0., 900., 3600., 7200.])
+        fp = np.array([1., 2., 3.])
+        np.testing.assert_allclose(mpcpy.disturbances.interp_zoh([-1., 0., 899., 900., 5000., 7200., 8000.], xp, fp),
+                                   [1., 1., 1., 2., 3., 3., 3.])
+
+
+class TestParallelControl(unittest.TestCase):
+
+    def test_merge(self):
+        control = mpcpy.ParallelControl(create_zones(), savesolutions=1)
+        sol = control(0.)
+
+        pre = prediction(control.time(0.))
+        np.testing.assert_allclose(sol['time'], pre['time'])
+        np.testing.assert_allclose(sol['Q_1'], 0.25*pre['demand'])
+        np.testing.assert_allclose(sol['Q_2'], 0.75*pre['demand'])
+        self.assertEqual(len(control.solutions), 1)
+
+    def test_duplicate_keys(self):
+        zones = create_zones()
+        zones[1].parameters['key'] = 'Q_1'
+        control = mpcpy.ParallelControl(zones)
+        self.assertRaises(Exception, control, 0.)
+
+    def test_coordination(self):
+        control = CapacityControl(create_zones(), parameters={'capacity': 1000.}, maxiterations=5)
+        sol = control(0.)
+
+        self.assertLessEqual(np.max(sol['Q_1'] + sol['Q_2']), 1000.+1e-6)
+
+    def test_process_executor_formulation(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        mpc = create_mpc()
+        control = FormulatedControl(mpc.control.stateestimation, mpc.control.prediction, horizon=6*3600.,
+                                    timestep=3600.)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            mpc.control = mpcpy.ParallelControl([control], executor=executor)
+            mpc()
+
+        # the formulation is run once and copied back to the original control
+        self.assertTrue(control._formulated)
+        self.assertEqual(control.formulations, 1)
+
+    def test_process_executor(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        mpc = create_mpc()
+        mpc.control = mpcpy.ParallelControl([mpc.control], savesolutions=-1)
+        res = mpc()
+
+        mpc = create_mpc()
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            mpc.control = mpcpy.ParallelControl([mpc.control], executor=executor, savesolutions=-1)
+            processres = mpc()
+
+        # the state is estimated from the actual emulator every step
+        self.assertGreater(np.ptp(processres['T_in']), 0.1)
+        np.testing.assert_allclose(processres['T_in'], res['T_in'])
+        np.testing.assert_allclose(processres['Q_flow_hp'], res['Q_flow_hp'])
+        self.assertEqual(mpc.control.controls[0].statistics['solutions'], 12)
+
+
+class TestFallback(unittest.TestCase):
+
+    def test_no_fallback(self):
+        control = FailingControl(stateestimation, prediction, horizon=6*3600., timestep=3600.)
+        control(0.)
+        self.assertRaises(Exception, control, 3600.)
+
+    def test_fallback(self):
+        control = FailingControl(stateestimation, prediction, horizon=6*3600., timestep=3600., fallback=True)
+        control(0.)
+        sol = control(2*3600.)
+
+        np.testing.assert_allclose(sol['time'], control.time(2*3600.))
+        np.testing.assert_allclose(sol['Q'], [2., 3., 4., 5., 5., 5.])
+        self.assertEqual(sol['par'], 1.)
+        self.assertEqual(control.statistics['solutions'], 1)
+        self.assertEqual(control.statistics['failures'], 1)
+        self.assertEqual(control.statistics['fallbacks'], 1)
+
+    def test_solvetimelimit(self):
+        control = FailingControl(stateestimation, prediction, parameters={'sleep': 0.5},
+                                 horizon=6*3600., timestep=3600., solvetimelimit=0.05)
+        control(0.)
+        t0 = _time.time()
+        sol = control(3600.)
+        self.assertLess(_time.time()-t0, 0.4)
+        np.testing.assert_allclose(sol['Q'], [1., 2., 3., 4., 5., 5.])
+
+        # the running solution blocks new solutions
+        control(2*3600.)
+        self.assertEqual(control.statistics['timeouts'], 2)
+        self.assertEqual(control.statistics['fallbacks'], 2)
+
+    def test_late_solutions(self):
+        # a solver which is always slower than the time limit
+        control = SlowControl(stateestimation, prediction, parameters={'sleep': 0.1},
+                              horizon=6*3600., timestep=3600., solvetimelimit=0.02)
+        control(0.)
+        for i in range(1, 6):
+            _time.sleep(0.15)
+            sol = control(i*3600.)
+        # the late solutions are used as the last solution
+        self.assertEqual(control.statistics['solutions'], 5)
+        self.assertEqual(control.statistics['timeouts'], 5)
+        np.testing.assert_allclose(sol['Q'][0], 4*3600.)
+
+    def test_solver_timeouterror(self):
+        control = FailingControl(stateestimation, prediction, parameters={'error': TimeoutError},
+                                 horizon=6*3600., timestep=3600., solvetimelimit=1., fallback=True)
+        control(0.)
+        control(3600.)
+        self.assertEqual(control.statistics['failures'], 1)
+        self.assertEqual(control.statistics['timeouts'], 0)
+
+
+class TestFormulationCache(unittest.TestCase):
+
+    def setUp(self):
+        mpcpy.clear_formulations()
+        FormulationControl.formulations = 0
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        mpcpy.clear_formulations()
+        shutil.rmtree(self.path)
+
+    def test_shared(self):
+        controls = [FormulationControl(stateestimation, prediction, parameters={'gain': gain},
+                                       horizon=24*3600., timestep=3600.) for gain in [1., 2., 3.]]
+        solutions = [control(0.) for control in controls]
+
+        self.assertEqual(FormulationControl.formulations, 1)
+        np.testing.assert_allclose(solutions[2]['Q'], 3*solutions[0]['Q'])
+        # the shared attributes are copies
+        controls[1].matrix[0, 0] = 10.
+        self.assertEqual(controls[0].matrix[0, 0], 1.)
+
+        # a different structure is formulated again
+        FormulationControl(stateestimation, prediction, parameters={'gain': 1.},
+                           horizon=12*3600., timestep=3600.)(0.)
+        self.assertEqual(FormulationControl.formulations, 2)
+
+    def test_parameters(self):
+        controls = [ParameterControl(stateestimation, prediction, parameters={'gain': gain},
+                                     horizon=24*3600., timestep=3600.) for gain in [1., 2.]]
+        solutions = [control(0.) for control in controls]
+
+        self.assertEqual(FormulationControl.formulations, 1)
+        np.testing.assert_allclose(solutions[1]['Q'], 2*solutions[0]['Q'])
+        self.assertEqual(controls[1].gain, 2.)
+        # the read only attributes are not copied
+        self.assertIs(controls[1].matrix, controls[0].matrix)
+
+    def test_save_load(self):
+        FormulationControl(stateestimation, prediction, parameters={'gain': 1.},
+                           horizon=24*3600., timestep=3600.)(0.)
+        filename = os.path.join(self.path, 'formulations.pickle')
+        mpcpy.save_formulations(filename)
+        mpcpy.clear_formulations()
+        mpcpy.load_formulations(filename)
+
+        FormulationControl(stateestimation, prediction, parameters={'gain': 1.},
+                           horizon=24*3600., timestep=3600.)(0.)
+        self.assertEqual(FormulationControl.formulations, 1)
+
+
+class StorageStateestimation(mpcpy.Stateestimation):
+    def stateestimation(self, time):
+        return {'E': 0.}
+
+
+def rollout(state, prediction, inputs):
+    # stored energy of a buffer supplying the demand
+    dt = np.diff(prediction['time'])
+    E = np.zeros((len(inputs['Q']), len(prediction['time'])))
+    E[:, 0] = state['E']
+    E[:, 1:] = state['E'] + np.cumsum((inputs['Q']-prediction['demand'][:-1])*dt, axis=1)
+    return {'E': E}
+
+
+def cost(prediction, inputs, trajectories):
+    return np.sum((trajectories['E']/1e6)**2, axis=1)
+
+
+class TestSamplingControl(unittest.TestCase):
+
+    def create(self, **kwargs):
+        return mpcpy.SamplingControl(StorageStateestimation(None), prediction, {'Q': (0., 2000.)}, rollout, cost,
+                                     samples=500, temperature=0.1, seed=1, horizon=12*3600., timestep=900.,
+                                     **kwargs)
+
+    def test_solution(self):
+        control = self.create()
+        initial = cost(prediction(control.time(0.)), {'Q': np.full((1, 48), 1000.)},
+                       rollout({'E': 0.}, prediction(control.time(0.)), {'Q': np.full((1, 48), 1000.)}))[0]
+
+        costs = []
+        for i in range(5):
+            solution = control(0.)
+            costs.append(solution['cost'])
+            self.assertEqual(len(solution['Q']), len(solution['time'])-1)
+            self.assertTrue(np.all(solution['Q'] >= 0.) and np.all(solution['Q'] <= 2000.))
+        # the previous plan is refined
+        self.assertLess(costs[0], initial)
+        self.assertLess(costs[-1], costs[0])
+
+    def test_seed(self):
+        np.testing.assert_array_equal(self.create()(0.)['Q'], self.create()(0.)['Q'])
+
+    def test_method(self):
+        class Control(mpcpy.SamplingControl):
+            def rollout(self, state, prediction, inputs):
+                return rollout(state, prediction, inputs)
+
+            def cost(self, prediction, inputs, trajectories):
+                return cost(prediction, inputs, trajectories)
+
+        solution = Control(StorageStateestimation(None), prediction, {'Q': (0., 2000.)}, samples=500,
+                           temperature=0.1, seed=1, horizon=12*3600., timestep=900.)(0.)
+        np.testing.assert_array_equal(solution['Q'], self.create()(0.)['Q'])
+
+    def test_nonfinite_cost(self):
+        def nancost(prediction, inputs, trajectories):
+            return np.nan*cost(prediction, inputs, trajectories)
+
+        control = self.create(fallback=True)
+        control(0.)
+        control.cost = nancost
+        self.assertRaises(Exception, control.solution, control.stateestimation(0.), prediction(control.time(0.)))
+
+        # the last solution is used
+        solution = control(0.)
+        self.assertTrue(np.all(np.isfinite(solution['Q'])))
+        self.assertEqual(control.statistics['failures'], 1)
+
+    def test_mpc(self):
+        mpc = create_mpc()
+
+        def heating_rollout(state, prediction, inputs):
+            T_in = np.zeros((len(inputs['Q_flow_hp']), len(prediction['time'])))
+            T_in[:, 0] = state['T_in']
+            dt = np.diff(prediction['time'])
+            for i in range(len(dt)):
+                T_in[:, i+1] = T_in[:, i] + dt[i]*(inputs['Q_flow_hp'][:, i] + prediction['Q_flow_so'][i]
+                                                   - 200.*(T_in[:, i]-prediction['T_am'][i]))/15e6
+            return {'T_in_model': T_in}
+
+        def heating_cost(prediction, inputs, trajectories):
+            return np.sum(np.maximum(prediction['T_in_min']-trajectories['T_in_model'], 0)**2, axis=1) \
+                + 1e-8*np.sum(inputs['Q_flow_hp'], axis=1)
+
+        mpc.control = mpcpy.SamplingControl(mpc.control.stateestimation, mpc.control.prediction,
+                                            {'Q_flow_hp': (0., 10000.)}, heating_rollout, heating_cost,
+                                            samples=200, seed=1, horizon=6*3600., timestep=3600.)
+        res = mpc()
+
+        self.assertEqual(res['time'][-1], 12*3600.)
+        self.assertTrue(np.all(res['Q_flow_hp'] >= 0.) and np.all(res['Q_flow_hp'] <= 10000.))
+        self.assertNotIn('cost', res)
+        # the heat pump keeps the zone close to the minimum temperature
+        self.assertGreater(np.min(res['T_in'][res['time'] >= 6*3600.]), 19.5+273.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import os
+import tempfile
+import shutil
+import threading
+import time as _time
+import socket
+import struct
+import mpcpy
+import numpy as np
+
+from .mpc import create_emulator, create_emulator_mpc
+
+
+def factory(spec):
+    if spec.get('fail'):
+        raise Exception('invalid specification')
+    return create_emulator_mpc(create_emulator(**spec))
+
+
+class TestDistributed(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.specs = [{'UA_in_am': value} for value in [100., 200., 300.]]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_directoryqueue(self):
+        queue = mpcpy.DirectoryQueue(self.path)
+        ids = [queue.put(spec) for spec in self.specs]
+        # task ids are idempotent
+        self.assertEqual(queue.put(self.specs[0]), ids[0])
+        self.assertEqual(queue.put({'UA_in_am': 150.}, taskid=ids[1]), ids[1])
+        self.assertEqual(queue.status()['pending'], 3)
+
+        worker = mpcpy.Worker(queue, factory, keys=['time', 'T_in'])
+        worker.run()
+        self.assertEqual(queue.status(), {'pending': 0, 'running': 0, 'done': 3, 'failed': 0})
+
+        res = factory(self.specs[1])()
+        result = queue.result(ids[1])
+        self.assertEqual(sorted(result.keys()), ['T_in', 'time'])
+        np.testing.assert_allclose(result['T_in'], res['T_in'])
+
+        # done tasks are not added again
+        queue.put(self.specs[0])
+        self.assertEqual(queue.status()['pending'], 0)
+
+    def test_claim_old_task(self):
+        queue = mpcpy.DirectoryQueue(self.path, timeout=60.)
+        taskid = queue.put(self.specs[0])
+        # a task which was pending longer than the timeout
+        old = _time.time()-3600.
+        os.utime(os.path.join(self.path, 'pending', taskid + '.task'), (old, old))
+
+        self.assertEqual(queue.get()[0], taskid)
+        queue.requeue()
+        self.assertEqual(queue.status()['running'], 1)
+
+    def test_retries(self):
+        queue = mpcpy.DirectoryQueue(self.path, maxretries=2)
+        taskid = queue.put({'fail': True})
+        worker = mpcpy.Worker(queue, factory)
+        worker.run()
+
+        self.assertEqual(worker.statistics['failed'], 3)
+        self.assertEqual(queue.status()['failed'], 1)
+        self.assertIn('invalid specification', queue.error(taskid))
+        self.assertIsNone(queue.result(taskid))
+
+    def test_requeue(self):
+        queue = mpcpy.DirectoryQueue(self.path, timeout=0.)
+        taskid = queue.put(self.specs[0])
+        self.assertEqual(queue.get()[0], taskid)
+
+        # the worker did not send a heartbeat
+        os.utime(os.path.join(self.path, 'running', taskid + '.task'), (0., 0.))
+        self.assertEqual(queue.get()[0], taskid)
+
+    def test_concurrent(self):
+        queue = mpcpy.DirectoryQueue(self.path)
+        for value in np.linspace(100., 300., 8):
+            queue.put({'UA_in_am': value})
+
+        workers = [mpcpy.Worker(mpcpy.DirectoryQueue(self.path), factory) for i in range(3)]
+        threads = [threading.Thread(target=worker.run) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(worker.statistics['completed'] for worker in workers), 8)
+        self.assertEqual(queue.status()['done'], 8)
+
+    def test_server(self):
+        with mpcpy.QueueServer(mpcpy.DirectoryQueue(self.path)) as server:
+            client = mpcpy.QueueClient(server.address, server.authkey)
+            ids = [client.put(spec) for spec in self.specs]
+            mpcpy.Worker(mpcpy.QueueClient(server.address, server.authkey), factory).run()
+
+            self.assertEqual(client.status()['done'], 3)
+            np.testing.assert_allclose(client.result(ids[2])['T_in'], factory(self.specs[2])()['T_in'])
+            self.assertRaises(Exception, client._request, 'requeue')
+
+    def test_server_authentication(self):
+        with mpcpy.QueueServer(mpcpy.DirectoryQueue(self.path)) as server:
+            # requests with another key are not unpickled or answered
+            client = mpcpy.QueueClient(server.address, b'wrong key')
+            self.assertRaises(Exception, client.put, self.specs[0])
+            self.assertEqual(server.queue.status()['pending'], 0)
+
+            # unsigned pickles are ignored
+            with socket.create_connection(server.address) as connection:
+                connection.sendall(struct.pack('!Q', 4) + b'None')
+                connection.shutdown(socket.SHUT_WR)
+                self.assertEqual(connection.recv(1), b'')
+            self.assertEqual(mpcpy.QueueClient(server.address, server.authkey).status()['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,8 @@ import mpcpy
 import numpy as np
 import sys
 import os
+import tempfile
+import shutil
 
 
 # current path
@@ -54,5 +56,210 @@ class TestEmulator(unittest.TestCase):
         self.assertEqual(emulator.res['time'][1],self.inp['time'][1])
         self.assertEqual(emulator.res['Q_flow_sol'][2],self.inp['Q_flow_sol'][2])
 
+def rhs(t, x, u, p):
+    # C dT/dt = Q - UA*(T-T_amb)
+    return np.array([(u[0] - p[0]*(x[0]-u[1]))/p[1]])
+
+
+class TestOdeEmulator(unittest.TestCase):
+    def setUp(self):
+        self.par = {'UA': 200., 'C': 5e6}
+        self.inp = {
+            'time': np.array([0., 12*3600., 24*3600.]),
+            'Q_flow_hp': np.array([1000., 1000., 1000.]),
+            'T_amb': np.array([273.15, 273.15, 273.15]),
+        }
+        self.time = np.arange(0., 24*3600.+1., 3600.)
+        tau = self.par['C']/self.par['UA']
+        T_end = 273.15 + 1000./self.par['UA']
+        self.T_in = T_end + (293.15-T_end)*np.exp(-self.time/tau)
+
+    def test_rk4(self):
+        emulator = mpcpy.OdeEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs, parameters=self.par,
+                                     initial_conditions={'T_in': 293.15}, timestep=600.)
+        emulator.initialize()
+        emulator(self.time, self.inp)
+
+        np.testing.assert_allclose(emulator.res['T_in'], self.T_in, rtol=0, atol=1e-6)
+
+    def test_rk45(self):
+        emulator = mpcpy.OdeEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs, parameters=self.par,
+                                     initial_conditions={'T_in': 293.15}, timestep=3600., method='rk45')
+        emulator.initialize()
+        emulator(self.time, self.inp)
+
+        np.testing.assert_allclose(emulator.res['T_in'], self.T_in, rtol=0, atol=1e-3)
+
+    def test_rk45_nonfinite(self):
+        def unstable(t, x, u, p):
+            return np.array([np.inf*x[0]])
+
+        emulator = mpcpy.OdeEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], unstable, parameters=self.par,
+                                     initial_conditions={'T_in': 293.15}, timestep=3600., method='rk45')
+        emulator.initialize()
+        with np.errstate(invalid='ignore'):
+            self.assertRaises(Exception, emulator, self.time, self.inp)
+
+    def test_rk45_minimum_step(self):
+        def chattering(t, x, u, p):
+            return np.array([-1e6*np.sign(x[0]-293.)])
+
+        emulator = mpcpy.OdeEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], chattering, parameters=self.par,
+                                     initial_conditions={'T_in': 293.15}, timestep=3600., method='rk45')
+        emulator.initialize()
+        self.assertRaises(Exception, emulator, self.time, self.inp)
+
+    def test_rhs_method(self):
+        class Emulator(mpcpy.OdeEmulator):
+            def rhs(self, t, x, u, p):
+                return rhs(t, x, u, p)
+
+        emulator = Emulator(['Q_flow_hp', 'T_amb'], ['T_in'], parameters=self.par,
+                            initial_conditions={'T_in': 293.15}, timestep=600.)
+        emulator.initialize()
+        emulator(self.time, self.inp)
+
+        np.testing.assert_allclose(emulator.res['T_in'], self.T_in, rtol=0, atol=1e-6)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.emulator = mpcpy.OdeEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs, parameters={'UA': 200., 'C': 5e6},
+                                          initial_conditions={'T_in': 293.15}, timestep=600.)
+        self.emulator.initialize()
+        self.time = np.arange(0., 12*3600.+1., 3600.)
+        self.inp = {'time': self.time, 'Q_flow_hp': 1000.+0*self.time, 'T_amb': 273.15+0*self.time}
+        self.emulator(self.time, self.inp)
+
+    def test_restore(self):
+        snapshot = self.emulator.snapshot()
+        res = {key: self.emulator.res[key].copy() for key in self.emulator.res}
+
+        time = self.time + 12*3600.
+        self.emulator(time, dict(self.inp, time=time, Q_flow_hp=5000.+0*time))
+        self.emulator.restore(snapshot)
+        for key in res:
+            np.testing.assert_array_equal(self.emulator.res[key], res[key])
+
+        # continuing after a restore equals continuing without the detour
+        self.emulator(time, dict(self.inp, time=time))
+        reference = mpcpy.OdeEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs, parameters={'UA': 200., 'C': 5e6},
+                                      initial_conditions={'T_in': 293.15}, timestep=600.)
+        reference.initialize()
+        reference(self.time, self.inp)
+        reference(time, dict(self.inp, time=time))
+        np.testing.assert_allclose(self.emulator.res['T_in'], reference.res['T_in'])
+
+    def test_fork(self):
+        fork = self.emulator.fork()
+        self.assertEqual(len(fork.res['time']), 1)
+
+        time = self.time + 12*3600.
+        fork(time, dict(self.inp, time=time, Q_flow_hp=5000.+0*time))
+        self.assertEqual(len(self.emulator.res['time']), len(self.time))
+
+        self.emulator(time, dict(self.inp, time=time, Q_flow_hp=5000.+0*time))
+        np.testing.assert_allclose(fork.res['T_in'], self.emulator.res['T_in'][-len(time):])
+
+
+class CountingEmulator(mpcpy.OdeEmulator):
+    simulations = 0
+
+    def simulate(self, starttime, stoptime, input):
+        CountingEmulator.simulations += 1
+        return mpcpy.OdeEmulator.simulate(self, starttime, stoptime, input)
+
+
+class TestSimulationCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.par = {'UA': 200., 'C': 5e6}
+        self.inp = {
+            'time': np.arange(0., 24*3600.+1., 3600.),
+            'Q_flow_hp': 1000.*np.ones(25),
+            'T_amb': 273.15+np.arange(25.),
+        }
+        CountingEmulator.simulations = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_emulator(self, cache, parameters=None):
+        par = dict(self.par)
+        if parameters is not None:
+            par.update(parameters)
+        emulator = CountingEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs, parameters=par,
+                                    initial_conditions={'T_in': 293.15}, timestep=600., cache=cache)
+        emulator.initialize()
+        for i in range(4):
+            time = np.arange(i*6*3600., (i+1)*6*3600.+1., 600.)
+            emulator(time, self.inp)
+        return emulator.res
+
+    def test_hit(self):
+        cache = mpcpy.SimulationCache(self.path)
+        res = self.run_emulator(cache)
+        self.assertEqual(CountingEmulator.simulations, 4)
+
+        cachedres = self.run_emulator(mpcpy.SimulationCache(self.path))
+        self.assertEqual(CountingEmulator.simulations, 4)
+        for key in res:
+            np.testing.assert_array_equal(cachedres[key], res[key])
+
+        # different parameters or attributes are simulated
+        self.run_emulator(self.path, parameters={'UA': 300.})
+        self.assertEqual(CountingEmulator.simulations, 8)
+
+    def test_rhs(self):
+        def rhs2(t, x, u, p):
+            return np.array([0.*x[0]])
+
+        self.run_emulator(self.path)
+        emulator = CountingEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs2, parameters=self.par,
+                                    initial_conditions={'T_in': 293.15}, timestep=600., cache=self.path)
+        emulator.initialize()
+        emulator(np.arange(0., 6*3600.+1., 600.), self.inp)
+
+        # a different rhs is simulated
+        self.assertEqual(CountingEmulator.simulations, 5)
+        np.testing.assert_allclose(emulator.res['T_in'], 293.15)
+
+    def test_unhashable(self):
+        emulator = CountingEmulator(['Q_flow_hp', 'T_amb'], ['T_in'], rhs, parameters=self.par,
+                                    initial_conditions={'T_in': 293.15}, timestep=600., cache=self.path)
+        emulator.model = object()
+        emulator.initialize()
+        for i in range(2):
+            emulator(np.arange(0., 6*3600.+1., 600.), self.inp)
+            emulator.initialize()
+
+        # emulators with attributes which can not be hashed are not cached
+        self.assertEqual(CountingEmulator.simulations, 2)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_replace(self):
+        cache = mpcpy.SimulationCache(self.path)
+        res = {'time': np.arange(10.)}
+        cache.put('a', res)
+        cache.put('a', res)
+        self.assertEqual(cache._size, os.path.getsize(os.path.join(self.path, 'a.npz')))
+
+    def test_eviction(self):
+        cache = mpcpy.SimulationCache(self.path)
+        self.run_emulator(cache)
+        size = sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path))
+
+        cache = mpcpy.SimulationCache(self.path, maxsize=1.5*size)
+        self.run_emulator(cache, parameters={'UA': 300.})
+        files = os.listdir(self.path)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.path, f)) for f in files), 1.5*size)
+        self.assertEqual(len(files), 6)
+
+        # the most recently used simulations are kept
+        CountingEmulator.simulations = 0
+        self.run_emulator(cache, parameters={'UA': 300.})
+        self.assertEqual(CountingEmulator.simulations, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
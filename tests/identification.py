@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import time as _time
+import mpcpy
+import numpy as np
+
+
+def rhs(t, x, u, p):
+    # two capacity building model, works on single candidates and populations
+    return np.array([
+        (u[0] - p[2]*(x[0]-x[1]))/p[0],
+        (u[1] - p[2]*(x[1]-x[0]) - p[3]*(x[1]-u[2]))/p[1],
+    ])
+
+
+parameters = {'C_em': 10e6, 'C_in': 5e6, 'UA_em_in': 1600., 'UA_in_am': 200.}
+initial_conditions = {'T_em': 295.15, 'T_in': 294.15}
+
+time = np.arange(0., 2*24*3600.+1., 600.)
+inputs = {
+    'time': time,
+    'Q_flow_hp': 2000. + 2000.*np.sign(np.sin(2*np.pi*time/(8*3600.))),
+    'Q_flow_so': np.maximum(0., 1500.*np.sin(2*np.pi*time/(24*3600.))),
+    'T_am': 278.15 + 3.*np.sin(2*np.pi*time/(24*3600.)),
+}
+
+
+def create_model():
+    return mpcpy.OdeEmulator(['Q_flow_hp', 'Q_flow_so', 'T_am'], ['T_em', 'T_in'], rhs, parameters=dict(parameters),
+                             initial_conditions=dict(initial_conditions), timestep=600.)
+
+
+def create_data():
+    model = create_model()
+    model.initialize()
+    model(time, inputs)
+    data = dict(inputs)
+    data['T_in'] = model.res['T_in']
+    return data
+
+
+class TestIdentification(unittest.TestCase):
+
+    def test_simulate(self):
+        data = create_data()
+        identification = mpcpy.Identification(create_model(), data, ['T_in'], {'UA_in_am': (50., 500.)})
+        x = identification.simulate([[100., 200., 300.]])
+
+        self.assertEqual(x.shape, (len(time), 2, 3))
+        np.testing.assert_allclose(x[:, 1, 1], data['T_in'], atol=1e-8)
+
+    def test_disturbances(self):
+        data = mpcpy.Disturbances(create_data(), periodic=False)
+        self.assertRaises(Exception, mpcpy.Identification, create_model(), data, ['T_in'], {'UA_in_am': (50., 500.)})
+        identification = mpcpy.Identification(create_model(), data, ['T_in'], {'UA_in_am': (50., 500.)}, time=time)
+        self.assertAlmostEqual(identification()['UA_in_am'], 200., delta=1e-3)
+
+    def test_identify(self):
+        bounds = {'UA_in_am': (50., 500.), 'C_in': (1e6, 2e7), 'UA_em_in': (500., 5000.), 'T_em': (290., 300.)}
+        for method in ['differentialevolution', 'random']:
+            identification = mpcpy.Identification(create_model(), create_data(), ['T_in'], bounds, method=method,
+                                                  seed=0)
+            t0 = _time.time()
+            values = identification()
+            self.assertLess(_time.time()-t0, 10.)
+
+            self.assertAlmostEqual(values['UA_in_am'], 200., delta=1.)
+            self.assertAlmostEqual(values['C_in'], 5e6, delta=5e4)
+            self.assertAlmostEqual(values['T_em'], 295.15, delta=0.1)
+            self.assertLess(identification.res['rmse']['T_in'], 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
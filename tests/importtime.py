@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import subprocess
+import sys
+import os
+import mpcpy
+
+
+# current path
+modulepath = os.path.abspath(os.path.dirname(sys.modules[__name__].__file__))
+
+
+def run(code):
+    """
+    Runs python code in a new interpreter and returns the printed output.
+
+    """
+    return subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(modulepath)).decode().strip()
+
+
+def importtime(module, repeat=5):
+    """
+    Returns the minimum time in seconds needed to import a module in a new
+    interpreter.
+
+    """
+    code = 'import time; t0 = time.perf_counter(); import {}; print(time.perf_counter()-t0)'.format(module)
+    return min(float(run(code)) for i in range(repeat))
+
+
+class TestImporttime(unittest.TestCase):
+
+    def test_lazy(self):
+        modules = run('import sys, mpcpy; print(sorted(m for m in sys.modules if m.startswith("mpcpy") or m == "numpy"))')
+        self.assertEqual(modules, "['mpcpy', 'mpcpy.__version__']")
+
+    def test_attributes(self):
+        for name in mpcpy.__all__:
+            self.assertTrue(hasattr(mpcpy, name))
+        self.assertTrue(hasattr(mpcpy.disturbances, 'interp_zoh'))
+        self.assertRaises(AttributeError, getattr, mpcpy, 'undefined')
+
+    def test_importtime(self):
+        self.assertLess(importtime('mpcpy'), importtime('numpy'))
+
+
+if __name__ == '__main__':
+    # import-time benchmark
+    print('import mpcpy: {:.2f} ms'.format(1000*importtime('mpcpy')))
+    print('import numpy: {:.2f} ms'.format(1000*importtime('numpy')))
+    print('mpcpy.MPC: {:.2f} ms'.format(1000*importtime('mpcpy; mpcpy.MPC')))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import os
+import tempfile
+import shutil
+import mpcpy
+import numpy as np
+
+
+class TestLoaders(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.time = np.arange(0., 2*24*3600., 900.)
+        self.price = np.random.default_rng(0).random(len(self.time))
+        self.csv = os.path.join(self.path, 'prices.csv')
+        with open(self.csv, 'w') as f:
+            f.write('time,price,"occupancy"\n')
+            for t, p in zip(self.time, self.price):
+                f.write('{},{!r},{}\n'.format(t, float(p), int(t/3600.) % 2))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_csv(self):
+        data = mpcpy.read_csv(self.csv, chunksize=50, cache=False)
+        self.assertEqual(sorted(data.keys()), ['occupancy', 'price', 'time'])
+        np.testing.assert_array_equal(data['time'], self.time)
+        np.testing.assert_array_equal(data['price'], self.price)
+        self.assertFalse(os.path.exists(self.csv + '.mpcpy-cache'))
+
+        data = mpcpy.read_csv(self.csv, columns=['time', 'occupancy'], dtypes={'occupancy': np.uint8}, cache=False)
+        self.assertEqual(data['occupancy'].dtype, np.uint8)
+        self.assertEqual(data['occupancy'][4], 1)
+        mpcpy.Disturbances(data)
+
+    def test_cache(self):
+        data = mpcpy.read_csv(self.csv, columns=['time', 'price'])
+        self.assertTrue(os.path.exists(os.path.join(self.csv + '.mpcpy-cache', 'manifest.json')))
+
+        cached = mpcpy.read_csv(self.csv, columns=['time', 'price'])
+        self.assertIsInstance(cached['price'], np.memmap)
+        np.testing.assert_array_equal(cached['price'], data['price'])
+
+        # a different dtype or a modified file is parsed again
+        cached = mpcpy.read_csv(self.csv, columns=['time', 'price'], dtypes={'price': np.float32})
+        self.assertNotIsInstance(cached['price'], np.memmap)
+        self.assertEqual(cached['price'].dtype, np.float32)
+
+        with open(self.csv, 'a') as f:
+            f.write('{},1.,0\n'.format(2*24*3600.))
+        self.assertEqual(len(mpcpy.read_csv(self.csv, columns=['time', 'price'])['time']), len(self.time)+1)
+
+    def test_epw(self):
+        filename = os.path.join(self.path, 'weather.epw')
+        with open(filename, 'w') as f:
+            for i in range(8):
+                f.write('HEADER,{}\n'.format(i))
+            for day in [31, 1]:
+                month = 1 if day == 31 else 2
+                for hour in range(1, 25):
+                    values = [2001, month, day, hour, 60, 'A7*A7'] + [float(j + hour) for j in range(6, 35)]
+                    f.write(','.join(str(value) for value in values) + '\n')
+
+        data = mpcpy.read_epw(filename, columns=['dry_bulb_temperature', 'wind_speed'])
+        self.assertEqual(sorted(data.keys()), ['dry_bulb_temperature', 'time', 'wind_speed'])
+        np.testing.assert_array_equal(data['time'][[0, 23, 24]], [30*24*3600.+3600., 31*24*3600., 31*24*3600.+3600.])
+        np.testing.assert_array_equal(data['dry_bulb_temperature'][:3], [7., 8., 9.])
+        np.testing.assert_array_equal(data['wind_speed'][:3], [22., 23., 24.])
+
+        cached = mpcpy.read_epw(filename, columns=['dry_bulb_temperature', 'wind_speed'])
+        np.testing.assert_array_equal(cached['time'], data['time'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import tracemalloc
+import tempfile
+import shutil
+import mpcpy
+import numpy as np
+
+
+# define variables
+time = np.arange(0., 24.01*3600., 3600.)
+dst = {
+    'time': time,
+    'T_am': 5 + 2*np.sin(2*np.pi*time/24./3600.)+273.15,
+    'Q_flow_so': 500 + 500*np.sin(2*np.pi*time/24./3600.),
+    'T_in_min': 20*np.ones_like(time)+273.15,
+}
+disturbances = mpcpy.Disturbances(dst, periodic=False)
+
+emulator_parameters = {'C_em': 10e6, 'C_in': 5e6, 'UA_in_am': 200., 'UA_em_in': 1600.}
+emulator_initial_conditions = {'T_em': 22+273.15, 'T_in': 21+273.15}
+
+
+class Emulator(mpcpy.Emulator):
+    def simulate(self, starttime, stoptime, input):
+        dt = 60
+        time = np.arange(starttime, stoptime+dt, dt, dtype=float)
+
+        T_em = np.ones_like(time)*self.res['T_em'][-1]
+        T_in = np.ones_like(time)*self.res['T_in'][-1]
+
+        Q_flow_hp = np.interp(time, input['time'], input['Q_flow_hp'])
+        Q_flow_so = np.interp(time, input['time'], input['Q_flow_so'])
+        T_am = np.interp(time, input['time'], input['T_am'])
+
+        for i, t in enumerate(time[:-1]):
+            T_em[i+1] = T_em[i] + (Q_flow_hp[i] - self.parameters['UA_em_in']*(T_em[i]-T_in[i]))*dt/self.parameters['C_em']
+            T_in[i+1] = T_in[i] + (Q_flow_so[i] - self.parameters['UA_em_in']*(T_in[i]-T_em[i])
+                                   - self.parameters['UA_in_am']*(T_in[i]-T_am[i]))*dt/self.parameters['C_in']
+
+        return {'time': time, 'T_em': T_em, 'T_in': T_in}
+
+
+class Stateestimation(mpcpy.Stateestimation):
+    def stateestimation(self, time):
+        return {
+            'T_in': np.interp(time, self.emulator.res['time'], self.emulator.res['T_in']),
+            'T_em': np.interp(time, self.emulator.res['time'], self.emulator.res['T_em'])
+        }
+
+
+class Control(mpcpy.Control):
+    # a proportional controller on the indoor temperature
+    def solution(self, sta, pre):
+        Q_flow_hp = np.clip(2000.*(pre['T_in_min']+1.-sta['T_in']), 0., 10000.)
+        return {'time': pre['time'], 'Q_flow_hp': Q_flow_hp}
+
+
+def create_emulator(**parameters):
+    # the emulator with some parameters changed
+    return Emulator(['T_am', 'Q_flow_so', 'Q_flow_hp'], parameters=dict(emulator_parameters, **parameters),
+                    initial_conditions=emulator_initial_conditions)
+
+
+def create_emulator_mpc(emulator, disturbances=disturbances, emulationtime=6*3600., **kwargs):
+    # an mpc with the proportional controller around an emulator
+    control = Control(Stateestimation(emulator), mpcpy.Prediction(disturbances), horizon=6*3600., timestep=3600.)
+    return mpcpy.MPC(emulator, control, disturbances, emulationtime=emulationtime, resulttimestep=600, **kwargs)
+
+
+def create_mpc(**kwargs):
+    return create_emulator_mpc(create_emulator(), emulationtime=12*3600., **kwargs)
+
+
+class TestMPC(unittest.TestCase):
+
+    def test_call(self):
+        mpc = create_mpc()
+        res = mpc()
+
+        self.assertEqual(res['time'][-1], 12*3600.)
+        self.assertEqual(len(res['time']), 12*6+1)
+        for key in ['T_in', 'T_em', 'Q_flow_hp', 'T_am', 'T_in_min']:
+            self.assertEqual(len(res[key]), len(res['time']))
+
+    def test_lazy_disturbances(self):
+        mpc = create_mpc()
+        res = mpc()
+
+        self.assertIn('T_in_min', res)
+        self.assertNotIn('T_in_min', res._data)
+        np.testing.assert_allclose(res['T_in_min'], disturbances.interp('T_in_min', res['time']))
+        self.assertIn('T_in_min', res._data)
+        self.assertEqual(sorted(res.keys()), sorted(set(mpc.emulator.res.keys()) | set(disturbances.data.keys())))
+
+
+    def test_prediction_reset(self):
+        class Prediction(mpcpy.RLSPrediction):
+            def prediction(self, time):
+                pre = mpcpy.RLSPrediction.prediction(self, time)
+                self.forecasts.append(pre['T_am'])
+                return pre
+
+        mpc = create_mpc()
+        mpc.control.prediction = Prediction(disturbances, ['T_am'], periods=[24*3600.], timestep=3600.)
+        forecasts = []
+        for i in range(2):
+            mpc.control.prediction.forecasts = []
+            mpc()
+            forecasts.append(mpc.control.prediction.forecasts)
+
+        # the fitted state of the first simulation is not used in the second
+        for first, second in zip(forecasts[0], forecasts[1]):
+            np.testing.assert_allclose(first, second)
+
+    def test_prediction_function(self):
+        mpc = create_mpc()
+        mpc.control.prediction = lambda time: disturbances(time)
+        res = mpc()
+        self.assertEqual(res['time'][-1], 12*3600.)
+
+    def test_blocking(self):
+        mpc = create_mpc()
+        mpc.control = Control(mpc.control.stateestimation, mpc.control.prediction, savesolutions=-1,
+                              blocking=[(2*3600., 900.), (4*3600., 3600.)], receding=3600.)
+        res = mpc()
+
+        # the controls are applied with zero order hold on the non-uniform grid
+        solution = mpc.control.solutions[0]
+        ind = np.where(res['time'] < 3600.)
+        np.testing.assert_allclose(res['Q_flow_hp'][ind],
+                                   mpcpy.disturbances.interp_zoh(res['time'][ind], solution['time'],
+                                                                 solution['Q_flow_hp']))
+
+
+class TestPerformance(unittest.TestCase):
+
+    def test_performance(self):
+        performance = mpcpy.Performance(keys=['Q_flow_hp'], constraints={'T_in': ('T_in_min', 30+273.15)},
+                                        costs={'energy': ('Q_flow_hp', 1./3600e3)}, zoh_keys=['Q_flow_hp'])
+        mpc = create_mpc(performance=performance)
+        res = mpc()
+        summary = performance.summary()
+
+        self.assertEqual(summary['steps'], 12)
+        self.assertEqual(summary['duration'], 12*3600.)
+        # control inputs are applied with zero order hold
+        self.assertAlmostEqual(summary['tracking']['Q_flow_hp']['max'], 0.)
+
+        violation = np.maximum(res['T_in_min']-res['T_in'], 0)
+        integral = np.sum(0.5*(violation[1:]+violation[:-1])*np.diff(res['time']))
+        self.assertAlmostEqual(summary['violation']['T_in']['integral'], integral)
+
+        energy = np.sum(0.5*(res['Q_flow_hp'][1:]+res['Q_flow_hp'][:-1])*np.diff(res['time']))/3600e3
+        # the last sample of each step is overwritten by the next step in the final results
+        self.assertAlmostEqual(summary['cost']['energy'], energy, delta=0.02*energy)
+        self.assertIn('cost energy', performance.report())
+
+
+class TestMemoryProfiler(unittest.TestCase):
+
+    def test_profiler(self):
+        profiler = mpcpy.MemoryProfiler()
+        mpc = create_mpc(profiler=profiler)
+        mpc.control.savesolutions = -1
+        res = mpc()
+        summary = profiler.summary()
+
+        self.assertEqual(summary['steps'], 12)
+        self.assertEqual(profiler.sizes['time'][-1], res['time'][-1])
+        for name in ['control', 'prediction', 'solution', 'input', 'emulator']:
+            self.assertEqual(summary['phases'][name]['calls'], 12)
+        # the results grow every step
+        self.assertGreater(summary['phases']['emulator']['retained_total'], 0)
+        self.assertGreaterEqual(summary['phases']['control']['peak_max'], summary['phases']['solution']['peak_max'])
+        self.assertEqual(summary['sizes']['emulator']['last'],
+                         sum(np.asarray(value).nbytes for value in mpc.emulator.res.values()))
+        self.assertGreater(summary['sizes']['solutions']['last'], summary['sizes']['solutions']['max']/2.)
+        self.assertIn('phase emulator', profiler.report())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_control_profiler_restored(self):
+        profiler = mpcpy.MemoryProfiler()
+        mpc = create_mpc(profiler=profiler)
+        mpc()
+        self.assertIsNone(mpc.control.profiler)
+
+    def test_control_profiler_restored_on_error(self):
+        profiler = mpcpy.MemoryProfiler()
+        mpc = create_mpc(profiler=profiler)
+        mpc.nextstepcalculator = None
+        self.assertRaises(Exception, mpc)
+        self.assertIsNone(mpc.control.profiler)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_sampling(self):
+        profiler = mpcpy.MemoryProfiler(every=5)
+        create_mpc(profiler=profiler)()
+
+        self.assertEqual(profiler.summary()['steps'], 3)
+        self.assertEqual(profiler.sizes['time'], [3600., 6*3600., 11*3600.])
+
+
+class TestResultSink(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_npzsink(self):
+        res = create_mpc()()
+
+        mpc = create_mpc(sink=mpcpy.NpzSink(self.path))
+        sinkres = mpc()
+
+        self.assertEqual(len(mpc.emulator.res['time']), 1)
+        for key in res:
+            self.assertIn(key, sinkres)
+            np.testing.assert_allclose(sinkres[key], res[key])
+
+    def test_npzsink_chunksize(self):
+        res = create_mpc()()
+
+        sink = mpcpy.NpzSink(self.path, chunksize=5)
+        sinkres = create_mpc(sink=sink)()
+
+        # 12 steps and the final sample in 3 chunks
+        self.assertEqual(len(sink._files()), 3)
+        np.testing.assert_allclose(sinkres['T_in'], res['T_in'])
+        self.assertIs(sinkres['T_in'], sinkres['T_in'])
+
+    def test_npzsink_reopen(self):
+        mpc = create_mpc(sink=mpcpy.NpzSink(self.path))
+        mpc()
+
+        sink = mpcpy.NpzSink(self.path)
+        np.testing.assert_allclose(sink['T_in'], mpc.res['T_in'])
+
+    def test_multiresolutionsink(self):
+        res = create_mpc()()
+
+        sink = mpcpy.MultiResolutionSink(window=3*3600., levels=[(3600., 4*3600.), (6*3600., None)])
+        create_mpc(sink=sink)()
+
+        # full rate results are only kept for the recent window
+        ind = np.where(res['time'] >= 9*3600.)
+        np.testing.assert_allclose(sink['time'], res['time'][ind])
+        np.testing.assert_allclose(sink['T_in'], res['T_in'][ind])
+
+        # aggregates are kept for the level duration
+        hourly = sink.level(3600.)
+        np.testing.assert_allclose(hourly['time'], [9*3600., 10*3600., 11*3600., 12*3600.])
+        ind = np.where((res['time'] >= 10*3600.) & (res['time'] < 11*3600.))
+        self.assertAlmostEqual(hourly['T_in']['mean'][1], np.mean(res['T_in'][ind]))
+        self.assertAlmostEqual(hourly['T_in']['min'][1], np.min(res['T_in'][ind]))
+        self.assertAlmostEqual(hourly['T_in']['max'][1], np.max(res['T_in'][ind]))
+
+        daily = sink.level(6*3600.)
+        np.testing.assert_allclose(daily['time'], [0., 6*3600., 12*3600.])
+        ind = np.where(res['time'] < 6*3600.)
+        self.assertAlmostEqual(daily['Q_flow_hp']['max'][0], np.max(res['Q_flow_hp'][ind]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import threading
+import mpcpy
+import numpy as np
+
+from mpcpy.parallel import SharedDisturbances, attach_disturbances, _P2Quantile
+from .mpc import disturbances, emulator_parameters, create_emulator, create_emulator_mpc as create_mpc
+
+
+def factory(disturbances, rng):
+    return create_mpc(create_emulator(UA_in_am=rng.normal(200., 20.)), disturbances)
+
+
+def emulator_factory():
+    # a local fake simulator
+    return create_emulator()
+
+
+class TestSharedDisturbances(unittest.TestCase):
+
+    def test_attach(self):
+        with SharedDisturbances(disturbances) as shared:
+            attached = attach_disturbances(shared.spec)
+            t = np.arange(0., 24*3600., 1000.)
+            for key in disturbances:
+                np.testing.assert_allclose(attached.interp(key, t), disturbances.interp(key, t))
+            self.assertFalse(attached['T_am'].flags.writeable)
+
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def test_call(self):
+        runs = 8
+        montecarlo = mpcpy.MonteCarlo(factory, disturbances, runs=runs, keys=['T_in', 'Q_flow_hp'],
+                                      processes=2, seed=1)
+        stats = montecarlo()
+
+        # rerun sequentially with the same streams
+        seeds = np.random.SeedSequence(1).spawn(runs)
+        T_in = np.array([factory(disturbances, np.random.default_rng(seed))()['T_in'] for seed in seeds])
+
+        self.assertEqual(sorted(stats.keys()), ['Q_flow_hp', 'T_in', 'time'])
+        np.testing.assert_allclose(stats['T_in']['mean'], np.mean(T_in, axis=0))
+        np.testing.assert_allclose(stats['T_in']['std'], np.std(T_in, axis=0, ddof=1), atol=1e-9)
+        np.testing.assert_allclose(stats['T_in']['min'], np.min(T_in, axis=0))
+        self.assertTrue(np.all(stats['T_in']['quantiles'][0.05] <= stats['T_in']['quantiles'][0.95]))
+
+
+class TestEmulatorPool(unittest.TestCase):
+
+    def test_reuse(self):
+        res = create_mpc(emulator_factory())()
+
+        with mpcpy.EmulatorPool(emulator_factory, processes=1) as pool:
+            pids = []
+            for i in range(2):
+                with pool.emulator() as emulator:
+                    poolres = create_mpc(emulator)()
+                    pids.append(emulator.pid)
+                for key in res:
+                    np.testing.assert_allclose(poolres[key], res[key])
+            self.assertEqual(pids[0], pids[1])
+
+    def test_snapshot(self):
+        emulator = emulator_factory()
+        mpc = create_mpc(emulator)
+        res = mpc()
+
+        with mpcpy.EmulatorPool(emulator_factory, processes=1) as pool:
+            with pool.emulator() as poolemulator:
+                create_mpc(poolemulator)()
+                snapshot = poolemulator.snapshot()
+                time = res['time'][-1] + np.arange(0., 3*3600.+1., 600.)
+                input = {'time': time, 'T_am': 273.15+0*time, 'Q_flow_so': 0*time, 'Q_flow_hp': 0*time}
+                poolemulator(time, input)
+                poolemulator.restore(snapshot)
+                poolemulator(time, input)
+                emulator(time, input)
+                for key in emulator.res:
+                    np.testing.assert_allclose(poolemulator.res[key], emulator.res[key])
+
+    def test_parameters(self):
+        parameters = dict(emulator_parameters, UA_in_am=400.)
+        reference = emulator_factory()
+        reference.parameters = parameters
+        res = create_mpc(reference)()
+
+        with mpcpy.EmulatorPool(emulator_factory, processes=1) as pool:
+            with pool.emulator(parameters={'UA_in_am': 400.}) as emulator:
+                np.testing.assert_allclose(create_mpc(emulator)()['T_in'], res['T_in'])
+            # parameters are reset for the next emulator
+            with pool.emulator() as emulator:
+                self.assertFalse(np.allclose(create_mpc(emulator)()['T_in'], res['T_in']))
+
+    def test_concurrent(self):
+        res = create_mpc(emulator_factory())()
+        results = []
+
+        def run(pool):
+            with pool.emulator() as emulator:
+                results.append(create_mpc(emulator)())
+
+        with mpcpy.EmulatorPool(emulator_factory, processes=2) as pool:
+            threads = [threading.Thread(target=run, args=(pool,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(results), 4)
+        for poolres in results:
+            np.testing.assert_allclose(poolres['T_in'], res['T_in'])
+
+
+class TestP2Quantile(unittest.TestCase):
+
+    def test_quantile(self):
+        values = np.random.default_rng(0).normal(size=(2000, 3))
+        quantile = _P2Quantile(0.9)
+        for value in values:
+            quantile.add(value)
+
+        np.testing.assert_allclose(quantile.result(), np.percentile(values, 90, axis=0), atol=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
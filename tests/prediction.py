@@ -43,7 +43,72 @@ class TestPrediction(unittest.TestCase):
 
         self.assertEqual(prediction(t0),boundaryconditions(t0))
 
-    
+
+# online forecasts
+day = 24*3600.
+online = {
+    'time': time,
+    'periodic': 2. + np.sin(2*np.pi*time/day),
+    'drift': np.sin(2*np.pi*time/day) + time/day,
+    'regressor': np.cos(time/3000.),
+    'linear': 10. + 2.*time/day,
+}
+online['regression'] = 1. + 3.*online['regressor']
+onlineconditions = mpcpy.Disturbances(online, periodic=False)
+
+
+class CountingPrediction(mpcpy.SeasonalNaivePrediction):
+    def update(self, key, time, value):
+        self.updates += 1
+        mpcpy.SeasonalNaivePrediction.update(self, key, time, value)
+
+
+class TestOnlinePrediction(unittest.TestCase):
+
+    def test_updates(self):
+        prediction = CountingPrediction(onlineconditions, ['periodic'], period=day, warmup=day)
+        prediction.updates = 0
+        prediction(np.arange(2*day, 3*day+1, 900.))
+        self.assertEqual(prediction.updates, 97)
+
+        # only the new measurements are used
+        for i in range(1, 5):
+            prediction.updates = 0
+            pre = prediction(np.arange(2*day+i*3600., 3*day+i*3600.+1, 900.))
+            self.assertEqual(prediction.updates, 4)
+        np.testing.assert_allclose(pre['drift'], onlineconditions.interp('drift', pre['time']))
+
+    def test_seasonalnaive(self):
+        prediction = mpcpy.SeasonalNaivePrediction(onlineconditions, ['periodic', 'drift'], period=day,
+                                                   smoothing=0.2, warmup=3*day)
+        t = np.arange(4*day, 5*day+1, 900.)
+        pre = prediction(t)
+        np.testing.assert_allclose(pre['periodic'], onlineconditions.interp('periodic', t), atol=1e-9)
+        # the bias corrects the drift of one per period
+        self.assertAlmostEqual(prediction.bias['drift'], 1., places=3)
+        np.testing.assert_allclose(pre['drift'][:96], onlineconditions.interp('drift', t[:96]), atol=1e-3)
+
+    def test_rls(self):
+        prediction = mpcpy.RLSPrediction(onlineconditions, ['periodic'], periods=[day], warmup=day)
+        t = np.arange(2*day, 3*day+1, 900.)
+        np.testing.assert_allclose(prediction(t)['periodic'], onlineconditions.interp('periodic', t), atol=1e-3)
+
+        prediction = mpcpy.RLSPrediction(onlineconditions, ['regression'], periods=[], regressors=['regressor'],
+                                         warmup=day)
+        np.testing.assert_allclose(prediction(t)['regression'], onlineconditions.interp('regression', t), atol=1e-3)
+
+    def test_exponentialsmoothing(self):
+        prediction = mpcpy.ExponentialSmoothingPrediction(onlineconditions, ['linear'], alpha=0.5, beta=0.3,
+                                                          warmup=2*day)
+        t = np.arange(3*day, 3.5*day+1, 900.)
+        np.testing.assert_allclose(prediction(t)['linear'], onlineconditions.interp('linear', t), atol=1e-3)
+
+        prediction = mpcpy.ExponentialSmoothingPrediction(onlineconditions, ['periodic'], alpha=0.01, beta=0.,
+                                                          gamma=0.5, period=day, warmup=5*day)
+        t = np.arange(6*day, 6.5*day+1, 900.)
+        np.testing.assert_allclose(prediction(t)['periodic'], onlineconditions.interp('periodic', t), atol=0.1)
+
+
     
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import asyncio
+import time as _time
+import mpcpy
+import numpy as np
+
+
+# define variables
+time = np.arange(0.0, 2*24*3600.+1., 900.)
+bcs = {'time': time, 'T_am': 5.+2.*np.sin(2*np.pi*time/(24*3600.))}
+boundaryconditions = mpcpy.Disturbances(bcs)
+prediction = mpcpy.Prediction(boundaryconditions)
+
+
+class Stateestimation(mpcpy.Stateestimation):
+    def stateestimation(self, time):
+        return {'T_in': np.interp(time, self.emulator.res['time'], self.emulator.res['T_in'])}
+
+
+class Control(mpcpy.Control):
+    # a proportional controller which sleeps on selected steps
+    def solution(self, sta, pre):
+        if pre['time'][0] in self.parameters.get('slow', []):
+            _time.sleep(0.2)
+        Q = 1000.*(21.-sta['T_in'])*np.ones(len(pre['time']))
+        return {'time': pre['time'], 'Q': Q}
+
+
+def create_mpc(parameters=None, **kwargs):
+    measurements = mpcpy.Measurements(history=10)
+    control = Control(Stateestimation(measurements), prediction, parameters=parameters,
+                      horizon=6*3600., timestep=900.)
+    applied = []
+
+    async def acquire(time):
+        return {'T_in': 20.+time/3600.}
+
+    def apply(time, solution):
+        applied.append((time, solution))
+
+    mpc = mpcpy.RealtimeMPC(control, acquire=acquire, apply=apply, clock=mpcpy.SimulatedClock(),
+                            measurements=measurements, **kwargs)
+    return mpc, applied
+
+
+class TestSimulatedClock(unittest.TestCase):
+
+    def test_order(self):
+        clock = mpcpy.SimulatedClock()
+        events = []
+
+        async def task(name, seconds):
+            for i in range(3):
+                await clock.sleep(seconds)
+                events.append((clock.time(), name))
+
+        async def run():
+            tasks = [asyncio.ensure_future(task('a', 10.)), asyncio.ensure_future(task('b', 15.))]
+            await asyncio.sleep(0)
+            await clock.run_until(100.)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        self.assertEqual(events, [(10., 'a'), (15., 'b'), (20., 'a'), (30., 'b'), (30., 'a'), (45., 'b')])
+        self.assertEqual(clock.time(), 100.)
+
+
+class TestMeasurements(unittest.TestCase):
+
+    def test_missing_key(self):
+        measurements = mpcpy.Measurements(history=3)
+        measurements.append(0., {'a': 1., 'b': 2.})
+        measurements.append(1., {'a': 1.})
+        measurements.append(2., {'a': 1., 'b': 5.})
+        measurements.append(3., {'a': 1., 'c': 3.})
+
+        np.testing.assert_array_equal(measurements.res['time'], [1., 2., 3.])
+        np.testing.assert_array_equal(measurements.res['a'], [1., 1., 1.])
+        np.testing.assert_array_equal(measurements.res['b'], [np.nan, 5., np.nan])
+        np.testing.assert_array_equal(measurements.res['c'], [np.nan, np.nan, 3.])
+
+
+class TestRealtimeMPC(unittest.TestCase):
+
+    def test_run(self):
+        mpc, applied = create_mpc()
+        t0 = _time.time()
+        mpc(steps=96)
+
+        # a day of 15 minute steps runs quickly on the simulated clock
+        self.assertLess(_time.time()-t0, 5.)
+        self.assertEqual(len(applied), 96)
+        self.assertEqual(applied[4][0], 3600.)
+        self.assertEqual(applied[4][1]['time'][0], 3600.)
+        np.testing.assert_allclose(applied[4][1]['Q'], 0.)
+        self.assertEqual(mpc.clock.time(), 95*900.)
+        self.assertEqual(len(mpc.measurements.res['time']), 10)
+
+        summary = mpc.summary()
+        self.assertEqual(summary['steps'], 96)
+        self.assertEqual(summary['jitter']['max'], 0.)
+        self.assertEqual(summary['status'], {'solution': 96})
+
+    def test_deadline(self):
+        mpc, applied = create_mpc(parameters={'slow': [900.]}, deadline=0.05)
+        mpc(steps=4)
+
+        self.assertEqual(mpc.metrics['status'][:3], ['solution', 'timeout', 'skipped'])
+        self.assertLess(mpc.metrics['latency'][1], 0.15)
+        # the fallback is the last solution shifted to the new starttime
+        np.testing.assert_allclose(applied[1][1]['time'], mpc.control.time(900.))
+        np.testing.assert_allclose(applied[1][1]['Q'], applied[0][1]['Q'])
+
+    def test_acquisition_error(self):
+        mpc, applied = create_mpc()
+        calls = []
+
+        async def acquire(time):
+            calls.append(time)
+            if len(calls) == 2:
+                raise Exception('sensor offline')
+            return {'T_in': 20.+time/3600.}
+
+        mpc.acquire = acquire
+        mpc(steps=10)
+
+        # acquisition continues after a failure
+        self.assertEqual(len(calls), 10)
+        self.assertEqual(len(mpc.measurements.res['time']), 9)
+        self.assertEqual(mpc.metrics['acquisitionerrors'], [900.])
+        self.assertEqual(mpc.summary()['acquisitionerrors'], 1)
+
+    def test_acquisition_abort(self):
+        mpc, applied = create_mpc(maxacquisitionerrors=1)
+
+        async def acquire(time):
+            if time >= 1800.:
+                raise Exception('sensor offline')
+            return {'T_in': 20.+time/3600.}
+
+        mpc.acquire = acquire
+        self.assertRaises(Exception, mpc, 10)
+        self.assertEqual(mpc.metrics['acquisitionerrors'], [1800., 2700.])
+        self.assertLessEqual(len(applied), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import mpcpy
+import numpy as np
+
+
+# two groups of temperature forecasts which diverge after 4 hours
+rng = np.random.default_rng(0)
+time = np.arange(0., 24*3600.+1., 3600.)
+group = np.repeat([0, 1], 10)
+T_am = 5. + np.where(time[np.newaxis, :] >= 4*3600., 4.*group[:, np.newaxis]*(time-3*3600.)/(21*3600.), 0.)
+T_am = T_am + 0.01*rng.normal(size=T_am.shape)
+ensemble = {'time': time, 'T_am': T_am, 'Q_flow_so': 100.*np.ones_like(T_am)}
+
+
+class TestScenarioTree(unittest.TestCase):
+
+    def test_structure(self):
+        tree = mpcpy.ScenarioTree(ensemble, stages=[4], branching=[2], keys=['T_am'], seed=0)
+
+        self.assertEqual(tree.nodes, 3)
+        np.testing.assert_array_equal(tree.predecessor, [-1, 0, 0])
+        np.testing.assert_allclose(tree.probability, [1., 0.5, 0.5])
+        self.assertEqual(tree.elements, 4 + 2*21)
+        self.assertLess(tree.elements, T_am.size/8)
+
+        # the scenarios of each group share a leaf
+        leaves = tree.scenarioleaf
+        self.assertEqual(len(np.unique(leaves[group == 0])), 1)
+        self.assertNotEqual(leaves[0], leaves[-1])
+
+        # values are the mean of the scenarios in a node
+        leaf = leaves[-1]
+        np.testing.assert_allclose(tree.values['T_am'][tree.offset[leaf]:tree.offset[leaf+1]],
+                                   np.mean(T_am[group == 1, 4:], axis=0))
+        np.testing.assert_allclose(tree.root(tree.values['T_am']), np.mean(T_am[:, :4], axis=0))
+
+    def test_paths(self):
+        tree = mpcpy.ScenarioTree(ensemble, stages=[4, 12], branching=[2, 3], seed=0)
+        self.assertEqual(tree.expand(tree.values['T_am']).shape, (len(tree.leaves), len(time)))
+
+        # previous links the elements along each path
+        for path in tree.paths:
+            self.assertEqual(tree.previous[path[0]], -1)
+            np.testing.assert_array_equal(tree.previous[path[1:]], path[:-1])
+            np.testing.assert_array_equal(tree.elementtime[path], np.arange(len(time)))
+
+        # expanded values of a scenario leaf are close to the scenario
+        expanded = tree.expand(tree.values['T_am'])
+        index = np.searchsorted(tree.leaves, tree.scenarioleaf)
+        np.testing.assert_allclose(expanded[index], T_am, atol=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
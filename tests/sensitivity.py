@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+################################################################################
+#    Copyright 2015 Brecht Baeten
+#    This file is part of mpcpy.
+#
+#    mpcpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    mpcpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with mpcpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import mpcpy
+import numpy as np
+
+from .mpc import disturbances, create_emulator, create_emulator_mpc
+
+
+class Linear(object):
+    # a fake mpc returning a linear function of the parameters
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+    def __call__(self):
+        return {'y': 1.*self.parameters['a'] + 2.*self.parameters['b'] + 0.*self.parameters['c']}
+
+
+def linear_factory(disturbances, parameters):
+    return Linear(parameters)
+
+
+def linear_kpi(res):
+    return {'y': res['y']}
+
+
+def factory(disturbances, parameters):
+    return create_emulator_mpc(create_emulator(**parameters), disturbances)
+
+
+def kpi(res):
+    return {'energy': np.sum(res['Q_flow_hp'][:-1]*np.diff(res['time'])), 'T_in': np.mean(res['T_in'])}
+
+
+parameters = {'a': (0., 1.), 'b': (0., 1.), 'c': (0., 1.)}
+
+
+class TestSensitivity(unittest.TestCase):
+
+    def test_finitedifference(self):
+        sensitivity = mpcpy.Sensitivity(factory, disturbances, {'UA_in_am': (150., 250.), 'C_em': (5e6, 15e6)},
+                                        kpi, method='finitedifference', processes=2)
+        res = sensitivity()
+        self.assertEqual(sensitivity.runs, 5)
+
+        # compare with a manual central difference
+        values = [kpi(factory(disturbances, {'UA_in_am': value, 'C_em': 10e6})())['energy'] for value in [201., 199.]]
+        self.assertAlmostEqual(res['energy']['gradient'][0], (values[0]-values[1])/2.)
+        self.assertGreater(res['energy']['gradient'][0], 0.)
+        self.assertEqual(res['parameters'], ['UA_in_am', 'C_em'])
+
+    def test_morris(self):
+        res = mpcpy.Sensitivity(linear_factory, disturbances, parameters, linear_kpi, method='morris',
+                                samples=10, processes=2, seed=0)()
+        np.testing.assert_allclose(res['y']['mu'], [1., 2., 0.])
+        np.testing.assert_allclose(res['y']['mu_star'], [1., 2., 0.])
+        np.testing.assert_allclose(res['y']['sigma'], 0., atol=1e-12)
+
+    def test_sobol(self):
+        sensitivity = mpcpy.Sensitivity(linear_factory, disturbances, parameters, linear_kpi, method='sobol',
+                                        samples=4000, processes=2, seed=0)
+        res = sensitivity()
+        self.assertEqual(sensitivity.runs, 4000*5)
+        np.testing.assert_allclose(res['y']['first'], [0.2, 0.8, 0.], atol=0.05)
+        np.testing.assert_allclose(res['y']['total'], [0.2, 0.8, 0.], atol=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()